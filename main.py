@@ -19,36 +19,52 @@ Main Application Entry Point
 """
 
 import argparse
+import json
 import sys
 import signal
+import threading
 import time
 import logging
+from collections import deque
 from pathlib import Path
 from datetime import datetime, timedelta
 import yaml
 
 from src.sensors import SensorManager
+from src.backends import ReplayFinished
 from src.monitor import PowerMonitor
 from src.analyzer import PowerAnalyzer
 from src.fault_detector import FaultDetector
 from src.energy_tracker import EnergyTracker
 from src.alerts import AlertManager
 from src.database import Database
+from src.snapshot import StatusSnapshot
+from src.streaming import EventBroadcaster
+from src.metrics import MetricsRegistry, StageTimer
+from src.scheduler import TickScheduler
+from src.pipeline import FrameRing, Stage
+from src.frame import TickFrame
+from src.capture import WaveformRecorder, WaveformStore
+from src.reports import ReportGenerator, render
+from src.export import DataExporter
 from src.web_app import create_app
 
 __version__ = "1.0.0"
 __author__ = "GridGuard Team"
 
+# Console logging goes to stderr so report/export output on stdout stays machine-readable
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     handlers=[
         logging.FileHandler('logs/gridguard.log'),
-        logging.StreamHandler(sys.stdout)
+        logging.StreamHandler(sys.stderr)
     ]
 )
 logger = logging.getLogger(__name__)
 
+TICK_STAGES = ('read', 'analyze', 'detect', 'energy', 'save', 'alert', 'publish')
+
 
 class GridGuard:
     """Main GridGuard system controller"""
@@ -56,6 +72,7 @@ class GridGuard:
     def __init__(self, config_path='config/config.yaml'):
         """Initialize GridGuard system"""
         self.running = False
+        self._closed = False
         self.config = self.load_config(config_path)
         
         logger.info("="*60)
@@ -73,15 +90,56 @@ class GridGuard:
             self.database = Database(self.config['database'])
             
             # Initialize sensors
-            self.sensors = SensorManager(self.config['sensors'], self.config['adc'])
+            self.sensors = SensorManager(self.config['sensors'], self.config['adc'], self.config['system'])
             
             # Initialize monitoring components
             self.monitor = PowerMonitor(self.sensors, self.config)
             self.analyzer = PowerAnalyzer(self.config)
-            self.fault_detector = FaultDetector(self.config['fault_detection'])
-            self.energy_tracker = EnergyTracker(self.config['energy'])
+            self.fault_detector = FaultDetector(self.config['fault_detection'], self.database)
+            self.energy_tracker = EnergyTracker(self.config['energy'], self.database)
             self.alert_manager = AlertManager(self.config['alerts'])
             
+            # Latest published tick, served to API readers without touching sensors or the DB
+            self.snapshot = None
+            self.recent_faults = deque(self.database.get_recent_faults(limit=5), maxlen=5)
+            self.events = EventBroadcaster(self.config.get('web', {}))
+            
+            # Acquisition hands frames to the analysis thread through a preallocated ring;
+            # later stages get bounded queues. A replay must not lose frames, so it waits instead.
+            system_config = self.config['system']
+            queue_size = system_config.get('stage_queue_size', 16)
+            self.lossless = self.sensors.replay is not None
+            self.frames = FrameRing(system_config.get('frame_ring_size', 8), self.monitor.circuit_ids,
+                                    self.sensors.burst_samples)
+            # Ticks the ring has no room for are still read (keeping sensor timing) into a scratch frame
+            self.spare_frame = TickFrame(self.monitor.circuit_ids, self.sensors.burst_samples)
+            self.analysis_thread = None
+            
+            # Waveforms around fault onsets, frozen by the detect stage and written by their own stage
+            capture_config = self.config.get('capture', {})
+            self.waveform_store = None
+            self.waveform_recorder = None
+            if capture_config.get('enabled', True):
+                self.waveform_store = WaveformStore(
+                    capture_config.get('path', Path(self.config['database']['path']).parent / 'waveforms'),
+                    capture_config.get('max_mb', 100) * 1024 * 1024)
+                self.waveform_recorder = WaveformRecorder(capture_config,
+                                                          lambda capture: self.stages['capture'].offer(capture))
+            
+            # Runtime metrics served on /api/metrics
+            self.metrics = MetricsRegistry()
+            self._register_metrics()
+            
+            self.stages = {
+                'detect': Stage('detect', self._detect_stage, self.stage_latency['detect'], queue_size, self.lossless),
+                'persist': Stage('persist', self._persist_stage, self.stage_latency['save'], queue_size, self.lossless),
+                'alert': Stage('alert', self._alert_stage, self.stage_latency['alert'], queue_size, self.lossless),
+                'maintenance': Stage('maintenance', self._maintenance_stage, queue_size=4)
+            }
+            if self.waveform_store is not None:
+                self.stages['capture'] = Stage('capture', self.waveform_store.write,
+                                               queue_size=capture_config.get('queue_size', 8))
+            
             logger.info("System initialization complete")
             logger.info("Monitoring %d circuits", len(self.config['sensors']['current']))
             
@@ -89,7 +147,8 @@ class GridGuard:
             logger.error(f"Failed to initialize system: {e}")
             raise
     
-    def load_config(self, config_path):
+    @staticmethod
+    def load_config(config_path):
         """Load configuration from YAML"""
         try:
             with open(config_path, 'r') as f:
@@ -113,71 +172,281 @@ class GridGuard:
         self.running = True
         logger.info("Starting power monitoring...")
         
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
+        # Episodes live in the detector's memory, so rows a previous run left open can never resolve
+        closed = self.database.resolve_open_faults("closed at restart (monitor stopped while active)")
+        if closed:
+            logger.info(f"Closed {closed} faults left open by the previous run")
+            self.recent_faults = deque(self.database.get_recent_faults(limit=5), maxlen=5)
         
-        update_interval = self.config['system'].get('update_interval', 1)
+        # Signal handlers can only be installed from the main thread
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGINT, self.signal_handler)
+            signal.signal(signal.SIGTERM, self.signal_handler)
+        
+        # Ticks run on absolute monotonic deadlines; sub-second intervals are fine
+        system_config = self.config['system']
+        update_interval = system_config.get('update_interval', 1)
+        scheduler = TickScheduler(update_interval, system_config.get('overrun_policy', 'skip'))
+        scheduler.add_job('status_log', system_config.get('status_log_interval', 60), self._log_latest_status)
+        # Checkpoints write to SQLite, so they are handed to the maintenance stage rather than run here
+        maintenance = self.stages['maintenance']
+        scheduler.add_job('energy_checkpoint', self.config['energy'].get('checkpoint_interval', 60),
+                          lambda: maintenance.offer(self.energy_tracker.checkpoint))
+        scheduler.add_job('baseline_checkpoint',
+                          self.config['fault_detection'].get('baseline', {}).get('checkpoint_interval', 300),
+                          lambda: maintenance.offer(self.fault_detector.checkpoint))
+        timer = StageTimer(self.stage_latency)
+        
+        # This thread only acquires; the stages run downstream on their own threads
+        self._start_pipeline()
         
         try:
+            scheduler.start()
             while self.running:
-                loop_start = time.time()
-                
-                # Read all sensors
-                readings = self.monitor.read_all_circuits()
+                # Wait for this tick's deadline (a replay paces itself)
+                if self.sensors.replay is None:
+                    self.ticks_skipped.inc(scheduler.wait())
+                timer.start()
                 
-                # Analyze power quality
-                analysis = self.analyzer.analyze(readings)
+                # Read all sensors straight into the next free frame
+                frame = self.frames.claim(block=self.lossless)
+                try:
+                    self.monitor.read_frame(frame or self.spare_frame)
+                except ReplayFinished as e:
+                    logger.info(str(e))
+                    break
+                tick_time = self.sensors.acquisition_time()
+                timer.lap('read')
                 
-                # Detect faults
-                faults = self.fault_detector.check_faults(readings, analysis)
+                # Hand the frame to the analysis stage without waiting for it
+                if frame is not None:
+                    self.frames.commit(tick_time, timer.started)
+                self.ticks.inc()
+                if timer.elapsed() > update_interval:
+                    self.tick_overruns.inc()
                 
-                # Track energy
-                self.energy_tracker.update(readings)
+                # Periodic jobs run between ticks on their own cadence
+                scheduler.run_due_jobs()
+        
+        finally:
+            # Resources are released by the caller's cleanup(), once per process
+            self._stop_pipeline()
+    
+    def _start_pipeline(self):
+        """Start the analysis thread and the downstream stages"""
+        for stage in self.stages.values():
+            stage.start()
+        self.analysis_thread = threading.Thread(target=self._analysis_stage, name='stage-analyze', daemon=True)
+        self.analysis_thread.start()
+    
+    def _stop_pipeline(self):
+        """Drain every stage in dependency order"""
+        self.frames.close()
+        if self.analysis_thread is not None:
+            self.analysis_thread.join()
+        self.stages['detect'].stop()
+        if self.waveform_recorder is not None:
+            self.waveform_recorder.flush()
+        for name in ('persist', 'alert', 'capture', 'maintenance'):
+            if name in self.stages:
+                self.stages[name].stop()
+        self.energy_tracker.checkpoint()
+        self.fault_detector.checkpoint()
+    
+    def _analysis_stage(self):
+        """Consume frames: analyze, track energy and publish, then fan out"""
+        timer = StageTimer(self.stage_latency)
+        while True:
+            frame = self.frames.next_frame()
+            if frame is None:
+                break
+            
+            timer.start()
+            try:
+                self.analyzer.analyze_frame(frame)
+                timer.lap('analyze')
                 
-                # Save to database
-                for circuit_id, data in readings.items():
-                    self.database.save_reading(circuit_id, data, analysis.get(circuit_id, {}))
+                self.energy_tracker.update_frame(frame)
+                timer.lap('energy')
                 
-                # Handle faults
-                if faults:
-                    for fault in faults:
-                        logger.warning(f"⚠️  FAULT DETECTED: {fault['type']} on Circuit {fault['circuit_id']}")
-                        self.database.save_fault(fault)
-                        self.alert_manager.send_alert(fault)
+                self.publish_snapshot(frame.readings_view(), frame.analysis_view())
+                timer.lap('publish')
                 
-                # Log status periodically
-                if int(time.time()) % 60 == 0:  # Every minute
-                    self.log_status(readings)
+                self.tick_latency.observe(time.perf_counter() - frame.started)
                 
-                # Sleep to maintain update interval
-                elapsed = time.time() - loop_start
-                sleep_time = max(0, update_interval - elapsed)
-                time.sleep(sleep_time)
-        
+                # Later stages read the same frame; each holds a reference until it is done
+                for name in ('detect', 'persist'):
+                    self.frames.retain(frame)
+                    if not self.stages[name].offer(frame):
+                        self.frames.release(frame)
+            except Exception as e:
+                logger.error(f"Analysis failed for frame {frame.sequence}: {e}")
+            finally:
+                self.frames.release(frame)
+    
+    def _detect_stage(self, frame):
+        """Run fault detection and pass any events to the alert stage"""
+        try:
+            faults = self.fault_detector.check_frame(frame, frame.tick_time)
+            if self.waveform_recorder is not None:
+                self.waveform_recorder.record(frame, faults)
+        finally:
+            self.frames.release(frame)
+        if faults:
+            self.stages['alert'].offer(faults)
+    
+    def _persist_stage(self, frame):
+        """Queue a tick's readings for the batched writer"""
+        try:
+            self.database.save_frame(frame)
         finally:
-            self.cleanup()
+            self.frames.release(frame)
+    
+    def _maintenance_stage(self, job):
+        """Run a periodic job that would block acquisition (checkpoints under the database lock)"""
+        job()
+    
+    def _alert_stage(self, faults):
+        """Record, alert on and broadcast fault events"""
+        for fault in faults:
+            if fault['event'] == 'resolved':
+                self.handle_resolved_fault(fault)
+                continue
+            
+            logger.warning(f"⚠️  FAULT DETECTED: {fault['type']} on Circuit {fault['circuit_id']}")
+            fault['id'] = self.database.save_fault(fault)
+            self.alert_manager.send_alert(fault)
+            record = self._fault_record(fault)
+            self.recent_faults.appendleft(record)
+            self.events.publish('fault', json.dumps(record, default=str).encode('utf-8'))
+    
+    def _register_metrics(self):
+        """Create tick instrumentation and scrape-time gauges"""
+        metrics = self.metrics
+        self.stage_latency = {stage: metrics.histogram('tick_stage_seconds', 'Time spent in each stage of a tick',
+                                                       stage=stage)
+                              for stage in TICK_STAGES}
+        self.tick_latency = metrics.histogram('tick_seconds', 'Time from acquisition start to published snapshot')
+        self.ticks = metrics.counter('ticks_total', 'Ticks acquired')
+        self.tick_overruns = metrics.counter('tick_overruns_total', 'Acquisitions that took longer than update_interval')
+        self.ticks_skipped = metrics.counter('ticks_skipped_total', 'Tick slots skipped by the scheduler after overruns')
+        
+        writer_stats = self.database.get_writer_stats
+        metrics.gauge('db_queue_depth', 'Readings waiting for the database writer',
+                      lambda: writer_stats().get('queue_depth'))
+        metrics.gauge('db_rows_written_total', 'Readings committed', lambda: writer_stats().get('rows_written'),
+                      kind='counter')
+        metrics.gauge('db_rows_dropped_total', 'Readings dropped because the writer queue was full',
+                      lambda: writer_stats().get('rows_dropped'), kind='counter')
+        
+        alerts = self.alert_manager
+        metrics.gauge('alert_queue_depth', 'Alerts waiting for dispatch', alerts.queue.qsize)
+        metrics.gauge('alerts_dropped_total', 'Alerts dropped because the queue was full',
+                      lambda: alerts.alerts_dropped, kind='counter')
+        metrics.gauge('alerts_suppressed_total', 'Alerts suppressed by rate limiting',
+                      lambda: alerts.alerts_suppressed, kind='counter')
+        metrics.gauge('alerts_failed_total', 'Alerts whose email could not be delivered',
+                      lambda: alerts.alerts_failed, kind='counter')
+        
+        metrics.gauge('pipeline_queue_depth', 'Items waiting between pipeline stages',
+                      lambda: {(('stage', 'analyze'),): self.frames.depth,
+                               **{(('stage', name),): stage.queue.qsize() for name, stage in self.stages.items()}})
+        metrics.gauge('pipeline_dropped_total', 'Items dropped because a pipeline stage was full',
+                      lambda: {(('stage', 'analyze'),): self.frames.frames_dropped,
+                               **{(('stage', name),): stage.dropped for name, stage in self.stages.items()}},
+                      kind='counter')
+        
+        if self.waveform_store is not None:
+            metrics.gauge('waveform_store_bytes', 'Disk used by fault waveform captures',
+                          lambda: self.waveform_store.total_bytes)
+            metrics.gauge('waveform_captures_total', 'Fault waveform captures written',
+                          lambda: self.waveform_store.captures_written, kind='counter')
+        
+        metrics.gauge('stream_clients', 'Connected live update streams', lambda: self.events.client_count)
+        metrics.gauge('i2c_bus_latency_seconds', 'Acquisition time per I2C bus in the last tick',
+                      lambda: {(('bus', str(bus)),): latency for bus, latency in self.sensors.get_bus_latency().items()})
+    
+    def _log_latest_status(self):
+        """Periodic job: log the most recently published tick"""
+        snapshot = self.snapshot
+        if snapshot is not None:
+            self.log_status(snapshot.data['readings'])
     
     def log_status(self, readings):
         """Log current system status"""
         logger.info("-" * 60)
         for circuit_id, data in readings.items():
-            logger.info(f"Circuit {circuit_id}: {data['voltage']:.1f}V, {data['current']:.2f}A, {data['power']:.1f}W, PF={data['power_factor']:.2f}")
+            pf = 'n/a' if data['power_factor'] is None else f"{data['power_factor']:.2f}"
+            logger.info(f"Circuit {circuit_id}: {data['voltage']:.1f}V, {data['current']:.2f}A, {data['power']:.1f}W, PF={pf}")
+        for bus, latency in sorted(self.sensors.get_bus_latency().items()):
+            logger.info(f"I2C bus {bus}: {latency * 1000:.1f} ms acquisition")
         logger.info("-" * 60)
     
+    def handle_resolved_fault(self, fault):
+        """Close out a fault episode that has cleared"""
+        logger.info(f"Fault cleared: {fault['type']} on Circuit {fault['circuit_id']} "
+                    f"after {fault['duration']:.0f}s (peak {fault['peak_value']:.2f})")
+        # The onset was saved earlier on this stage, so its id is known even if the event predates it
+        fault_id = fault['fault_id'] if fault['fault_id'] is not None else fault['onset'].get('id')
+        if fault_id is None:
+            return
+        
+        self.database.resolve_fault(fault_id, fault['resolved_at'], fault['duration'], fault['peak_value'])
+        
+        resolution = {
+            'resolved': True,
+            'resolved_at': fault['resolved_at'],
+            'duration': fault['duration'],
+            'peak_value': fault['peak_value']
+        }
+        self.recent_faults = deque(
+            ({**record, **resolution} if record.get('id') == fault_id else record
+             for record in self.recent_faults),
+            maxlen=self.recent_faults.maxlen)
+        self.events.publish('fault_resolved', json.dumps(
+            {'id': fault_id, **resolution}, default=str).encode('utf-8'))
+    
+    def _fault_record(self, fault):
+        """Convert a detected fault into the shape of a faults table row"""
+        return {
+            'id': fault.get('id'),
+            'timestamp': fault['timestamp'],
+            'circuit_id': fault['circuit_id'],
+            'fault_type': fault['type'],
+            'severity': fault['severity'],
+            'description': fault['description'],
+            'value': fault.get('value'),
+            'waveform': fault.get('waveform'),
+            'resolved': False
+        }
+    
+    def publish_snapshot(self, readings, analysis):
+        """Publish an immutable snapshot of the latest tick"""
+        sequence = self.snapshot.sequence + 1 if self.snapshot else 1
+        self.snapshot = StatusSnapshot(sequence, {
+            'status': 'operational',
+            'timestamp': datetime.now().isoformat(),
+            'readings': readings,
+            'analysis': analysis,
+            'energy_today': self.energy_tracker.get_today_total(),
+            'recent_faults': list(self.recent_faults)
+        })
+        self.events.publish('status', self.snapshot.body, self.snapshot.sequence)
+        return self.snapshot
+    
+    def get_snapshot(self):
+        """Get the latest published snapshot (None before the first tick)"""
+        return self.snapshot
+    
     def get_status(self):
         """Get current system status"""
         try:
-            readings = self.monitor.read_all_circuits()
-            energy_today = self.energy_tracker.get_today_total()
-            recent_faults = self.database.get_recent_faults(limit=5)
-            
-            return {
-                'status': 'operational',
-                'timestamp': datetime.now().isoformat(),
-                'readings': readings,
-                'energy_today': energy_today,
-                'recent_faults': recent_faults
-            }
+            snapshot = self.snapshot
+            if snapshot is None:
+                # No monitor loop running (e.g. --status): take a single reading
+                readings = self.monitor.read_all_circuits()
+                snapshot = self.publish_snapshot(readings, self.analyzer.analyze(readings))
+            return dict(snapshot.data)
         except Exception as e:
             return {
                 'status': 'error',
@@ -191,16 +460,48 @@ class GridGuard:
         self.running = False
     
     def cleanup(self):
-        """Cleanup resources"""
+        """Cleanup resources (safe to call more than once)"""
+        if self._closed:
+            return
+        self._closed = True
         logger.info("Cleaning up resources...")
         try:
             self.sensors.cleanup()
+            self.alert_manager.close()
             self.database.close()
             logger.info("Cleanup complete")
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
 
 
+def run_data_command(args):
+    """Report or export from the database alone, without sensors, alerts or a second writer"""
+    config = GridGuard.load_config(args.config)
+    try:
+        database = Database(config['database'], read_only=True)
+    except Exception as e:
+        logger.error(f"Failed to open database: {e}")
+        sys.exit(1)
+    
+    try:
+        if args.export:
+            suffix = {'csv': 'csv', 'json': 'json', 'excel': 'xlsx'}[args.format]
+            output = args.output or f"exports/gridguard_{datetime.now():%Y%m%d_%H%M%S}.{suffix}"
+            paths = DataExporter(database).export(output, args.format, days=args.days, circuit_id=args.circuit)
+            for path in paths:
+                print(f"Exported {path}")
+        else:
+            report = ReportGenerator(database, config).build(days=args.days)
+            text = render(report, 'json' if args.format == 'json' else 'text', summary=args.stats)
+            if args.output:
+                Path(args.output).write_text(text + "\n")
+                logger.info(f"Report written to {args.output}")
+            else:
+                print(text)
+    finally:
+        database.close()
+
+
 def main():
     """Main entry point"""
     parser = argparse.ArgumentParser(
@@ -227,7 +528,7 @@ def main():
     parser.add_argument('--stats', action='store_true', help='Show statistics')
     parser.add_argument('--export', action='store_true', help='Export data')
     parser.add_argument('--format', choices=['csv', 'json', 'excel'], default='csv')
-    parser.add_argument('--output', help='Output file')
+    parser.add_argument('--output', help='Output file (a .gz suffix compresses CSV/JSON)')
     parser.add_argument('--report', action='store_true', help='Generate report')
     parser.add_argument('--days', type=int, default=7, help='Days of data')
     
@@ -240,6 +541,10 @@ def main():
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
     
+    if args.stats or args.report or args.export:
+        run_data_command(args)
+        return
+    
     # Initialize system
     try:
         gridguard = GridGuard(args.config)
@@ -269,13 +574,23 @@ def main():
                 print(f"  Voltage: {data['voltage']:.2f} V")
                 print(f"  Current: {data['current']:.3f} A")
                 print(f"  Power: {data['power']:.2f} W")
-                print(f"  Power Factor: {data['power_factor']:.3f}")
+                if data['power_factor'] is None:
+                    print("  Power Factor: n/a (no load)")
+                else:
+                    print(f"  Power Factor: {data['power_factor']:.3f}")
             print()
         
         elif args.web or args.api:
+            # The API serves snapshots published by the monitor loop
+            monitor_thread = threading.Thread(target=gridguard.monitor_loop, name='monitor', daemon=True)
+            monitor_thread.start()
+            
             app = create_app(gridguard)
             logger.info(f"Starting web server on port {args.port}")
-            app.run(host='0.0.0.0', port=args.port, debug=args.debug)
+            app.run(host='0.0.0.0', port=args.port, debug=args.debug, use_reloader=False)
+            
+            gridguard.stop()
+            monitor_thread.join()
         
         elif args.diagnostic:
             logger.info("Running system diagnostics...")
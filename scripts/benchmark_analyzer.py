@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Benchmark threshold classification scaling from 1 to 1000 circuits"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from src.analyzer import PowerAnalyzer
+
+
+def build_config(circuits):
+    """Minimal configuration with the given number of current channels"""
+    return {
+        'electrical': {'nominal_voltage': 120, 'nominal_frequency': 60},
+        'sensors': {
+            'current': [{'channel': i, 'sensitivity': 0.066, 'offset': 2.5} for i in range(circuits)],
+            'voltage': {'channel': 0}
+        },
+        'thresholds': {'current': {'max': 30}},
+        'power_quality': {'harmonics': False}
+    }
+
+
+def time_call(func, repeat):
+    """Median seconds per call"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return float(np.median(samples))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Threshold classification benchmark')
+    parser.add_argument('--repeat', type=int, default=200, help='Calls per measurement')
+    args = parser.parse_args()
+    
+    print("GridGuard-Pi5 threshold classification benchmark")
+    print("")
+    print(f"{'circuits':>9} {'classify (us)':>14} {'us/circuit':>11} {'analyze (us)':>13} {'us/circuit':>11}")
+    
+    rng = np.random.default_rng(0)
+    for circuits in (1, 10, 100, 1000):
+        analyzer = PowerAnalyzer(build_config(circuits))
+        voltage = rng.uniform(95, 145, circuits)
+        current = rng.uniform(0, 35, circuits)
+        power_factor = rng.uniform(0.5, 1.0, circuits)
+        frequency = rng.uniform(59, 61, circuits)
+        readings = {i + 1: {'voltage': voltage[i], 'current': current[i],
+                            'power_factor': power_factor[i], 'frequency': frequency[i]}
+                    for i in range(circuits)}
+        
+        # Array-in/array-out classification vs the full dict-view analyze()
+        classify = time_call(lambda: analyzer.bands.classify(voltage, current, power_factor, frequency),
+                             args.repeat) * 1e6
+        analyze = time_call(lambda: analyzer.analyze(readings), args.repeat) * 1e6
+        print(f"{circuits:>9} {classify:>14.1f} {classify / circuits:>11.3f} "
+              f"{analyze:>13.1f} {analyze / circuits:>11.3f}")
+
+
+if __name__ == '__main__':
+    main()
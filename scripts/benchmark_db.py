@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Benchmark reading inserts: per-row commits vs the batched writer"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from src.database import Database
+
+SAMPLE_READING = {
+    'voltage': 120.1,
+    'current': 8.4,
+    'power': 960.0,
+    'power_factor': 0.95,
+    'frequency': 60.0
+}
+
+
+def run(config, rows, circuits):
+    """Write rows through save_reading and return rows/sec until committed"""
+    db = Database(config)
+    start = time.perf_counter()
+    for i in range(rows):
+        db.save_reading(i % circuits + 1, SAMPLE_READING, {})
+    db.close()
+    elapsed = time.perf_counter() - start
+    return rows / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Database writer benchmark')
+    parser.add_argument('--rows', type=int, default=5000, help='Rows to insert')
+    parser.add_argument('--circuits', type=int, default=16, help='Circuits per tick')
+    parser.add_argument('--synchronous', default='NORMAL', help='SQLite synchronous mode')
+    args = parser.parse_args()
+
+    print("GridGuard-Pi5 database write benchmark")
+    print(f"  {args.rows} rows, {args.circuits} circuits, synchronous={args.synchronous}")
+    print("")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base = {'synchronous': args.synchronous}
+        direct = run({**base, 'path': f"{tmp}/direct.db", 'batch_writes': False}, args.rows, args.circuits)
+        batched = run({**base, 'path': f"{tmp}/batched.db", 'batch_writes': True}, args.rows, args.circuits)
+
+    print(f"Per-row commit: {direct:10.0f} rows/sec")
+    print(f"Batched writer: {batched:10.0f} rows/sec")
+    print(f"Speedup:        {batched / direct:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""End-to-end benchmark of the monitoring pipeline on the synthetic sensor backend"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import numpy as np
+
+from src.sensors import SensorManager
+from src.monitor import PowerMonitor
+from src.analyzer import PowerAnalyzer
+from src.fault_detector import FaultDetector
+from src.energy_tracker import EnergyTracker
+from src.database import Database
+from src.frame import TickFrame
+
+CHANNELS_PER_ADC = 4
+ADCS_PER_BUS = 4
+
+# Metrics compared against a baseline, and whether higher is better
+REGRESSION_METRICS = {
+    'p99_ms': False,
+    'max_sustainable_hz': True
+}
+
+
+def build_config(circuits, db_path):
+    """Configuration for the given number of circuits, spread over as many ADCs as needed"""
+    devices = [{'name': f"adc{i}", 'bus': 1 + i // ADCS_PER_BUS, 'address': 0x48 + i % ADCS_PER_BUS}
+               for i in range((circuits + 1 + CHANNELS_PER_ADC - 1) // CHANNELS_PER_ADC)]
+    inputs = [(f"adc{i // CHANNELS_PER_ADC}", i % CHANNELS_PER_ADC) for i in range(circuits + 1)]
+
+    return {
+        'system': {'sampling_rate': 860, 'burst_cycles': 4},
+        'electrical': {'nominal_voltage': 120, 'nominal_frequency': 60},
+        'sensors': {
+            'current': [{'device': device, 'channel': channel, 'sensitivity': 0.066, 'offset': 2.5}
+                        for device, channel in inputs[:circuits]],
+            'voltage': {'device': inputs[-1][0], 'channel': inputs[-1][1], 'frequency': 60,
+                        'divider_ratio': 100, 'offset': 2.5}
+        },
+        'adc': {'backend': 'synthetic', 'seed': 0, 'devices': devices},
+        'thresholds': {'voltage': {'min': 108, 'max': 132}, 'current': {'max': 30}},
+        'power_quality': {'harmonics': True, 'harmonic_interval': 10},
+        'fault_detection': {'enabled': True},
+        'energy': {'cost_per_kwh': 0.12},
+        'database': {'path': db_path, 'batch_writes': True}
+    }
+
+
+def run_case(circuits, rate, duration):
+    """Run the pipeline for one (circuits, tick rate) point; rate 0 runs flat out"""
+    logging.disable(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config = build_config(circuits, f"{tmp}/bench.db")
+        sensors = SensorManager(config['sensors'], config['adc'], config['system'])
+        monitor = PowerMonitor(sensors, config)
+        analyzer = PowerAnalyzer(config)
+        fault_detector = FaultDetector(config['fault_detection'])
+        energy_tracker = EnergyTracker(config['energy'])
+        database = Database(config['database'])
+        frame = TickFrame(monitor.circuit_ids, sensors.burst_samples)
+
+        latencies = []
+        overruns = 0
+        period = 1.0 / rate if rate else 0.0
+        start = time.perf_counter()
+        next_tick = start
+
+        while time.perf_counter() - start < duration:
+            if period:
+                remaining = next_tick - time.perf_counter()
+                if remaining > 0:
+                    time.sleep(remaining)
+
+            tick_start = time.perf_counter()
+            monitor.read_frame(frame)
+            frame.tick_time = sensors.acquisition_time()
+            analyzer.analyze_frame(frame)
+            fault_detector.check_frame(frame, frame.tick_time)
+            energy_tracker.update_frame(frame)
+            database.save_frame(frame)
+            latencies.append(time.perf_counter() - tick_start)
+
+            if period:
+                next_tick += period
+                if time.perf_counter() > next_tick:
+                    # Missed the next deadline: skip ahead rather than bunching ticks
+                    overruns += 1
+                    next_tick = time.perf_counter()
+
+        ticks_done = time.perf_counter()
+        database.flush()
+        elapsed = time.perf_counter() - start
+        stats = database.get_writer_stats()
+        database.close()
+        sensors.cleanup()
+
+    latencies = np.array(latencies) * 1000
+    achieved = len(latencies) / (ticks_done - start)
+    sustained = stats['rows_dropped'] == 0 and (not rate or overruns <= 0.01 * len(latencies))
+
+    return {
+        'circuits': circuits,
+        'target_hz': rate,
+        'ticks': len(latencies),
+        'achieved_hz': round(achieved, 2),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'max_ms': round(float(latencies.max()), 3),
+        'overruns': overruns,
+        'db_rows_per_sec': round(stats['rows_written'] / elapsed, 1),
+        'db_rows_dropped': stats['rows_dropped'],
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'sustained': sustained
+    }
+
+
+def run_isolated(pool_context, circuits, rate, duration):
+    """Run one case in a fresh process so its memory high-water mark is its own"""
+    with pool_context.Pool(1) as pool:
+        return pool.apply(run_case, (circuits, rate, duration))
+
+
+def git_commit():
+    """Current commit hash, if run from a checkout"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of the summary metrics beyond the tolerance, as messages"""
+    previous = {row['circuits']: row for row in baseline['summary']}
+    regressions = []
+    for row in results['summary']:
+        before = previous.get(row['circuits'])
+        if before is None:
+            continue
+        for metric, higher_is_better in REGRESSION_METRICS.items():
+            old, new = before[metric], row[metric]
+            if not old:
+                continue
+            change = (new - old) / old
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append(f"{row['circuits']} circuits: {metric} {old} -> {new} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end monitoring pipeline benchmark')
+    parser.add_argument('--circuits', type=int, nargs='+', default=[1, 8, 64, 512], help='Circuit counts to sweep')
+    parser.add_argument('--rates', type=float, nargs='+', default=[1, 10, 50], help='Tick rates (Hz) to sweep')
+    parser.add_argument('--duration', type=float, default=5, help='Seconds per case')
+    parser.add_argument('--output', help='Write JSON results to this file instead of stdout')
+    parser.add_argument('--baseline', help='Earlier JSON results to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative regression')
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context('spawn')
+    cases = []
+    summary = []
+    for circuits in args.circuits:
+        for rate in args.rates:
+            case = run_isolated(context, circuits, rate, args.duration)
+            cases.append(case)
+            print(f"{circuits:>4} circuits @ {rate:>5g} Hz: p50 {case['p50_ms']:8.2f} ms  p99 {case['p99_ms']:8.2f} ms  "
+                  f"{case['db_rows_per_sec']:9.0f} rows/s  {case['peak_rss_mb']:6.1f} MB  "
+                  f"{'ok' if case['sustained'] else 'NOT SUSTAINED'}", file=sys.stderr)
+
+        # Unthrottled run: the highest tick rate the pipeline sustains at this size
+        saturated = run_isolated(context, circuits, 0, args.duration)
+        cases.append(saturated)
+        summary.append({
+            'circuits': circuits,
+            'p50_ms': saturated['p50_ms'],
+            'p99_ms': saturated['p99_ms'],
+            'max_sustainable_hz': saturated['achieved_hz'] if saturated['sustained'] else 0.0,
+            'peak_rss_mb': max(c['peak_rss_mb'] for c in cases if c['circuits'] == circuits)
+        })
+        print(f"{circuits:>4} circuits max sustainable: {summary[-1]['max_sustainable_hz']:.1f} Hz", file=sys.stderr)
+
+    results = {
+        'benchmark': 'pipeline',
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'duration_s': args.duration,
+        'cases': cases,
+        'summary': summary
+    }
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2) + "\n")
+    else:
+        print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,54 +4,222 @@
 """Alert management system"""
 
 import logging
+import queue
 import smtplib
+import threading
+import time
+from collections import deque
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 logger = logging.getLogger(__name__)
 
 
+class SMTPSender:
+    """Keeps one SMTP session open and reuses it across messages"""
+    
+    def __init__(self, email_config):
+        self.config = email_config
+        self.timeout = email_config.get('timeout', 10)
+        self._smtp = None
+    
+    def send(self, msg):
+        """Send a message, reconnecting once if the session went stale"""
+        for attempt in range(2):
+            try:
+                self._connect().send_message(msg)
+                return
+            except (smtplib.SMTPServerDisconnected, smtplib.SMTPSenderRefused, OSError):
+                self.close()
+                if attempt == 1:
+                    raise
+    
+    def _connect(self):
+        """Open the session on first use"""
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.config['smtp_server'], self.config.get('smtp_port', 587),
+                                timeout=self.timeout)
+            if self.config.get('use_tls', True):
+                smtp.starttls()
+            if self.config.get('username') and self.config.get('password'):
+                smtp.login(self.config['username'], self.config['password'])
+            self._smtp = smtp
+        return self._smtp
+    
+    def close(self):
+        """Close the session"""
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._smtp = None
+
+
 class AlertManager:
     """Manages alerts and notifications"""
     
+    _STOP = object()
+    
     def __init__(self, config):
         self.config = config
         self.enabled = config.get('enabled', True)
+        
+        # Per-(circuit, fault type) rate limiting
+        self.rate_limit = config.get('rate_limit_s', 300)
+        self._last_alert = {}
+        
+        # Fault storms are batched into digests
+        self.digest_window = config.get('digest_window_s', 30)
+        self.digest_threshold = config.get('digest_threshold', 5)
+        self._recent_sends = deque()
+        self._recent_lock = threading.Lock()
+        
+        self.alerts_queued = 0
+        self.alerts_suppressed = 0
+        self.alerts_dropped = 0
+        # Delivery counters are updated by every worker thread
+        self._stats_lock = threading.Lock()
+        self.emails_sent = 0
+        self.digests_sent = 0
+        self.alerts_failed = 0
+        
+        self.queue = queue.Queue(maxsize=config.get('queue_size', 1000))
+        self.workers = []
+        if self.enabled:
+            for i in range(config.get('workers', 1)):
+                worker = threading.Thread(target=self._worker, name=f"alert-worker-{i}", daemon=True)
+                worker.start()
+                self.workers.append(worker)
     
     def send_alert(self, fault):
-        """Send alert for detected fault"""
+        """Queue an alert for asynchronous dispatch"""
         if not self.enabled:
             return
         
+        # Repeats of the same fault on the same circuit are deduplicated
+        key = (fault['circuit_id'], fault['type'])
+        now = time.monotonic()
+        last = self._last_alert.get(key)
+        if last is not None and now - last < self.rate_limit:
+            self.alerts_suppressed += 1
+            return
+        self._last_alert[key] = now
+        
         logger.warning(f"ALERT: {fault['type']} on circuit {fault['circuit_id']}")
         
+        try:
+            self.queue.put_nowait(fault)
+            self.alerts_queued += 1
+        except queue.Full:
+            self.alerts_dropped += 1
+            logger.error("Alert queue full - alert dropped")
+    
+    def close(self, timeout=10):
+        """Dispatch queued alerts and stop the workers"""
+        for _ in self.workers:
+            self.queue.put(self._STOP)
+        for worker in self.workers:
+            worker.join(timeout)
+        self.workers = []
+    
+    def _worker(self):
+        """Worker thread: dispatch alerts, batching storms into digests"""
+        sender = SMTPSender(self.config['email']) if self.config.get('email', {}).get('enabled') else None
+        
+        try:
+            while True:
+                fault = self.queue.get()
+                if fault is self._STOP:
+                    break
+                
+                batch = [fault]
+                stopping = self._collect_storm(batch)
+                
+                if len(batch) >= self.digest_threshold:
+                    self._dispatch_digest(batch, sender)
+                else:
+                    for fault in batch:
+                        self._dispatch(fault, sender)
+                
+                if stopping:
+                    break
+        finally:
+            if sender:
+                sender.close()
+    
+    def _collect_storm(self, batch):
+        """While alerts are arriving fast, gather them for a digest; returns True on stop"""
+        storm = self._note_alert()
+        deadline = time.monotonic() + (self.digest_window if storm else 0)
+        
+        while True:
+            try:
+                fault = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                return False
+            if fault is self._STOP:
+                return True
+            batch.append(fault)
+            
+            # Every alert counts toward the rate, so a backlog drained at once can start a storm too
+            if self._note_alert() and not storm:
+                storm = True
+                deadline = time.monotonic() + self.digest_window
+    
+    def _note_alert(self):
+        """Record an outgoing alert; True when the recent rate indicates a storm"""
+        now = time.monotonic()
+        with self._recent_lock:
+            self._recent_sends.append(now)
+            while self._recent_sends and now - self._recent_sends[0] > self.digest_window:
+                self._recent_sends.popleft()
+            return len(self._recent_sends) > self.digest_threshold
+    
+    def _dispatch(self, fault, sender):
+        """Deliver a single alert on every enabled channel"""
         # Local alerts
         if self.config.get('local', {}).get('buzzer'):
             self._trigger_buzzer()
         
         # Email alerts
-        if self.config.get('email', {}).get('enabled'):
-            self._send_email(fault)
+        if sender:
+            self._send_email(fault, sender)
         
         # SMS alerts
         if self.config.get('sms', {}).get('enabled'):
             self._send_sms(fault)
     
+    def _dispatch_digest(self, faults, sender):
+        """Deliver a batch of alerts as one digest"""
+        if self.config.get('local', {}).get('buzzer'):
+            self._trigger_buzzer()
+        
+        if sender:
+            self._send_digest(faults, sender)
+        
+        if self.config.get('sms', {}).get('enabled'):
+            self._send_sms(faults[0])
+    
     def _trigger_buzzer(self):
         """Trigger local buzzer"""
         logger.debug("Buzzer triggered")
         # GPIO buzzer control would go here
     
-    def _send_email(self, fault):
+    def _build_message(self, subject, body):
+        """Build an email message"""
+        email_config = self.config['email']
+        
+        msg = MIMEMultipart()
+        msg['From'] = email_config.get('from', email_config.get('username', 'gridguard@localhost'))
+        msg['To'] = ', '.join(email_config.get('recipients', []))
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'plain'))
+        return msg
+    
+    def _send_email(self, fault, sender):
         """Send email alert"""
         try:
-            email_config = self.config['email']
-            
-            msg = MIMEMultipart()
-            msg['From'] = email_config['username']
-            msg['To'] = ', '.join(email_config.get('recipients', []))
-            msg['Subject'] = f"GridGuard Alert: {fault['type']}"
-            
             body = f"""
             GridGuard-Pi5 Alert
             
@@ -62,12 +230,38 @@ class AlertManager:
             Timestamp: {fault['timestamp']}
             """
             
-            msg.attach(MIMEText(body, 'plain'))
-            
+            sender.send(self._build_message(f"GridGuard Alert: {fault['type']}", body))
+            with self._stats_lock:
+                self.emails_sent += 1
             logger.info("Email alert sent")
         except Exception as e:
+            with self._stats_lock:
+                self.alerts_failed += 1
             logger.error(f"Failed to send email: {e}")
     
+    def _send_digest(self, faults, sender):
+        """Send one email summarizing a fault storm"""
+        try:
+            # Collapse repeats of the same (circuit, fault type)
+            counts = {}
+            for fault in faults:
+                key = (fault['circuit_id'], fault['type'])
+                first, count = counts.get(key, (fault, 0))
+                counts[key] = (first, count + 1)
+            
+            lines = [f"  Circuit {cid} - {ftype} x{count}: {first['description']} (first at {first['timestamp']})"
+                     for (cid, ftype), (first, count) in counts.items()]
+            body = "GridGuard-Pi5 Alert Digest\n\n" + f"{len(faults)} alerts:\n" + "\n".join(lines) + "\n"
+            
+            sender.send(self._build_message(f"GridGuard Alert Digest: {len(faults)} alerts", body))
+            with self._stats_lock:
+                self.digests_sent += 1
+            logger.info(f"Digest email sent ({len(faults)} alerts)")
+        except Exception as e:
+            with self._stats_lock:
+                self.alerts_failed += len(faults)
+            logger.error(f"Failed to send digest email: {e}")
+    
     def _send_sms(self, fault):
         """Send SMS alert"""
         logger.debug("SMS alert (not implemented)")
@@ -4,9 +4,173 @@
 """Power quality analyzer"""
 
 import logging
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Status names indexed by the codes produced by ThresholdBands
+VOLTAGE_STATUS = ('critical_low', 'low', 'normal', 'high', 'critical_high')
+FREQUENCY_STATUS = VOLTAGE_STATUS
+CURRENT_STATUS = ('normal', 'warning', 'critical')
+POWER_FACTOR_STATUS = ('critical', 'low', 'good', 'unknown')
+THD_STATUS = ('normal', 'warning', 'critical', 'unknown')
+
+# Status code arrays produced by ThresholdBands.classify and the names they index
+STATUS_NAMES = {
+    'voltage_status': VOLTAGE_STATUS,
+    'current_status': CURRENT_STATUS,
+    'power_factor_status': POWER_FACTOR_STATUS,
+    'frequency_status': FREQUENCY_STATUS,
+    'voltage_thd_status': THD_STATUS,
+    'current_thd_status': THD_STATUS
+}
+
+# Per-circuit current bands derived from a circuit's max_current rating
+CURRENT_WARNING_RATIO = 0.80
+CURRENT_CRITICAL_RATIO = 0.93
+
+
+class HarmonicAnalyzer:
+    """Batched FFT harmonic analysis over (circuits x samples) waveform matrices"""
+    
+    MAX_PLANS = 16
+    
+    def __init__(self, max_harmonic=25):
+        self.max_harmonic = max_harmonic
+        self._plans = {}
+    
+    def _plan(self, n, sample_rate, frequency):
+        """Get the cached window and bin indices for a window length and rate"""
+        key = (n, round(sample_rate, 1), round(frequency, 2))
+        plan = self._plans.get(key)
+        if plan is not None:
+            return plan
+        
+        window = np.hanning(n)
+        s1 = window.sum()
+        enbw = n * np.square(window).sum() / s1 ** 2
+        
+        # Each harmonic is measured over its nearest bin and both neighbours to absorb leakage
+        harmonics = np.arange(1, self.max_harmonic + 1)
+        centers = np.rint(harmonics * frequency * n / sample_rate).astype(int)
+        n_bins = n // 2 + 1
+        valid = (harmonics * frequency < sample_rate / 2) & (centers + 1 < n_bins)
+        bins = np.clip(centers[:, None] + np.array([-1, 0, 1]), 0, n_bins - 1)
+        
+        # Scale summed bin power back to RMS amplitude
+        scale = np.sqrt(2.0 / enbw) / s1
+        
+        if len(self._plans) >= self.MAX_PLANS:
+            self._plans.clear()
+        plan = self._plans[key] = (window, bins, valid, scale)
+        return plan
+    
+    def analyze(self, voltage, current, sample_rate, frequency):
+        """Compute per-harmonic RMS magnitudes and THD for every voltage and current row at once"""
+        rows, n = voltage.shape
+        window, bins, valid, scale = self._plan(n, sample_rate, frequency)
+        
+        # One rfft over voltage and current rows together, DC removed
+        stacked = np.concatenate([voltage, current])
+        stacked = (stacked - stacked.mean(axis=1, keepdims=True)) * window
+        power = np.square(np.abs(np.fft.rfft(stacked, axis=1)))
+        magnitudes = np.sqrt(power[:, bins].sum(axis=2)) * scale
+        magnitudes[:, ~valid] = np.nan
+        
+        fundamental = magnitudes[:, 0]
+        distortion = np.sqrt(np.nansum(np.square(magnitudes[:, 1:]), axis=1))
+        thd = np.divide(distortion, fundamental, out=np.full(len(fundamental), np.nan),
+                        where=fundamental > 0) * 100
+        if not valid[0]:
+            thd[:] = np.nan
+        
+        magnitudes = magnitudes.astype(np.float32)
+        return thd[:rows], thd[rows:], magnitudes[:rows], magnitudes[rows:]
+
+
+class ThresholdBands:
+    """Threshold bands compiled once into per-circuit NumPy arrays"""
+    
+    def __init__(self, thresholds, circuit_configs, nominal_frequency):
+        rows = [self._circuit_thresholds(thresholds, c, nominal_frequency) for c in circuit_configs]
+        columns = lambda name: np.array([row[name] for row in rows], dtype=np.float64).reshape(len(rows), -1)
+        
+        # Lower edges use >= and upper edges use >, matching the inclusive normal band
+        self.voltage_lower = columns('voltage_lower')
+        self.voltage_upper = columns('voltage_upper')
+        self.frequency_lower = columns('frequency_lower')
+        self.frequency_upper = columns('frequency_upper')
+        self.current_upper = columns('current_upper')
+        self.power_factor_lower = columns('power_factor_lower')
+        self.voltage_thd_upper = columns('voltage_thd_upper')
+        self.current_thd_upper = columns('current_thd_upper')
+        self.current_max = columns('current_max')[:, 0]
+        self.circuits = len(rows)
+    
+    @staticmethod
+    def _circuit_thresholds(thresholds, circuit_config, nominal_frequency):
+        """Merge global thresholds with a circuit's overrides into band edges"""
+        overrides = circuit_config.get('thresholds', {})
+        merged = lambda name: {**thresholds.get(name, {}), **overrides.get(name, {})}
+        
+        v = merged('voltage')
+        f = merged('frequency')
+        pf = merged('power_factor')
+        thd = {kind: {**thresholds.get('thd', {}).get(kind, {}), **overrides.get('thd', {}).get(kind, {})}
+               for kind in ('voltage', 'current')}
+        
+        # A circuit rating without explicit current thresholds scales the standard bands
+        c = merged('current')
+        rating = circuit_config.get('max_current')
+        if rating and 'current' not in overrides:
+            c = {'max': rating, 'warning': rating * CURRENT_WARNING_RATIO, 'critical': rating * CURRENT_CRITICAL_RATIO}
+        
+        return {
+            'voltage_lower': [v.get('critical_min', 100), v.get('min', 108)],
+            'voltage_upper': [v.get('max', 132), v.get('critical_max', 140)],
+            'frequency_lower': [f.get('critical_min', nominal_frequency - 1.0), f.get('min', nominal_frequency - 0.5)],
+            'frequency_upper': [f.get('max', nominal_frequency + 0.5), f.get('critical_max', nominal_frequency + 1.0)],
+            'current_upper': [c.get('warning', 24), c.get('critical', 28)],
+            'current_max': [c.get('max', 30)],
+            'power_factor_lower': [pf.get('critical', 0.70), pf.get('min', 0.85)],
+            'voltage_thd_upper': [thd['voltage'].get('warning', 5.0), thd['voltage'].get('critical', 8.0)],
+            'current_thd_upper': [thd['current'].get('warning', 15.0), thd['current'].get('critical', 20.0)]
+        }
+    
+    @staticmethod
+    def _band(values, lower=None, upper=None):
+        """Band index of each circuit's value against its own edges"""
+        values = values[:, None]
+        codes = np.zeros(len(values), dtype=np.int8)
+        if lower is not None:
+            codes += (values >= lower).sum(axis=1, dtype=np.int8)
+        if upper is not None:
+            codes += (values > upper).sum(axis=1, dtype=np.int8)
+        return codes
+    
+    def classify(self, voltage, current, power_factor, frequency, voltage_thd=None, current_thd=None):
+        """Classify every circuit at once; returns status-code arrays indexing the *_STATUS tuples"""
+        codes = {
+            'voltage_status': self._band(voltage, self.voltage_lower, self.voltage_upper),
+            'current_status': self._band(current, upper=self.current_upper),
+            'power_factor_status': self._band(power_factor, lower=self.power_factor_lower),
+            'frequency_status': self._band(frequency, self.frequency_lower, self.frequency_upper),
+            'load_percentage': current / self.current_max * 100
+        }
+        # Idle circuits have no meaningful power factor (NaN) and are left unclassified
+        codes['power_factor_status'][np.isnan(power_factor)] = POWER_FACTOR_STATUS.index('unknown')
+        
+        for name, values, upper in (('voltage_thd_status', voltage_thd, self.voltage_thd_upper),
+                                    ('current_thd_status', current_thd, self.current_thd_upper)):
+            if values is None:
+                codes[name] = np.full(self.circuits, THD_STATUS.index('unknown'), dtype=np.int8)
+            else:
+                status = self._band(values, upper=upper)
+                status[np.isnan(values)] = THD_STATUS.index('unknown')
+                codes[name] = status
+        
+        return codes
+
 
 class PowerAnalyzer:
     """Analyzes power quality metrics"""
@@ -14,54 +178,93 @@ class PowerAnalyzer:
     def __init__(self, config):
         self.config = config
         self.thresholds = config.get('thresholds', {})
+        self.nominal_frequency = config.get('electrical', {}).get('nominal_frequency', 60.0)
+        self.bands = ThresholdBands(self.thresholds, config['sensors']['current'], self.nominal_frequency)
+        
+        # Harmonic analysis runs every Nth tick and is reused in between
+        pq_config = config.get('power_quality', {})
+        self.harmonics_enabled = pq_config.get('harmonics', True)
+        self.harmonic_interval = int(pq_config.get('harmonic_interval', 10))
+        if self.harmonics_enabled and self.harmonic_interval <= 0:
+            logger.warning(f"harmonic_interval {self.harmonic_interval} is not positive - harmonic analysis disabled")
+            self.harmonics_enabled = False
+        self.harmonic_analyzer = HarmonicAnalyzer(pq_config.get('max_harmonic', 25))
+        self.harmonics = None
+        self.codes = None
+        self._tick = 0
     
-    def analyze(self, readings):
+    def analyze(self, readings, waveforms=None):
         """Analyze all readings"""
-        analysis = {}
+        values = {key: np.fromiter((np.nan if data[key] is None else data[key] for data in readings.values()),
+                                   np.float64, len(readings))
+                  for key in ('voltage', 'current', 'power_factor', 'frequency')}
+        thd = self._update_harmonics(waveforms, len(readings))
+        voltage_thd, current_thd = thd if thd else (None, None)
+        
+        self.codes = self.bands.classify(values['voltage'], values['current'], values['power_factor'],
+                                         values['frequency'], voltage_thd, current_thd)
+        return self.status_view(readings.keys(), self.codes, voltage_thd, current_thd)
+    
+    def analyze_frame(self, frame):
+        """Classify a TickFrame in place, writing status codes and THD into its arrays"""
+        values = frame.values
+        thd = self._update_harmonics(frame.waveforms(), len(frame.circuit_list))
+        voltage_thd, current_thd = thd if thd else (None, None)
         
-        for circuit_id, data in readings.items():
+        self.codes = self.bands.classify(values['voltage'], values['current'], values['power_factor'],
+                                         values['frequency'], voltage_thd, current_thd)
+        for name, codes in frame.status.items():
+            np.copyto(codes, self.codes[name])
+        np.copyto(frame.load_percentage, self.codes['load_percentage'])
+        frame.voltage_thd[:] = np.nan if voltage_thd is None else voltage_thd
+        frame.current_thd[:] = np.nan if current_thd is None else current_thd
+        return frame
+    
+    def status_view(self, circuit_ids, codes, voltage_thd=None, current_thd=None):
+        """Expand status-code arrays into the per-circuit dict used by the API and fault detector"""
+        analysis = {}
+        for i, circuit_id in enumerate(circuit_ids):
             analysis[circuit_id] = {
-                'voltage_status': self._check_voltage(data['voltage']),
-                'current_status': self._check_current(data['current']),
-                'power_factor_status': self._check_power_factor(data['power_factor']),
-                'load_percentage': (data['current'] / self.thresholds['current']['max']) * 100
+                'voltage_status': VOLTAGE_STATUS[codes['voltage_status'][i]],
+                'current_status': CURRENT_STATUS[codes['current_status'][i]],
+                'power_factor_status': POWER_FACTOR_STATUS[codes['power_factor_status'][i]],
+                'frequency_status': FREQUENCY_STATUS[codes['frequency_status'][i]],
+                'load_percentage': float(codes['load_percentage'][i]),
+                'voltage_thd': self._optional(voltage_thd, i),
+                'current_thd': self._optional(current_thd, i),
+                'voltage_thd_status': THD_STATUS[codes['voltage_thd_status'][i]],
+                'current_thd_status': THD_STATUS[codes['current_thd_status'][i]]
             }
         
         return analysis
     
-    def _check_voltage(self, voltage):
-        """Check voltage status"""
-        v_thresholds = self.thresholds.get('voltage', {})
-        
-        if voltage < v_thresholds.get('critical_min', 100):
-            return 'critical_low'
-        elif voltage > v_thresholds.get('critical_max', 140):
-            return 'critical_high'
-        elif voltage < v_thresholds.get('min', 108):
-            return 'low'
-        elif voltage > v_thresholds.get('max', 132):
-            return 'high'
-        else:
-            return 'normal'
+    @staticmethod
+    def _optional(values, i):
+        """JSON-safe scalar from an array that may be missing or NaN"""
+        if values is None or np.isnan(values[i]):
+            return None
+        return float(values[i])
     
-    def _check_current(self, current):
-        """Check current status"""
-        c_thresholds = self.thresholds.get('current', {})
-        
-        if current > c_thresholds.get('critical', 28):
-            return 'critical'
-        elif current > c_thresholds.get('warning', 24):
-            return 'warning'
-        else:
-            return 'normal'
-    
-    def _check_power_factor(self, pf):
-        """Check power factor"""
-        pf_thresholds = self.thresholds.get('power_factor', {})
-        
-        if pf < pf_thresholds.get('critical', 0.70):
-            return 'critical'
-        elif pf < pf_thresholds.get('min', 0.85):
-            return 'low'
-        else:
-            return 'good'
+    def _update_harmonics(self, waveforms, circuits):
+        """Refresh harmonic results on decimated ticks; returns (voltage_thd, current_thd) arrays"""
+        if not self.harmonics_enabled or waveforms is None:
+            return None
+        
+        if self._tick % self.harmonic_interval == 0 or self.harmonics is None:
+            # Voltage THD comes from the raw voltage burst: the per-circuit copies are interpolated
+            # onto each current burst's time base, which attenuates the higher harmonics
+            raw_voltage = waveforms.get('raw_voltage')
+            voltage = waveforms['voltage'] if raw_voltage is None else raw_voltage[None, :]
+            voltage_thd, current_thd, voltage_h, current_h = self.harmonic_analyzer.analyze(
+                voltage, waveforms['current'], waveforms['sample_rate'], waveforms['frequency'])
+            self.harmonics = {
+                'voltage_thd': np.resize(voltage_thd, len(current_thd)),
+                'current_thd': current_thd,
+                'voltage': voltage_h,
+                'current': current_h
+            }
+        self._tick += 1
+        
+        if len(self.harmonics['current_thd']) != circuits:
+            return None
+        return self.harmonics['voltage_thd'], self.harmonics['current_thd']
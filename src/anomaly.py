@@ -0,0 +1,168 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Per-circuit statistical baselines for anomaly detection"""
+
+import logging
+import math
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASELINE_METRICS = ('voltage', 'current', 'power')
+VOLTAGE, CURRENT, POWER = range(len(BASELINE_METRICS))
+ANOMALY_STATUS = ('normal', 'elevated', 'anomalous')
+
+# Standard deviations never go below this fraction of the mean, so flat signals don't make z-scores explode
+MIN_STD_RATIO = 0.005
+
+
+def _codes(score, onset, clear_ratio):
+    """ANOMALY_STATUS codes for a score against its onset threshold; 'elevated' is the hysteresis band"""
+    return (score >= onset * clear_ratio).astype(np.int8) + (score >= onset)
+
+
+class BaselineModel:
+    """EWMA mean and variance per circuit and metric, plus slower trend and reference means for drift"""
+    
+    def __init__(self, config, detection_config):
+        self.config = config
+        self.tau = config.get('time_constant_s', 300)
+        self.trend_tau = config.get('trend_time_constant_s', 6 * 3600)
+        self.reference_tau = config.get('reference_time_constant_s', 7 * 86400)
+        self.warmup = config.get('warmup_samples', 60)
+        self.clear_ratio = config.get('clear_ratio', 0.5)
+        self.stale_after = timedelta(seconds=config.get('stale_after_s', 7 * 86400))
+        
+        self.spike_z = detection_config.get('current_spike', {}).get('z', 6.0)
+        self.step_z = detection_config.get('load_step', {}).get('z', 4.0)
+        self.step_watts = detection_config.get('load_step', {}).get('min_watts', 100.0)
+        self.sag = detection_config.get('voltage_sag', {}).get('percent', 10.0) / 100
+        self.swell = detection_config.get('voltage_swell', {}).get('percent', 10.0) / 100
+        self.drift = detection_config.get('drift', {}).get('percent', 25.0) / 100
+        self.min_current = config.get('min_current', 0.5)
+        
+        # (metrics x circuits) state for the circuits bound on the first tick
+        self.circuits = []
+        self.count = np.zeros(0)
+        self.mean = np.zeros((len(BASELINE_METRICS), 0))
+        self.var = np.zeros((len(BASELINE_METRICS), 0))
+        self.trend = np.zeros((len(BASELINE_METRICS), 0))
+        self.reference = np.zeros((len(BASELINE_METRICS), 0))
+        self.last_time = None
+        self.saved = {}  # circuit_id -> restored state not yet bound
+        self._lock = threading.Lock()
+    
+    def _bind(self, circuit_ids):
+        """Size the state for a circuit list, keeping whatever is known per circuit (caller holds the lock)"""
+        self.saved.update(self._state())
+        self.circuits = list(circuit_ids)
+        circuits = len(self.circuits)
+        self.count = np.zeros(circuits)
+        self.mean = np.zeros((len(BASELINE_METRICS), circuits))
+        self.var = np.zeros((len(BASELINE_METRICS), circuits))
+        self.trend = np.zeros((len(BASELINE_METRICS), circuits))
+        self.reference = np.zeros((len(BASELINE_METRICS), circuits))
+        
+        for i, circuit_id in enumerate(self.circuits):
+            state = self.saved.pop(circuit_id, None)
+            if state is None:
+                continue
+            self.count[i] = min(s[0] for s in state.values())
+            for m, name in enumerate(BASELINE_METRICS):
+                if name in state:
+                    _, self.mean[m, i], self.var[m, i], self.trend[m, i], self.reference[m, i] = state[name]
+    
+    def update(self, circuit_ids, values, now):
+        """Classify a tick against the baselines, then fold it in; returns {anomaly type: (codes, values)}"""
+        with self._lock:
+            if circuit_ids != self.circuits:
+                self._bind(circuit_ids)
+            
+            x = np.vstack([values[name] for name in BASELINE_METRICS])
+            mean, var, trend, reference = self.mean, self.var, self.trend, self.reference
+            
+            deviation = x - mean
+            std = np.maximum(np.sqrt(var), MIN_STD_RATIO * np.abs(mean) + 1e-9)
+            z = deviation / std
+            ready = self.count >= self.warmup
+            loaded = ready & (np.maximum(x[CURRENT], mean[CURRENT]) >= self.min_current)
+            
+            relative_voltage = np.divide(deviation[VOLTAGE], mean[VOLTAGE],
+                                         out=np.zeros_like(mean[VOLTAGE]), where=mean[VOLTAGE] > 0)
+            drift = np.divide(np.abs(trend[CURRENT] - reference[CURRENT]), reference[CURRENT],
+                              out=np.zeros_like(mean[CURRENT]), where=reference[CURRENT] >= self.min_current)
+            step = np.where(np.abs(deviation[POWER]) >= self.step_watts, np.abs(z[POWER]), 0.0)
+            
+            anomalies = {
+                'current_spike': (_codes(np.where(loaded, z[CURRENT], 0.0), self.spike_z, self.clear_ratio),
+                                  x[CURRENT]),
+                'load_step': (_codes(np.where(ready, step, 0.0), self.step_z, self.clear_ratio), x[POWER]),
+                'voltage_sag': (_codes(np.where(ready, -relative_voltage, 0.0), self.sag, self.clear_ratio),
+                                x[VOLTAGE]),
+                'voltage_swell': (_codes(np.where(ready, relative_voltage, 0.0), self.swell, self.clear_ratio),
+                                  x[VOLTAGE]),
+                'drift': (_codes(np.where(ready, drift, 0.0), self.drift, self.clear_ratio), trend[CURRENT].copy())
+            }
+            
+            self._fold(x, std, ready, now)
+            return anomalies
+    
+    def _fold(self, x, std, ready, now):
+        """Exponentially weighted update, clipping warm baselines against outliers (caller holds the lock)"""
+        seconds = (now - self.last_time).total_seconds() if self.last_time else 0.0
+        self.last_time = now
+        # A gap longer than the time constant counts as one, so a pause can't wipe the variance
+        seconds = min(max(seconds, 0.0), self.tau)
+        
+        # While a circuit has fewer readings than a time constant spans, the 1/n weight makes
+        # each estimate the exact running (Welford) mean and variance
+        self.count += 1
+        alpha, trend_alpha, reference_alpha = (np.maximum(1 - math.exp(-seconds / tau), 1 / self.count)
+                                               for tau in (self.tau, self.trend_tau, self.reference_tau))
+        
+        # A spike moves a warm baseline by at most spike_z deviations, so one outlier can't swamp it
+        limit = self.spike_z * std
+        x = np.where(ready, np.clip(x, self.mean - limit, self.mean + limit), x)
+        
+        difference = x - self.mean
+        increment = alpha * difference
+        self.mean += increment
+        self.var = (1 - alpha) * (self.var + difference * increment)
+        self.trend += trend_alpha * (x - self.trend)
+        self.reference += reference_alpha * (x - self.reference)
+    
+    def _state(self):
+        """{circuit_id: {metric: (samples, mean, variance, trend, reference)}} (caller holds the lock)"""
+        state = {}
+        for i, circuit_id in enumerate(self.circuits):
+            state[circuit_id] = {name: (int(self.count[i]), float(self.mean[m, i]), float(self.var[m, i]),
+                                        float(self.trend[m, i]), float(self.reference[m, i]))
+                                 for m, name in enumerate(BASELINE_METRICS)}
+        return state
+    
+    def rows(self):
+        """Checkpoint rows (circuit_id, metric, samples, mean, variance, trend, reference)"""
+        with self._lock:
+            state = {**self.saved, **self._state()}
+        return [(circuit_id, name, *values) for circuit_id, metrics in state.items()
+                for name, values in metrics.items() if values[0] > 0]
+    
+    def restore(self, rows):
+        """Load checkpoint rows, skipping any older than stale_after"""
+        cutoff = datetime.now() - self.stale_after
+        restored = 0
+        with self._lock:
+            for row in rows:
+                if row['updated_at'] is not None and datetime.fromisoformat(row['updated_at']) < cutoff:
+                    continue
+                self.saved.setdefault(row['circuit_id'], {})[row['metric']] = (
+                    row['samples'], row['mean'], row['variance'], row['trend'], row['reference'])
+                restored += 1
+            if self.circuits:
+                self._bind(self.circuits)
+        
+        if restored:
+            logger.info(f"Restored {restored} anomaly baselines")
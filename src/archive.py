@@ -0,0 +1,344 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Columnar long-term archive of closed days of readings"""
+
+import json
+import logging
+import shutil
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+import numpy as np
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_COLUMNS = ('voltage', 'current', 'power', 'power_factor', 'frequency')
+
+# Measurements are stored as float32 (about 7 significant digits, above ADC resolution)
+VALUE_DTYPE = np.float32
+SIGNIFICANT_DIGITS = 7
+
+
+def _day_bounds(day):
+    """Storage timestamps of the start of a day and of the next day"""
+    return f"{day.isoformat()} 00:00:00.000", f"{(day + timedelta(days=1)).isoformat()} 00:00:00.000"
+
+
+def display_values(values):
+    """float64 copies of archived values rounded to the precision they were stored with"""
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.floor(np.log10(np.abs(values), out=np.zeros_like(values), where=values != 0))
+    scale = 10.0 ** (SIGNIFICANT_DIGITS - 1 - magnitude)
+    return np.round(values * scale) / scale
+
+
+def format_timestamps(timestamps):
+    """Storage-format strings for datetime64[ms] values"""
+    return np.char.replace(np.datetime_as_string(timestamps, unit='ms'), 'T', ' ')
+
+
+class ReadingArchive:
+    """One directory per day holding memory-mappable .npy column files, sorted by circuit then time"""
+    
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._days = None
+    
+    def day_path(self, day):
+        return self.root / f"{day:%Y}" / day.isoformat()
+    
+    def days(self):
+        """Archived days, oldest first"""
+        if self._days is None:
+            self._days = sorted(date.fromisoformat(path.parent.name)
+                                for path in self.root.glob('*/*/index.json'))
+        return self._days
+    
+    def days_between(self, start, end):
+        """Archived days that overlap [start, end)"""
+        return [day for day in self.days() if start.date() <= day and datetime.combine(day, datetime.min.time()) < end]
+    
+    def manifest(self, day):
+        """The day's index: row count, per-circuit offsets and the newest archived row id"""
+        path = self.day_path(day) / 'index.json'
+        if not path.exists():
+            return None
+        return json.loads(path.read_text())
+    
+    def read_day(self, day, circuit_id=None):
+        """Memory-mapped columns for a day (optionally one circuit), or None if not archived"""
+        manifest = self.manifest(day)
+        if manifest is None:
+            return None
+        
+        path = self.day_path(day)
+        if circuit_id is None:
+            start, stop = 0, manifest['rows']
+        else:
+            start, stop = manifest['circuits'].get(str(circuit_id), (0, 0))
+        
+        data = {'timestamp': np.load(path / 'timestamp.npy', mmap_mode='r')[start:stop]}
+        for name in ARCHIVE_COLUMNS:
+            data[name] = np.load(path / f"{name}.npy", mmap_mode='r')[start:stop]
+        
+        if circuit_id is None:
+            ids = np.empty(manifest['rows'], dtype=np.int32)
+            for circuit, (first, last) in manifest['circuits'].items():
+                ids[first:last] = int(circuit)
+            data['circuit_id'] = ids
+        else:
+            data['circuit_id'] = np.full(stop - start, circuit_id, dtype=np.int32)
+        return data
+    
+    def read_range(self, circuit_id, start, end):
+        """Yield per-day column dicts for one circuit, clipped to [start, end)"""
+        low = np.datetime64(start, 'ms')
+        high = np.datetime64(end, 'ms')
+        for day in self.days_between(start, end):
+            data = self.read_day(day, circuit_id)
+            first, last = np.searchsorted(data['timestamp'], [low, high])
+            if last > first:
+                yield {name: values[first:last] for name, values in data.items()}
+    
+    def try_lock(self):
+        """Open and exclusively lock the archive's lock file; None if another process holds it"""
+        handle = open(self.root / '.lock', 'w')
+        if HAS_FCNTL:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                handle.close()
+                return None
+        return handle
+    
+    def remove_day(self, day):
+        shutil.rmtree(self.day_path(day), ignore_errors=True)
+        self._days = None
+    
+    def size_bytes(self):
+        return sum(path.stat().st_size for path in self.root.glob('*/*/*.npy'))
+
+
+class DayBuilder:
+    """A day's staging directory, filled a circuit at a time and swapped in by commit()"""
+    
+    def __init__(self, archive, day, counts, max_id):
+        self.archive = archive
+        self.day = day
+        self.max_id = max_id
+        self.counts = counts  # circuit_id -> rows it will hold (archived plus new)
+        self.circuits = {}
+        self.offset = 0
+        
+        # Column files are preallocated and written through memory maps, so no day is ever held in memory
+        self.final = archive.day_path(day)
+        self.staging = self.final.with_name(self.final.name + '.tmp')
+        shutil.rmtree(self.staging, ignore_errors=True)
+        self.staging.mkdir(parents=True)
+        rows = sum(counts.values())
+        self.timestamps = np.lib.format.open_memmap(self.staging / 'timestamp.npy', mode='w+',
+                                                    dtype='datetime64[ms]', shape=(rows,))
+        self.columns = {name: np.lib.format.open_memmap(self.staging / f"{name}.npy", mode='w+',
+                                                        dtype=VALUE_DTYPE, shape=(rows,))
+                        for name in ARCHIVE_COLUMNS}
+    
+    def add(self, circuit_id, timestamps, columns):
+        """Write one circuit's rows, sorted by time, after the circuits already added"""
+        if len(timestamps) != self.counts[circuit_id]:
+            raise ValueError(f"Circuit {circuit_id} has {len(timestamps)} rows for {self.day}, "
+                             f"expected {self.counts[circuit_id]}")
+        order = np.argsort(timestamps, kind='stable')
+        start, stop = self.offset, self.offset + len(order)
+        self.timestamps[start:stop] = timestamps[order]
+        for name in ARCHIVE_COLUMNS:
+            self.columns[name][start:stop] = columns[name][order]
+        self.circuits[str(circuit_id)] = [start, stop]
+        self.offset = stop
+    
+    def commit(self):
+        """Finish the column files and swap the staged day in, so readers never see a partial day"""
+        for values in (self.timestamps, *self.columns.values()):
+            values.flush()
+        self.timestamps = self.columns = None
+        (self.staging / 'index.json').write_text(json.dumps({
+            'day': self.day.isoformat(),
+            'rows': int(self.offset),
+            'max_id': int(self.max_id),
+            'circuits': self.circuits
+        }))
+        
+        final = self.final
+        if final.exists():
+            retired = final.with_name(final.name + '.old')
+            shutil.rmtree(retired, ignore_errors=True)
+            final.rename(retired)
+            self.staging.rename(final)
+            shutil.rmtree(retired)
+        else:
+            self.staging.rename(final)
+        self.archive._days = None
+        return self.offset
+    
+    def abort(self):
+        """Drop the staging directory, leaving the archived day as it was"""
+        self.timestamps = self.columns = None
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+
+class ArchivePolicy:
+    """Moves closed days from the readings table into the archive, a step at a time"""
+    
+    def __init__(self, archive, config, keep_days=None):
+        self.archive = archive
+        self.after_days = config.get('after_days', 1)
+        if self.after_days < 1:
+            # 0 would archive (and delete from the table) the day still being written
+            raise ValueError(f"archive.after_days must be at least 1, got {self.after_days}")
+        self.keep_days = keep_days
+        self.batch_size = config.get('batch_size', 5000)
+        self.chunk_size = config.get('chunk_size', 50000)
+        self.interval = config.get('interval_s', 600)
+        self.next_run = 0.0
+        self.building = None  # (DayBuilder, circuits still to copy, newest archived id before this pass)
+        self.pending = None  # (day, max id) whose archived raw rows are still being deleted
+        self.rows_archived = 0
+        self._lock = None
+    
+    def step(self, conn):
+        """Copy one circuit of a day, or delete one batch of archived rows; returns raw rows deleted"""
+        # Another process archiving the same day would share the staging directory and merge against
+        # a manifest about to change, so the lock is held from a day's first step to its last delete
+        if self._lock is None:
+            self._lock = self.archive.try_lock()
+            if self._lock is None:
+                logger.debug("Archive locked by another process - skipping step")
+                return 0
+        try:
+            return self._step(conn)
+        except Exception:
+            self.reset()
+            raise
+        finally:
+            if self.building is None and self.pending is None and self._lock is not None:
+                self._lock.close()
+                self._lock = None
+    
+    def reset(self):
+        """Abandon the day in progress; its raw rows stay in the table until the next pass"""
+        if self.building is not None:
+            self.building[0].abort()
+        self.building = None
+        self.pending = None
+    
+    def _step(self, conn):
+        """One archive step under the archive lock"""
+        if self.building is not None:
+            self._copy_circuit(conn)
+            return 0
+        if self.pending is not None:
+            return self._delete_batch(conn)
+        if time.monotonic() < self.next_run:
+            return 0
+        
+        oldest = conn.execute("SELECT MIN(timestamp) FROM readings").fetchone()[0]
+        cutoff = date.today() - timedelta(days=self.after_days - 1)
+        if oldest is not None and date.fromisoformat(oldest[:10]) < cutoff:
+            self._start_day(conn, date.fromisoformat(oldest[:10]))
+            return 0
+        
+        self._expire()
+        self.next_run = time.monotonic() + self.interval
+        return 0
+    
+    def _start_day(self, conn, day):
+        """Plan a day's archive pass: row counts per circuit for what is archived plus what is new"""
+        start, end = _day_bounds(day)
+        manifest = self.archive.manifest(day)
+        after_id = manifest['max_id'] if manifest else 0
+        
+        max_id = conn.execute("SELECT MAX(id) FROM readings WHERE timestamp >= ? AND timestamp < ? AND id > ?",
+                              (start, end, after_id)).fetchone()[0]
+        if max_id is None:
+            # Nothing new: only raw rows already in the archive are left to delete
+            self.pending = (day, after_id)
+            return
+        
+        counts = {circuit: stop - first for circuit, (first, stop) in (manifest or {}).get('circuits', {}).items()}
+        counts = {int(circuit): count for circuit, count in counts.items()}
+        for circuit_id, count in conn.execute("""
+            SELECT circuit_id, COUNT(*) FROM readings
+            WHERE timestamp >= ? AND timestamp < ? AND id > ? AND id <= ?
+            GROUP BY circuit_id
+        """, (start, end, after_id, max_id)):
+            counts[circuit_id] = counts.get(circuit_id, 0) + count
+        
+        builder = DayBuilder(self.archive, day, counts, max_id)
+        self.building = (builder, sorted(counts), after_id)
+    
+    def _copy_circuit(self, conn):
+        """Merge one circuit's new raw rows with its archived ones into the staged day"""
+        builder, circuits, after_id = self.building
+        circuit_id = circuits.pop(0)
+        start, end = _day_bounds(builder.day)
+        
+        existing = self.archive.read_day(builder.day, circuit_id)
+        timestamps = [] if existing is None else [np.array(existing['timestamp'])]
+        columns = {name: [] if existing is None else [np.array(existing[name])] for name in ARCHIVE_COLUMNS}
+        
+        cursor = conn.execute(f"""
+            SELECT timestamp, {', '.join(ARCHIVE_COLUMNS)}
+            FROM readings
+            WHERE circuit_id = ? AND timestamp >= ? AND timestamp < ? AND id > ? AND id <= ?
+        """, (circuit_id, start, end, after_id, builder.max_id))
+        added = 0
+        while True:
+            rows = cursor.fetchmany(self.chunk_size)
+            if not rows:
+                break
+            fields = list(zip(*rows))
+            timestamps.append(np.array(fields[0], dtype='datetime64[ms]'))
+            for name, values in zip(ARCHIVE_COLUMNS, fields[1:]):
+                columns[name].append(np.array(values, dtype=np.float64).astype(VALUE_DTYPE))
+            added += len(rows)
+        
+        builder.add(circuit_id, np.concatenate(timestamps) if timestamps else np.array([], dtype='datetime64[ms]'),
+                    {name: np.concatenate(parts) if parts else np.array([], dtype=VALUE_DTYPE)
+                     for name, parts in columns.items()})
+        self.rows_archived += added
+        
+        if not circuits:
+            total = builder.commit()
+            logger.info(f"Archived {builder.day}: {total} readings")
+            self.building = None
+            self.pending = (builder.day, builder.max_id)
+    
+    def _delete_batch(self, conn):
+        """Delete one batch of raw rows that are safely in the archive"""
+        day, max_id = self.pending
+        start, end = _day_bounds(day)
+        with conn:
+            cursor = conn.execute("""
+                DELETE FROM readings WHERE id IN (
+                    SELECT id FROM readings WHERE timestamp >= ? AND timestamp < ? AND id <= ? LIMIT ?
+                )
+            """, (start, end, max_id, self.batch_size))
+        if cursor.rowcount < self.batch_size:
+            self.pending = None
+        return cursor.rowcount
+    
+    def _expire(self):
+        """Drop archived days older than the raw retention period"""
+        if not self.keep_days:
+            return
+        cutoff = date.today() - timedelta(days=self.keep_days)
+        for day in [day for day in self.archive.days() if day < cutoff]:
+            self.archive.remove_day(day)
+            logger.info(f"Removed archived readings for {day}")
@@ -0,0 +1,205 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Sensor acquisition backends: hardware, synthetic, record and replay"""
+
+import json
+import logging
+import time
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+try:
+    import board
+    import busio
+    import adafruit_ads1x15.ads1115 as ADS
+    from adafruit_ads1x15.ads1x15 import Mode
+    from adafruit_ads1x15.analog_in import AnalogIn
+    HAS_ADC = True
+except ImportError:
+    HAS_ADC = False
+    logger.warning("ADS1115 library not available - using simulation mode")
+
+try:
+    from adafruit_extended_bus import ExtendedI2C
+    HAS_EXTENDED_BUS = True
+except ImportError:
+    HAS_EXTENDED_BUS = False
+
+BACKENDS = ('auto', 'hardware', 'synthetic', 'replay')
+
+
+class ReplayFinished(Exception):
+    """Raised when a replayed recording has no more frames"""
+
+
+class HardwareBus:
+    """One I2C bus carrying one or more ADS1115 devices"""
+    
+    def __init__(self, bus_number, devices, adc_config, continuous):
+        if bus_number == 1:
+            i2c = busio.I2C(board.SCL, board.SDA)
+        elif HAS_EXTENDED_BUS:
+            i2c = ExtendedI2C(bus_number)
+        else:
+            raise RuntimeError(f"I2C bus {bus_number} requires adafruit-extended-bus")
+        
+        self.bus_number = bus_number
+        self.read_latency = 0
+        self.ads = {}
+        for device in devices:
+            ads = ADS.ADS1115(i2c, address=device['address'])
+            ads.gain = adc_config.get('gain', 1)
+            ads.data_rate = adc_config.get('data_rate', 860)
+            if continuous:
+                ads.mode = Mode.CONTINUOUS
+            self.ads[device['name']] = ads
+            logger.info(f"ADS1115 '{device['name']}' initialized on bus {bus_number} at 0x{device['address']:02x}")
+        self._channels = {}
+    
+    def start_burst(self, key):
+        """Nothing to prepare: the multiplexer switches on the first read"""
+    
+    def read(self, key):
+        """Read one conversion (ADC volts) for a (device, channel) key"""
+        chan = self._channels.get(key)
+        if chan is None:
+            chan = self._channels[key] = AnalogIn(self.ads[key[0]], key[1])
+        return chan.voltage
+
+
+class SyntheticBus:
+    """Synthetic stand-in for an I2C bus, with optional per-read latency"""
+    
+    def __init__(self, bus_number, models, line_frequency, rng, read_latency=0.0):
+        self.bus_number = bus_number
+        self.models = models
+        self.omega = 2 * np.pi * line_frequency
+        self.rng = rng
+        self.read_latency = read_latency
+        self.clock = 0.0
+        self._rms = {}
+    
+    def start_burst(self, key):
+        """Draw a new operating point for a channel"""
+        self._rms[key] = self.rng.uniform(*self.models[key]['rms_range'])
+    
+    def burst_timestamps(self, samples, sampling_rate):
+        """Sample instants for an instantaneous burst on a virtual clock, so seeded runs repeat exactly"""
+        timestamps = self.clock + np.arange(samples) / sampling_rate
+        self.clock += samples / sampling_rate
+        return timestamps
+    
+    def synthesize(self, key, timestamps):
+        """Raw ADC volts for a channel at the given instants"""
+        model = self.models[key]
+        signal = np.sqrt(2) * self._rms[key] * np.sin(self.omega * timestamps - model['phase'])
+        return signal * model['gain'] + model['offset']
+    
+    def read(self, key):
+        """Read one synthetic conversion, taking the configured bus latency"""
+        if self.read_latency:
+            time.sleep(self.read_latency)
+        return float(self.synthesize(key, time.perf_counter()))
+
+
+class AcquisitionRecorder:
+    """Writes every acquisition frame to disk-backed arrays for later replay"""
+    
+    def __init__(self, path, keys, samples, sampling_rate, max_frames=3600):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.keys = list(keys)
+        self.max_frames = max_frames
+        self.frames = 0
+        
+        shape = (max_frames, len(self.keys), samples)
+        # Sparse preallocation: untouched frames cost no disk space and read back as zero
+        self.timestamps = np.lib.format.open_memmap(self.path / 'timestamps.npy', mode='w+',
+                                                    dtype=np.float64, shape=shape)
+        self.raw = np.lib.format.open_memmap(self.path / 'raw.npy', mode='w+', dtype=np.float32, shape=shape)
+        self.wall_time = np.lib.format.open_memmap(self.path / 'wall_time.npy', mode='w+',
+                                                   dtype=np.float64, shape=(max_frames,))
+        
+        meta = {'keys': self.keys, 'samples': samples, 'sampling_rate': sampling_rate}
+        (self.path / 'meta.json').write_text(json.dumps(meta))
+        logger.info(f"Recording acquisitions to {self.path} (up to {max_frames} frames)")
+    
+    def write(self, wall_time, bursts):
+        """Append one frame of {key: (timestamps, raw)} bursts"""
+        if self.frames >= self.max_frames:
+            if self.frames == self.max_frames:
+                logger.warning(f"Recording {self.path} is full - no further frames will be written")
+                self.frames += 1
+            return
+        
+        for i, key in enumerate(self.keys):
+            timestamps, raw = bursts[key]
+            n = len(raw)
+            self.timestamps[self.frames, i, :n] = timestamps
+            self.raw[self.frames, i, :n] = raw
+        # Written last: a nonzero wall time marks the frame complete
+        self.wall_time[self.frames] = wall_time
+        self.frames += 1
+    
+    def close(self):
+        """Flush recorded frames to disk"""
+        for array in (self.timestamps, self.raw, self.wall_time):
+            array.flush()
+        logger.info(f"Recorded {min(self.frames, self.max_frames)} frames to {self.path}")
+
+
+class ReplaySource:
+    """Feeds recorded frames back in order, paced at a multiple of real time"""
+    
+    def __init__(self, path, speed=1.0, loop=False):
+        self.path = Path(path)
+        meta = json.loads((self.path / 'meta.json').read_text())
+        self.keys = [tuple(key) for key in meta['keys']]
+        self.index = {key: i for i, key in enumerate(self.keys)}
+        self.samples = meta['samples']
+        self.sampling_rate = meta['sampling_rate']
+        
+        self.timestamps = np.load(self.path / 'timestamps.npy', mmap_mode='r')
+        self.raw = np.load(self.path / 'raw.npy', mmap_mode='r')
+        wall_time = np.load(self.path / 'wall_time.npy')
+        empty = np.flatnonzero(wall_time == 0)
+        self.frames = int(empty[0]) if len(empty) else len(wall_time)
+        self.wall_time = wall_time[:self.frames]
+        if self.frames == 0:
+            raise ValueError(f"Recording {self.path} contains no frames")
+        
+        # speed 1.0 replays at recorded pace, 0 as fast as possible
+        self.speed = speed
+        self.loop = loop
+        self.position = 0
+        self._start = None
+        logger.info(f"Replaying {self.frames} frames from {self.path} at "
+                    f"{'max' if not speed else f'{speed:g}x'} speed")
+    
+    def next_frame(self, keys):
+        """Return (wall_time, {key: (timestamps, raw)}) for the next recorded frame"""
+        if self.position >= self.frames:
+            if not self.loop:
+                raise ReplayFinished(f"Replay of {self.path} finished after {self.frames} frames")
+            self.position = 0
+            self._start = None
+        
+        frame = self.position
+        self.position += 1
+        
+        if self.speed:
+            now = time.monotonic()
+            if self._start is None:
+                self._start = now
+            delay = self._start + (self.wall_time[frame] - self.wall_time[0]) / self.speed - now
+            if delay > 0:
+                time.sleep(delay)
+        
+        bursts = {}
+        for key in keys:
+            i = self.index[key]
+            bursts[key] = (np.array(self.timestamps[frame, i]), self.raw[frame, i].astype(np.float64))
+        return float(self.wall_time[frame]), bursts
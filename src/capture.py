@@ -0,0 +1,240 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Pre/post-trigger waveform capture around fault events"""
+
+import logging
+import math
+import os
+import threading
+from pathlib import Path
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Fault types that freeze a capture by default; drift is too slow for a waveform to show anything
+CAPTURE_TRIGGERS = ('overload', 'voltage_fault', 'current_spike', 'load_step', 'voltage_sag', 'voltage_swell')
+
+
+class WaveformCapture:
+    """One event's windows: the pre-trigger ring contents followed by post-trigger windows as they arrive"""
+    
+    __slots__ = ('name', 'circuit_id', 'fault_type', 'index', 'sample_rate', 'frequency', 'trigger',
+                 'times', 'voltage', 'current', 'remaining')
+    
+    def __init__(self, name, event, index, sample_rate, frequency, post_windows):
+        self.name = name
+        self.circuit_id = event['circuit_id']
+        self.fault_type = event['type']
+        self.index = index
+        self.sample_rate = sample_rate
+        self.frequency = frequency
+        self.trigger = 0
+        self.times = []
+        self.voltage = []
+        self.current = []
+        self.remaining = post_windows
+    
+    def add(self, tick_time, voltage, current):
+        self.times.append(tick_time)
+        self.voltage.append(voltage)
+        self.current.append(current)
+
+
+class WaveformRecorder:
+    """Rolling pre-trigger ring of every circuit's waveform windows; freezes captures around fault onsets"""
+    
+    def __init__(self, config, on_complete):
+        self.on_complete = on_complete
+        self.pre_cycles = config.get('pre_cycles', 10)
+        self.post_cycles = config.get('post_cycles', 10)
+        self.max_active = config.get('max_active', 8)
+        self.triggers = set(config.get('triggers', CAPTURE_TRIGGERS))
+        
+        # Allocated on the first frame with waveforms, once the window shape is known
+        self.windows = 0
+        self.post_windows = 0
+        self.voltage = None
+        self.current = None
+        self.times = []
+        self.filled = 0
+        self.position = 0
+        
+        self.active = []
+        self.captures_started = 0
+        self.captures_dropped = 0
+    
+    def _allocate(self, frame):
+        """Size the ring so it holds pre_cycles of mains cycles (caller owns the frame)"""
+        circuits, samples = frame.voltage.shape
+        cycles = max(samples * frame.frequency / frame.sample_rate, 1e-9)
+        self.windows = max(1, math.ceil(self.pre_cycles / cycles)) + 1
+        self.post_windows = math.ceil(self.post_cycles / cycles)
+        self.voltage = np.zeros((self.windows, circuits, samples), dtype=np.float32)
+        self.current = np.zeros((self.windows, circuits, samples), dtype=np.float32)
+        self.times = [None] * self.windows
+        self.filled = 0
+        self.position = 0
+    
+    def record(self, frame, events):
+        """Add a frame's windows to the ring and open captures for onset events in it"""
+        if not frame.has_waveforms:
+            return
+        if self.voltage is None or self.voltage.shape[1:] != frame.voltage.shape:
+            self._allocate(frame)
+        
+        # Post-trigger windows for captures already open
+        for capture in self.active:
+            capture.add(frame.tick_time, frame.voltage[capture.index].astype(np.float32),
+                        frame.current[capture.index].astype(np.float32))
+            capture.remaining -= 1
+        
+        np.copyto(self.voltage[self.position], frame.voltage, casting='same_kind')
+        np.copyto(self.current[self.position], frame.current, casting='same_kind')
+        self.times[self.position] = frame.tick_time
+        self.position = (self.position + 1) % self.windows
+        self.filled = min(self.filled + 1, self.windows)
+        
+        for event in events:
+            if event['event'] == 'onset' and event['type'] in self.triggers:
+                self._trigger(frame, event)
+        
+        for capture in [capture for capture in self.active if capture.remaining <= 0]:
+            self.active.remove(capture)
+            self.on_complete(capture)
+    
+    def _trigger(self, frame, event):
+        """Freeze the ring for the event's circuit; the trigger window is the newest one in it"""
+        if event['circuit_id'] not in frame.index:
+            return
+        if len(self.active) >= self.max_active:
+            self.captures_dropped += 1
+            logger.warning(f"Too many waveform captures in progress - {event['type']} on circuit "
+                           f"{event['circuit_id']} not captured")
+            return
+        
+        name = f"{frame.tick_time:%Y%m%d-%H%M%S-%f}_c{event['circuit_id']}_{event['type']}.npz"
+        capture = WaveformCapture(name, event, frame.index[event['circuit_id']], frame.sample_rate,
+                                  frame.frequency, self.post_windows)
+        for offset in range(self.filled, 0, -1):
+            slot = (self.position - offset) % self.windows
+            capture.add(self.times[slot], self.voltage[slot, capture.index].copy(),
+                        self.current[slot, capture.index].copy())
+        capture.trigger = self.filled - 1
+        
+        # The alert stage stores the name with the fault row; the file follows once the capture completes
+        event['waveform'] = name
+        self.active.append(capture)
+        self.captures_started += 1
+    
+    def flush(self):
+        """Hand over captures still waiting for post-trigger windows, e.g. at shutdown"""
+        active, self.active = self.active, []
+        for capture in active:
+            self.on_complete(capture)
+
+
+class WaveformStore:
+    """Compressed capture files in one directory, oldest deleted beyond a size budget"""
+    
+    def __init__(self, root, max_bytes):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        
+        # Names start with the trigger time, so name order is age order
+        self.files = sorted((path.name, path.stat().st_size) for path in self.root.glob('*.npz'))
+        self.total_bytes = sum(size for _, size in self.files)
+        self.captures_written = 0
+        self.captures_evicted = 0
+        # The capture stage adds and evicts files while API threads read them
+        self._lock = threading.Lock()
+    
+    def write(self, capture):
+        """Write one capture, then evict the oldest files while over budget"""
+        staging = self.root / (capture.name + '.tmp')
+        with open(staging, 'wb') as f:
+            np.savez_compressed(
+                f,
+                voltage=np.vstack(capture.voltage),
+                current=np.vstack(capture.current),
+                times=np.array(capture.times, dtype='datetime64[us]'),
+                trigger=capture.trigger,
+                circuit_id=capture.circuit_id,
+                fault_type=capture.fault_type,
+                sample_rate=capture.sample_rate,
+                frequency=capture.frequency
+            )
+        os.replace(staging, self.root / capture.name)
+        
+        size = (self.root / capture.name).stat().st_size
+        with self._lock:
+            self.files.append((capture.name, size))
+            self.total_bytes += size
+            self.captures_written += 1
+            
+            while self.total_bytes > self.max_bytes and len(self.files) > 1:
+                name, size = self.files.pop(0)
+                (self.root / name).unlink(missing_ok=True)
+                self.total_bytes -= size
+                self.captures_evicted += 1
+    
+    def load(self, name):
+        """Arrays of a stored capture, or None if it is still recording or was evicted"""
+        path = self.root / Path(name).name
+        # Eviction can unlink the file at any point before it is open; once open it reads to the end
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                return {key: data[key] for key in data.files}
+        except FileNotFoundError:
+            return None
+    
+    def view(self, name, points=1000):
+        """JSON-ready capture downsampled to about `points` samples with a min/max envelope per bucket"""
+        data = self.load(name)
+        if data is None:
+            return None
+        
+        windows, samples = data['voltage'].shape
+        sample_rate = float(data['sample_rate'])
+        trigger = int(data['trigger'])
+        trigger_time = data['times'][trigger]
+        
+        # Each bucket keeps its extremes in time order, so peaks survive; windows stay separate
+        # because consecutive ticks' bursts are not contiguous in time
+        buckets = max(1, min(samples, points // (2 * windows)))
+        size = math.ceil(samples / buckets)
+        offsets = np.arange(samples) / sample_rate
+        
+        result = {'time': [], 'voltage': [], 'current': []}
+        for window in range(windows):
+            start = (data['times'][window] - trigger_time) / np.timedelta64(1, 's')
+            time = start + offsets
+            if size == 1:
+                result['time'] += time.tolist()
+                result['voltage'] += data['voltage'][window].astype(float).tolist()
+                result['current'] += data['current'][window].astype(float).tolist()
+                continue
+            
+            edges = np.arange(0, samples, size)
+            result['time'] += np.column_stack([time[edges], time[np.minimum(edges + size, samples) - 1]]).ravel().tolist()
+            for signal in ('voltage', 'current'):
+                values = data[signal][window].astype(float)
+                low = np.minimum.reduceat(values, edges)
+                high = np.maximum.reduceat(values, edges)
+                first = np.array([np.argmin(values[edge:edge + size]) <= np.argmax(values[edge:edge + size])
+                                  for edge in edges])
+                result[signal] += np.where(first[:, None], np.column_stack([low, high]),
+                                           np.column_stack([high, low])).ravel().tolist()
+        
+        return {
+            'circuit_id': int(data['circuit_id']),
+            'fault_type': str(data['fault_type']),
+            'sample_rate': sample_rate,
+            'frequency': float(data['frequency']),
+            'trigger_time': str(trigger_time),
+            'windows': [{'start': (t - trigger_time) / np.timedelta64(1, 's'), 'samples': samples}
+                        for t in data['times']],
+            'downsampled': size > 1,
+            **result
+        }
@@ -5,23 +5,363 @@
 
 import sqlite3
 import logging
+import math
+import queue
+import threading
+import time
+from itertools import repeat
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timedelta
+import numpy as np
+
+from src.archive import ARCHIVE_COLUMNS, ArchivePolicy, ReadingArchive, display_values, format_timestamps
 
 logger = logging.getLogger(__name__)
 
+INSERT_READING_SQL = """
+    INSERT INTO readings (timestamp, circuit_id, voltage, current, power, power_factor, frequency)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+# Rollup resolutions: timestamp prefix length and the suffix that completes the bucket start
+ROLLUP_BUCKETS = {
+    '1m': (16, ':00'),
+    '1h': (13, ':00:00'),
+    '1d': (10, ' 00:00:00')
+}
+ROLLUP_METRICS = ('voltage', 'current', 'power', 'power_factor')
+# Power factor is NULL for idle readings, so its average divides by its own sample count
+PF = ROLLUP_METRICS.index('power_factor')
+ROLLUP_DIVISORS = {'power_factor': 'nullif(power_factor_samples, 0)'}
+
+# Finest history resolution for a requested range: (longest range, source)
+HISTORY_RESOLUTIONS = (
+    (timedelta(hours=6), 'raw'),
+    (timedelta(days=7), '1m'),
+    (timedelta(days=120), '1h'),
+    (None, '1d')
+)
+
+# Readings further apart than this are treated as a gap, not integrated into energy
+MAX_ENERGY_GAP_SECONDS = 60
+
+
+def _rollup_columns():
+    """Column names of a rollup table after (circuit_id, bucket)"""
+    columns = ['samples']
+    for metric in ROLLUP_METRICS:
+        columns += [f"{metric}_min", f"{metric}_max", f"{metric}_sum", f"{metric}_last"]
+    return columns + ['power_factor_samples', 'energy_wh', 'last_timestamp']
+
+
+def _rollup_upsert_sql(table):
+    """Build the merge-on-conflict insert for a rollup table"""
+    columns = ['circuit_id', 'bucket'] + _rollup_columns()
+    updates = ['samples = samples + excluded.samples']
+    # SQLite's scalar min()/max() return NULL if any argument is NULL, so missing values fall through
+    for metric in ROLLUP_METRICS:
+        updates += [
+            f"{metric}_min = coalesce(min({metric}_min, excluded.{metric}_min), {metric}_min, excluded.{metric}_min)",
+            f"{metric}_max = coalesce(max({metric}_max, excluded.{metric}_max), {metric}_max, excluded.{metric}_max)",
+            f"{metric}_sum = {metric}_sum + excluded.{metric}_sum",
+            f"{metric}_last = coalesce(CASE WHEN excluded.last_timestamp >= last_timestamp "
+            f"THEN excluded.{metric}_last ELSE {metric}_last END, {metric}_last, excluded.{metric}_last)"
+        ]
+    updates += [
+        'power_factor_samples = power_factor_samples + excluded.power_factor_samples',
+        'energy_wh = energy_wh + excluded.energy_wh',
+        'last_timestamp = max(last_timestamp, excluded.last_timestamp)'
+    ]
+    return (f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT(circuit_id, bucket) DO UPDATE SET {', '.join(updates)}")
+
+
+class RollupAggregator:
+    """Incrementally maintains 1-minute, 1-hour and 1-day rollups from inserted readings"""
+    
+    def __init__(self):
+        self.upsert_sql = {resolution: _rollup_upsert_sql(f"readings_{resolution}")
+                           for resolution in ROLLUP_BUCKETS}
+        self.last_power = {}  # circuit_id -> (datetime, power) for trapezoidal energy
+    
+    def apply(self, conn, batch):
+        """Merge a batch of reading rows into the rollup tables (caller commits)"""
+        partials = {resolution: {} for resolution in ROLLUP_BUCKETS}
+        
+        for row in batch:
+            timestamp, circuit_id = row[0], row[1]
+            values = list(row[2:6])
+            # An idle circuit's power factor arrives as NaN (frames) or None (dict readings)
+            pf = values[PF]
+            has_pf = pf is not None and pf == pf
+            if not has_pf:
+                values[PF] = None
+            energy_wh = self._energy(circuit_id, timestamp, row[4])
+            
+            for resolution, (length, suffix) in ROLLUP_BUCKETS.items():
+                key = (circuit_id, timestamp[:length] + suffix)
+                acc = partials[resolution].get(key)
+                if acc is None:
+                    sums = list(values)
+                    sums[PF] = pf if has_pf else 0.0
+                    partials[resolution][key] = [1, list(values), list(values), sums,
+                                                 list(values), int(has_pf), energy_wh, timestamp]
+                    continue
+                
+                acc[0] += 1
+                for m, value in enumerate(values):
+                    if value is None:
+                        continue
+                    acc[1][m] = value if acc[1][m] is None else min(acc[1][m], value)
+                    acc[2][m] = value if acc[2][m] is None else max(acc[2][m], value)
+                    acc[3][m] += value
+                    acc[4][m] = value
+                acc[5] += has_pf
+                acc[6] += energy_wh
+                acc[7] = timestamp
+        
+        for resolution, buckets in partials.items():
+            rows = []
+            for (circuit_id, bucket), (samples, mins, maxs, sums, lasts, pf_samples, energy_wh,
+                                       last_ts) in buckets.items():
+                row = [circuit_id, bucket, samples]
+                for m in range(len(ROLLUP_METRICS)):
+                    row += [mins[m], maxs[m], sums[m], lasts[m]]
+                rows.append(row + [pf_samples, energy_wh, last_ts])
+            conn.executemany(self.upsert_sql[resolution], rows)
+    
+    def _energy(self, circuit_id, timestamp, power):
+        """Trapezoidal energy in Wh since the circuit's previous reading"""
+        now = datetime.fromisoformat(timestamp)
+        previous = self.last_power.get(circuit_id)
+        self.last_power[circuit_id] = (now, power)
+        if previous is None:
+            return 0.0
+        
+        seconds = (now - previous[0]).total_seconds()
+        if seconds <= 0 or seconds > MAX_ENERGY_GAP_SECONDS:
+            return 0.0
+        return (previous[1] + power) / 2 * seconds / 3600
+
+
+class RetentionPolicy:
+    """Prunes expired raw and minute rows in small batches"""
+    
+    def __init__(self, config, archived=False):
+        # With an archive, raw rows leave the table by being archived; raw_days then applies to the archive
+        self.raw_days = None if archived else config.get('raw_days')
+        self.minute_days = config.get('minute_days')
+        self.batch_size = config.get('batch_size', 1000)
+        self.interval = config.get('interval_s', 60)
+        self.next_run = 0.0
+    
+    @property
+    def enabled(self):
+        return bool(self.raw_days or self.minute_days)
+    
+    def prune_step(self, conn):
+        """Delete at most one batch of expired rows; returns rows deleted"""
+        if not self.enabled or time.monotonic() < self.next_run:
+            return 0
+        
+        deleted = 0
+        targets = [('readings', 'id', 'timestamp', self.raw_days),
+                   ('readings_1m', 'rowid', 'bucket', self.minute_days)]
+        with conn:
+            for table, key, column, days in targets:
+                if not days:
+                    continue
+                cutoff = format_timestamp(datetime.now() - timedelta(days=days))
+                cursor = conn.execute(f"""
+                    DELETE FROM {table} WHERE {key} IN (
+                        SELECT {key} FROM {table} WHERE {column} < ? LIMIT ?
+                    )
+                """, (cutoff, self.batch_size))
+                deleted += cursor.rowcount
+        
+        # Keep going next cycle while there is a backlog, otherwise wait for the interval
+        if deleted < self.batch_size:
+            self.next_run = time.monotonic() + self.interval
+        return deleted
+
+
+def format_timestamp(dt):
+    """Format a datetime for storage in a DATETIME column"""
+    return dt.isoformat(sep=' ', timespec='milliseconds')
+
+
+class DatabaseWriter:
+    """Background thread that batches reading inserts into grouped commits"""
+    
+    _STOP = object()
+    
+    def __init__(self, db_path, config, archive=None):
+        self.db_path = db_path
+        self.batch_size = config.get('batch_size', 500)
+        self.flush_interval = config.get('flush_interval_ms', 1000) / 1000
+        self.enqueue_timeout = config.get('enqueue_timeout_ms', 50) / 1000
+        self.synchronous = config.get('synchronous', 'NORMAL')
+        self.queue = queue.Queue(maxsize=config.get('queue_size', 10000))
+        self.rollups = RollupAggregator()
+        retention = config.get('retention', {})
+        self.retention = RetentionPolicy(retention, archived=archive is not None)
+        self.archiver = None
+        if archive is not None:
+            self.archiver = ArchivePolicy(archive, config.get('archive', {}), retention.get('raw_days'))
+        
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.rows_pruned = 0
+        self.batches_written = 0
+        self.last_error = None
+        
+        self.thread = threading.Thread(target=self._run, name='db-writer', daemon=True)
+        self.thread.start()
+    
+    def submit(self, row):
+        """Queue a row for writing, dropping it if the queue stays full"""
+        try:
+            self.queue.put(row, timeout=self.enqueue_timeout)
+        except queue.Full:
+            self.rows_dropped += 1
+            if self.rows_dropped % 1000 == 1:
+                logger.warning(f"Database writer queue full - {self.rows_dropped} rows dropped so far")
+    
+    def submit_many(self, rows):
+        """Queue a tick's rows as a single item, dropping them all if the queue stays full"""
+        try:
+            self.queue.put(rows, timeout=self.enqueue_timeout)
+        except queue.Full:
+            before = self.rows_dropped
+            self.rows_dropped += len(rows)
+            if self.rows_dropped // 1000 > before // 1000 or before == 0:
+                logger.warning(f"Database writer queue full - {self.rows_dropped} rows dropped so far")
+    
+    def flush(self, timeout=None):
+        """Block until every row queued so far has been committed"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+    
+    def close(self):
+        """Flush pending rows and stop the writer thread"""
+        self.queue.put(self._STOP)
+        self.thread.join()
+    
+    def _run(self):
+        """Writer thread main loop"""
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA busy_timeout = 5000")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            
+            if item is self._STOP:
+                self._write(conn, batch)
+                break
+            elif isinstance(item, threading.Event):
+                self._write(conn, batch)
+                batch = []
+                item.set()
+                continue
+            elif isinstance(item, list):
+                batch.extend(item)
+            elif item is not None:
+                batch.append(item)
+            
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._write(conn, batch)
+                batch = []
+                self._prune(conn)
+                deadline = time.monotonic() + self.flush_interval
+        
+        conn.close()
+    
+    def _write(self, conn, batch):
+        """Insert a batch of rows in a single transaction"""
+        if not batch:
+            return
+        
+        try:
+            with conn:
+                conn.executemany(INSERT_READING_SQL, batch)
+                self.rollups.apply(conn, batch)
+            self.rows_written += len(batch)
+            self.batches_written += 1
+        except sqlite3.Error as e:
+            self.last_error = str(e)
+            logger.error(f"Database writer failed to commit {len(batch)} rows: {e}")
+    
+    def _prune(self, conn):
+        """Run one retention step between batches"""
+        try:
+            self.rows_pruned += self.retention.prune_step(conn)
+        except sqlite3.Error as e:
+            logger.error(f"Retention pruning failed: {e}")
+        
+        if self.archiver is not None:
+            try:
+                self.rows_pruned += self.archiver.step(conn)
+            except (sqlite3.Error, OSError, ValueError) as e:
+                # Raw rows are only deleted once their day is archived, so a failed step loses nothing
+                # (the policy has already abandoned the day in progress)
+                self.archiver.next_run = time.monotonic() + self.archiver.interval
+                logger.error(f"Archiving failed: {e}")
+
 
 class Database:
     """Handles database operations"""
     
-    def __init__(self, config):
+    def __init__(self, config, read_only=False):
         self.config = config
+        self.read_only = read_only
         db_path = config.get('path', 'data/gridguard.db')
-        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+        self.db_path = db_path
+        # Pipeline stages and periodic jobs share this connection; keep their transactions apart
+        self.lock = threading.Lock()
+        
+        self.writer = None
+        self.rollups = None
+        self.archive = None
+        archive_config = config.get('archive', {})
         
+        if read_only:
+            # Reports and exports beside a running monitor: no writer thread, schema changes or pruning
+            if not Path(db_path).exists():
+                raise FileNotFoundError(f"Database not found: {db_path}")
+            self.conn = self.connect_reader()
+            self.conn.execute("PRAGMA busy_timeout = 5000")
+            if archive_config.get('enabled', False):
+                self.archive = ReadingArchive(archive_config.get('path', str(Path(db_path).parent / 'archive')))
+            logger.info(f"Database opened read-only: {db_path}")
+            return
+        
+        Path(db_path).parent.mkdir(parents=True, exist_ok=True)
         self.conn = sqlite3.connect(db_path, check_same_thread=False)
         self.conn.row_factory = sqlite3.Row
+        
+        # WAL lets the writer thread commit while other connections read
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute(f"PRAGMA synchronous = {config.get('synchronous', 'NORMAL')}")
+        self.conn.execute("PRAGMA busy_timeout = 5000")
         self._create_tables()
+        
+        # Closed days of raw readings move to a columnar archive (maintained by the writer thread)
+        if archive_config.get('enabled', False):
+            self.archive = ReadingArchive(archive_config.get('path', str(Path(db_path).parent / 'archive')))
+        
+        if config.get('batch_writes', True):
+            self.writer = DatabaseWriter(db_path, config, self.archive)
+        else:
+            self.rollups = RollupAggregator()
+        
         logger.info(f"Database initialized: {db_path}")
     
     def _create_tables(self):
@@ -54,55 +394,350 @@ class Database:
             )
         """)
         
+        # Fault episode columns added after the initial schema
+        fault_columns = {row[1] for row in cursor.execute("PRAGMA table_info(faults)")}
+        for column, column_type in (('resolved_at', 'DATETIME'), ('duration', 'REAL'), ('peak_value', 'REAL'),
+                                    ('waveform', 'TEXT')):
+            if column not in fault_columns:
+                cursor.execute(f"ALTER TABLE faults ADD COLUMN {column} {column_type}")
+        
+        for resolution in ROLLUP_BUCKETS:
+            columns = ',\n'.join(f"                {column} REAL" for column in _rollup_columns()[1:-1])
+            cursor.execute(f"""
+                CREATE TABLE IF NOT EXISTS readings_{resolution} (
+                    circuit_id INTEGER,
+                    bucket DATETIME,
+                    samples INTEGER,
+{columns},
+                    last_timestamp DATETIME,
+                    PRIMARY KEY (circuit_id, bucket)
+                )
+            """)
+            # Rollups written before power factor could be missing counted it for every sample
+            rollup_columns = {row[1] for row in cursor.execute(f"PRAGMA table_info(readings_{resolution})")}
+            if 'power_factor_samples' not in rollup_columns:
+                cursor.execute(f"ALTER TABLE readings_{resolution} ADD COLUMN power_factor_samples REAL")
+                cursor.execute(f"UPDATE readings_{resolution} SET power_factor_samples = samples")
+        
+        # Per-circuit energy for each local day; today's row is a running checkpoint
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS energy_daily (
+                day DATE,
+                circuit_id INTEGER,
+                energy_kwh REAL,
+                cost REAL,
+                peak_kwh REAL,
+                updated_at DATETIME,
+                PRIMARY KEY (day, circuit_id)
+            )
+        """)
+        
+        # Per-circuit anomaly baselines, checkpointed so a restart doesn't have to re-learn them
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS baselines (
+                circuit_id INTEGER,
+                metric TEXT,
+                samples INTEGER,
+                mean REAL,
+                variance REAL,
+                trend REAL,
+                reference REAL,
+                updated_at DATETIME,
+                PRIMARY KEY (circuit_id, metric)
+            )
+        """)
+        
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_readings_timestamp ON readings(timestamp)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_readings_circuit_timestamp ON readings(circuit_id, timestamp)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_faults_timestamp ON faults(timestamp)")
+        # Retention prunes minute rollups by age across all circuits; the primary key leads with circuit_id
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_readings_1m_bucket ON readings_1m(bucket)")
         
         self.conn.commit()
     
-    def save_reading(self, circuit_id, data, analysis):
+    def save_reading(self, circuit_id, data, analysis, timestamp=None):
         """Save power reading"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO readings (circuit_id, voltage, current, power, power_factor, frequency)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
+        row = (
+            format_timestamp(timestamp or datetime.now()),
             circuit_id,
             data['voltage'],
             data['current'],
             data['power'],
             data['power_factor'],
             data['frequency']
-        ))
-        self.conn.commit()
+        )
+        
+        if self.writer:
+            self.writer.submit(row)
+        else:
+            with self.lock:
+                self.conn.execute(INSERT_READING_SQL, row)
+                self.rollups.apply(self.conn, [row])
+                self.conn.commit()
+    
+    def save_frame(self, frame):
+        """Save every circuit's reading from a TickFrame"""
+        values = frame.values
+        rows = list(zip(repeat(format_timestamp(frame.tick_time or datetime.now())), frame.circuit_list,
+                        *(values[name].tolist() for name in ('voltage', 'current', 'power', 'power_factor', 'frequency'))))
+        
+        if self.writer:
+            self.writer.submit_many(rows)
+        else:
+            with self.lock:
+                self.conn.executemany(INSERT_READING_SQL, rows)
+                self.rollups.apply(self.conn, rows)
+                self.conn.commit()
+    
+    def flush(self):
+        """Wait for queued readings to be committed"""
+        if self.writer:
+            self.writer.flush()
+    
+    def get_writer_stats(self):
+        """Get background writer queue and throughput counters"""
+        if not self.writer:
+            return {}
+        
+        return {
+            'queue_depth': self.writer.queue.qsize(),
+            'rows_written': self.writer.rows_written,
+            'rows_dropped': self.writer.rows_dropped,
+            'rows_pruned': self.writer.rows_pruned,
+            'rows_archived': self.writer.archiver.rows_archived if self.writer.archiver else 0,
+            'batches_written': self.writer.batches_written
+        }
     
     def save_fault(self, fault):
-        """Save detected fault"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT INTO faults (timestamp, circuit_id, fault_type, severity, description, value)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, (
-            fault['timestamp'],
-            fault['circuit_id'],
-            fault['type'],
-            fault['severity'],
-            fault['description'],
-            fault.get('value')
-        ))
-        self.conn.commit()
+        """Save detected fault and return its row id"""
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                INSERT INTO faults (timestamp, circuit_id, fault_type, severity, description, value, waveform)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                fault['timestamp'],
+                fault['circuit_id'],
+                fault['type'],
+                fault['severity'],
+                fault['description'],
+                fault.get('value'),
+                fault.get('waveform')
+            ))
+            self.conn.commit()
+            return cursor.lastrowid
+    
+    def resolve_fault(self, fault_id, resolved_at, duration, peak_value):
+        """Mark a fault episode as resolved"""
+        with self.lock:
+            self.conn.execute("""
+                UPDATE faults
+                SET resolved = 1, resolved_at = ?, duration = ?, peak_value = ?
+                WHERE id = ?
+            """, (resolved_at, duration, peak_value, fault_id))
+            self.conn.commit()
+    
+    def resolve_open_faults(self, note):
+        """Close episodes a previous run left open, as of its last stored reading; returns how many"""
+        with self.lock:
+            last = self.conn.execute("SELECT MAX(timestamp) FROM readings").fetchone()[0]
+            rows = self.conn.execute(
+                "SELECT id, timestamp, value, peak_value, description FROM faults WHERE resolved = 0").fetchall()
+            for row in rows:
+                try:
+                    started = datetime.fromisoformat(str(row['timestamp']))
+                    resolved_at = max(started, datetime.fromisoformat(last)) if last else started
+                    duration = (resolved_at - started).total_seconds()
+                except ValueError:
+                    resolved_at, duration = datetime.now(), None
+                self.conn.execute("""
+                    UPDATE faults
+                    SET resolved = 1, resolved_at = ?, duration = ?, peak_value = ?, description = ?
+                    WHERE id = ?
+                """, (resolved_at, duration, row['peak_value'] if row['peak_value'] is not None else row['value'],
+                      f"{row['description']} - {note}", row['id']))
+            self.conn.commit()
+            return len(rows)
     
     def get_recent_faults(self, limit=10):
         """Get recent faults"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT * FROM faults 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        """, (limit,))
-        return [dict(row) for row in cursor.fetchall()]
+        with self.lock:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT * FROM faults 
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            """, (limit,))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_fault(self, fault_id):
+        """Get one fault by id, or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM faults WHERE id = ?", (fault_id,)).fetchone()
+            return dict(row) if row else None
+    
+    def save_energy_day(self, day, totals):
+        """Upsert a day's per-circuit {circuit_id: (kWh, cost, peak kWh)} totals"""
+        updated_at = format_timestamp(datetime.now())
+        rows = [(day.isoformat(), circuit_id, kwh, cost, peak_kwh, updated_at)
+                for circuit_id, (kwh, cost, peak_kwh) in totals.items()]
+        with self.lock:
+            self.conn.executemany("""
+                INSERT INTO energy_daily (day, circuit_id, energy_kwh, cost, peak_kwh, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(day, circuit_id) DO UPDATE SET
+                    energy_kwh = excluded.energy_kwh, cost = excluded.cost,
+                    peak_kwh = excluded.peak_kwh, updated_at = excluded.updated_at
+            """, rows)
+            self.conn.commit()
+    
+    def load_energy_day(self, day):
+        """Get the stored per-circuit totals for a day"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT circuit_id, energy_kwh, cost, peak_kwh FROM energy_daily WHERE day = ?",
+                (day.isoformat(),))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def save_baselines(self, rows):
+        """Upsert (circuit_id, metric, samples, mean, variance, trend, reference) baseline rows"""
+        updated_at = format_timestamp(datetime.now())
+        with self.lock:
+            self.conn.executemany("""
+                INSERT INTO baselines (circuit_id, metric, samples, mean, variance, trend, reference, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(circuit_id, metric) DO UPDATE SET
+                    samples = excluded.samples, mean = excluded.mean, variance = excluded.variance,
+                    trend = excluded.trend, reference = excluded.reference, updated_at = excluded.updated_at
+            """, [row + (updated_at,) for row in rows])
+            self.conn.commit()
+    
+    def load_baselines(self):
+        """Get every stored anomaly baseline"""
+        with self.lock:
+            cursor = self.conn.execute(
+                "SELECT circuit_id, metric, samples, mean, variance, trend, reference, updated_at FROM baselines")
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def connect_reader(self):
+        """Open a read-only connection for long-running queries"""
+        conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+    
+    def choose_resolution(self, start, end):
+        """Pick the finest resolution whose row count stays reasonable for the range"""
+        span = end - start
+        for limit, resolution in HISTORY_RESOLUTIONS:
+            if limit is None or span <= limit:
+                return resolution
+    
+    def live_start(self, start):
+        """Earliest time at or after start whose raw readings are still in the readings table"""
+        if self.archive is None or not self.archive.days():
+            return start
+        # Days are archived oldest first, so everything after the newest archived day is live
+        return max(start, datetime.combine(self.archive.days()[-1] + timedelta(days=1), datetime.min.time()))
+    
+    def iter_readings(self, circuit_id, start, end, resolution=None, chunk_size=1000):
+        """Yield readings for a circuit over [start, end), oldest first"""
+        resolution = resolution or self.choose_resolution(start, end)
+        
+        if resolution == 'raw' and self.archive is not None:
+            for data in self.archive.read_range(circuit_id, start, end):
+                columns = [format_timestamps(data['timestamp']).tolist()]
+                # NaN marks a missing power factor; the live table returns those as NULL
+                columns += [[None if math.isnan(value) else value for value in display_values(data[name]).tolist()]
+                            for name in ARCHIVE_COLUMNS]
+                for row in zip(*columns):
+                    yield dict(zip(('timestamp',) + ARCHIVE_COLUMNS, row))
+            start = self.live_start(start)
+            if start >= end:
+                return
+        
+        if resolution == 'raw':
+            query = """
+                SELECT timestamp, voltage, current, power, power_factor, frequency
+                FROM readings
+                WHERE circuit_id = ? AND timestamp >= ? AND timestamp < ?
+                ORDER BY timestamp
+            """
+            params = (circuit_id, format_timestamp(start), format_timestamp(end))
+        else:
+            averages = ', '.join(f"{m}_sum / {ROLLUP_DIVISORS.get(m, 'samples')} AS {m}, {m}_min, {m}_max"
+                                 for m in ROLLUP_METRICS)
+            query = f"""
+                SELECT bucket AS timestamp, samples, {averages}, energy_wh
+                FROM readings_{resolution}
+                WHERE circuit_id = ? AND bucket >= ? AND bucket < ?
+                ORDER BY bucket
+            """
+            # Buckets overlapping [start, end): from the one containing start to the last one
+            # starting before end, both bounds in the bucket format (whole seconds, no fraction)
+            length, suffix = ROLLUP_BUCKETS[resolution]
+            first = format_timestamp(start)[:length] + suffix
+            params = (circuit_id, first, format_timestamp(end)[:len(first)])
+        
+        conn = self.connect_reader()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+    
+    def get_readings(self, circuit_id, start, end, resolution=None):
+        """Get readings for a circuit over a time range"""
+        return list(self.iter_readings(circuit_id, start, end, resolution))
+    
+    def get_reading_arrays(self, circuit_id, start, end, chunk_size=50000):
+        """Raw readings for a circuit over [start, end) as numpy columns, spanning archive and live table"""
+        timestamps = []
+        columns = {name: [] for name in ARCHIVE_COLUMNS}
+        
+        if self.archive is not None:
+            for data in self.archive.read_range(circuit_id, start, end):
+                timestamps.append(np.asarray(data['timestamp']))
+                for name in ARCHIVE_COLUMNS:
+                    columns[name].append(display_values(data[name]))
+            start = self.live_start(start)
+        
+        if start < end:
+            conn = self.connect_reader()
+            conn.row_factory = None
+            try:
+                cursor = conn.execute(f"""
+                    SELECT timestamp, {', '.join(ARCHIVE_COLUMNS)}
+                    FROM readings
+                    WHERE circuit_id = ? AND timestamp >= ? AND timestamp < ?
+                    ORDER BY timestamp
+                """, (circuit_id, format_timestamp(start), format_timestamp(end)))
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    fields = list(zip(*rows))
+                    timestamps.append(np.array(fields[0], dtype='datetime64[ms]'))
+                    for name, values in zip(ARCHIVE_COLUMNS, fields[1:]):
+                        columns[name].append(np.array(values, dtype=np.float64))
+            finally:
+                conn.close()
+        
+        result = {'timestamp': np.concatenate(timestamps) if timestamps else np.array([], dtype='datetime64[ms]')}
+        for name, parts in columns.items():
+            result[name] = np.concatenate(parts) if parts else np.array([], dtype=np.float64)
+        return result
     
     def close(self):
         """Close database connection"""
+        if self.writer:
+            self.writer.close()
+            self.writer = None
+        
         if self.conn:
             self.conn.close()
             logger.info("Database closed")
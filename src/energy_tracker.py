@@ -4,42 +4,222 @@
 """Energy consumption tracker"""
 
 import logging
+import threading
 from datetime import datetime, timedelta
+import numpy as np
 
 logger = logging.getLogger(__name__)
 
+# Readings further apart than this are treated as a gap, not integrated
+DEFAULT_MAX_GAP_SECONDS = 60
 
-class EnergyTracker:
-    """Tracks energy consumption"""
+# Timestamps are integrated as seconds of naive local wall time since this instant
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _parse_clock(value):
+    """Minutes after midnight for an 'HH:MM' string"""
+    hours, minutes = str(value).split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class TariffSchedule:
+    """Flat per-kWh rate with time-of-use multipliers"""
     
     def __init__(self, config):
-        self.config = config
-        self.energy_totals = {}
         self.cost_per_kwh = config.get('cost_per_kwh', 0.12)
-        self.last_update = datetime.now()
+        self.periods = []
+        for period in config.get('peak_hours') or []:
+            self.periods.append((_parse_clock(period['start']), _parse_clock(period['end']),
+                                 period.get('cost_multiplier', 1.0)))
+    
+    def rate(self, when):
+        """Cost per kWh in effect at a local time"""
+        minute = when.hour * 60 + when.minute
+        for start, end, multiplier in self.periods:
+            # A window whose end is before its start wraps past midnight
+            inside = start <= minute < end if start <= end else (minute >= start or minute < end)
+            if inside:
+                return self.cost_per_kwh * multiplier
+        return self.cost_per_kwh
+    
+    def rates(self, minutes):
+        """Vectorized rate() for an array of minutes after midnight"""
+        rates = np.full(len(minutes), self.cost_per_kwh)
+        # Reversed, so the first matching window wins as in rate()
+        for start, end, multiplier in reversed(self.periods):
+            inside = (minutes >= start) & (minutes < end) if start <= end else (minutes >= start) | (minutes < end)
+            rates[inside] = self.cost_per_kwh * multiplier
+        return rates
+
+
+class EnergyTracker:
+    """Tracks energy consumption per circuit for the current local day"""
+    
+    def __init__(self, config, database=None):
+        self.config = config
+        self.database = database
+        self.tariff = TariffSchedule(config)
+        self.cost_per_kwh = self.tariff.cost_per_kwh
+        self.max_gap = config.get('max_gap_s', DEFAULT_MAX_GAP_SECONDS)
+        self.currency = config.get('currency', 'USD')
+        
+        self.day = datetime.now().date()
+        self.closed_days = {}  # day -> totals rolled over but not yet written
+        self._lock = threading.Lock()
+        
+        # Per-circuit state in arrays indexed through circuit_index, grown as circuits appear
+        self.circuits = []
+        self.circuit_index = {}
+        self.energy = np.zeros(0)  # kWh today
+        self.cost = np.zeros(0)  # cost today
+        self.peak = np.zeros(0)  # kWh today inside peak hours
+        self.counted = np.zeros(0, dtype=bool)  # has a total for today
+        self.last_time = np.zeros(0)  # wall seconds of the previous sample (NaN if none)
+        self.last_power = np.zeros(0)  # W at the previous sample, for trapezoidal integration
+        self._cached_slots = (None, None)
+        
+        if database is not None:
+            self._restore()
     
-    def update(self, readings):
-        """Update energy consumption"""
-        now = datetime.now()
-        time_delta = (now - self.last_update).total_seconds() / 3600  # hours
+    def _restore(self):
+        """Resume today's totals from the last checkpoint"""
+        rows = self.database.load_energy_day(self.day)
+        if not rows:
+            return
         
-        for circuit_id, data in readings.items():
-            if circuit_id not in self.energy_totals:
-                self.energy_totals[circuit_id] = 0.0
+        slots = self._slots([row['circuit_id'] for row in rows])
+        self.energy[slots] = [row['energy_kwh'] for row in rows]
+        self.cost[slots] = [row['cost'] for row in rows]
+        self.peak[slots] = [row['peak_kwh'] for row in rows]
+        self.counted[slots] = True
+        logger.info(f"Restored energy totals for {self.day}: {self.energy.sum():.3f} kWh")
+    
+    def _slots(self, circuit_ids):
+        """Array positions of the given circuits, adding any not seen before (caller holds the lock)"""
+        cached_ids, cached_slots = self._cached_slots
+        if circuit_ids is cached_ids or circuit_ids == cached_ids:
+            return cached_slots
+        
+        new = [circuit_id for circuit_id in dict.fromkeys(circuit_ids) if circuit_id not in self.circuit_index]
+        if new:
+            for circuit_id in new:
+                self.circuit_index[circuit_id] = len(self.circuits)
+                self.circuits.append(circuit_id)
+            grow = np.zeros(len(new))
+            self.energy = np.concatenate([self.energy, grow])
+            self.cost = np.concatenate([self.cost, grow])
+            self.peak = np.concatenate([self.peak, grow])
+            self.counted = np.concatenate([self.counted, np.zeros(len(new), dtype=bool)])
+            self.last_time = np.concatenate([self.last_time, np.full(len(new), np.nan)])
+            self.last_power = np.concatenate([self.last_power, grow])
+        
+        slots = np.array([self.circuit_index[circuit_id] for circuit_id in circuit_ids], dtype=np.intp)
+        self._cached_slots = (list(circuit_ids), slots)
+        return slots
+    
+    def update(self, readings, timestamp=None):
+        """Integrate a tick's power readings into today's totals"""
+        power = np.array([data['power'] for data in readings.values()], dtype=float)
+        self._integrate(list(readings), power, timestamp or datetime.now())
+    
+    def update_frame(self, frame):
+        """Integrate a TickFrame's power column into today's totals"""
+        self._integrate(frame.circuit_list, frame.values['power'], frame.tick_time or datetime.now())
+    
+    def _integrate(self, circuit_ids, power, now):
+        """Add the trapezoid since each circuit's previous sample"""
+        stamp = (now - _EPOCH).total_seconds()
+        
+        with self._lock:
+            slots = self._slots(circuit_ids)
+            then = self.last_time[slots]
+            previous_power = self.last_power[slots]
+            self.last_time[slots] = stamp
+            self.last_power[slots] = power
+            
+            # NaN (no previous sample) fails both comparisons
+            seconds = stamp - then
+            valid = (seconds > 0) & (seconds <= self.max_gap)
+            if not valid.any():
+                return
+            slots, then, previous_power, seconds = slots[valid], then[valid], previous_power[valid], seconds[valid]
+            power = np.broadcast_to(power, valid.shape)[valid]
             
-            # Energy = Power (kW) × Time (h)
-            energy_kwh = (data['power'] / 1000) * time_delta
-            self.energy_totals[circuit_id] += energy_kwh
+            # Split intervals that span local midnight so each day gets its share
+            midnight = (datetime.combine(now.date(), datetime.min.time()) - _EPOCH).total_seconds()
+            before = then < midnight
+            if before.any():
+                split = before & (stamp > midnight)
+                end = np.where(split, midnight, stamp)
+                end_power = np.where(split, previous_power + (power - previous_power) * (midnight - then) / seconds, power)
+                self._accumulate(now.date() - timedelta(days=1), slots[before], then[before], end[before],
+                                 previous_power[before], end_power[before])
+                then = np.where(split, midnight, then)
+                previous_power = np.where(split, end_power, previous_power)
+                keep = split | ~before
+                slots, then, previous_power, power = slots[keep], then[keep], previous_power[keep], power[keep]
+            
+            if len(slots):
+                self._accumulate(now.date(), slots, then, np.full(len(slots), stamp), previous_power, power)
+    
+    def _accumulate(self, day, slots, start, end, start_power, end_power):
+        """Add trapezoids between samples of the same day (caller holds the lock)"""
+        if day != self.day:
+            self._rollover(day)
+        
+        kwh = (start_power + end_power) / 2 * (end - start) / 3600 / 1000
+        rates = self.tariff.rates(((start + end) / 2 % 86400) // 60)
+        np.add.at(self.energy, slots, kwh)
+        np.add.at(self.cost, slots, kwh * rates)
+        np.add.at(self.peak, slots, np.where(rates != self.cost_per_kwh, kwh, 0.0))
+        self.counted[slots] = True
+    
+    def _rollover(self, day):
+        """Close out the current day and start a new one"""
+        if self.counted.any():
+            self.closed_days[self.day] = self._totals()
+            logger.info(f"Energy for {self.day}: {self.energy.sum():.3f} kWh, "
+                        f"cost {self.cost.sum():.2f} {self.currency}")
+        
+        self.day = day
+        self.energy[:] = 0.0
+        self.cost[:] = 0.0
+        self.peak[:] = 0.0
+        self.counted[:] = False
+    
+    def _totals(self):
+        """Per-circuit (kWh, cost, peak kWh) for the current day"""
+        slots = np.flatnonzero(self.counted)
+        return {self.circuits[slot]: (kwh, cost, peak) for slot, kwh, cost, peak in
+                zip(slots.tolist(), self.energy[slots].tolist(), self.cost[slots].tolist(), self.peak[slots].tolist())}
+    
+    def checkpoint(self):
+        """Write closed days and today's running totals to the energy_daily table"""
+        if self.database is None:
+            return
+        
+        with self._lock:
+            closed_days = self.closed_days
+            self.closed_days = {}
+            day, totals = self.day, self._totals()
         
-        self.last_update = now
+        for closed_day, closed_totals in closed_days.items():
+            self.database.save_energy_day(closed_day, closed_totals)
+        if totals:
+            self.database.save_energy_day(day, totals)
     
     def get_today_total(self):
         """Get today's total energy and cost"""
-        total_kwh = sum(self.energy_totals.values())
-        total_cost = total_kwh * self.cost_per_kwh
+        with self._lock:
+            total_kwh = float(self.energy.sum())
+            total_cost = float(self.cost.sum())
+            peak_kwh = float(self.peak.sum())
         
         return {
+            'date': self.day.isoformat(),
             'energy_kwh': total_kwh,
+            'peak_kwh': peak_kwh,
             'cost': total_cost,
-            'currency': 'USD'
+            'currency': self.currency
         }
@@ -0,0 +1,215 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Streaming export of readings and faults to CSV, JSON or Excel"""
+
+import csv
+import gzip
+import json
+import logging
+from datetime import datetime, timedelta
+from pathlib import Path
+import numpy as np
+
+from src.archive import ARCHIVE_COLUMNS, display_values, format_timestamps
+from src.database import format_timestamp
+
+logger = logging.getLogger(__name__)
+
+try:
+    from openpyxl import Workbook
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+EXPORT_FORMATS = ('csv', 'json', 'excel')
+
+READING_COLUMNS = ('timestamp', 'circuit_id', 'voltage', 'current', 'power', 'power_factor', 'frequency')
+FAULT_COLUMNS = ('id', 'timestamp', 'circuit_id', 'fault_type', 'severity', 'description', 'value',
+                 'resolved', 'resolved_at', 'duration', 'peak_value', 'waveform')
+
+# Rows per worksheet before Excel's 1,048,576 row limit (leaving room for the header)
+EXCEL_MAX_ROWS = 1048575
+
+
+def _open_text(path):
+    """Open an output file for text writing, gzip-compressed when it ends in .gz"""
+    if path.suffix == '.gz':
+        return gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=6)
+    return open(path, 'w', newline='', encoding='utf-8')
+
+
+class DataExporter:
+    """Copies a time range of readings and faults to a file in bounded memory"""
+    
+    def __init__(self, database, chunk_size=5000, page_size=100000):
+        self.database = database
+        self.chunk_size = chunk_size
+        self.page_size = page_size
+        self.rows_exported = 0
+    
+    def iter_reading_chunks(self, start, end, circuit_id=None):
+        """Yield lists of reading tuples in time order: archived days, then live rows"""
+        archive = self.database.archive
+        if archive is not None:
+            yield from self._iter_archive_chunks(archive, start, end, circuit_id)
+            start = self.database.live_start(start)
+            if start >= end:
+                return
+        
+        conn = self.database.connect_reader()
+        conn.row_factory = None
+        try:
+            # Stop at the newest row present now so the export is a consistent cut
+            last = conn.execute("SELECT MAX(id) FROM readings").fetchone()
+            if last[0] is None:
+                return
+            
+            # Keyset pages on (timestamp, id) walk the timestamp index in order, so rows inserted late
+            # with older timestamps (replays, clock steps) are neither skipped nor duplicated
+            index = 'idx_readings_circuit_timestamp' if circuit_id is not None else 'idx_readings_timestamp'
+            query = f"""
+                SELECT id, {', '.join(READING_COLUMNS)}
+                FROM readings INDEXED BY {index}
+                WHERE (timestamp, id) > (?, ?) AND timestamp < ? AND id <= ?
+                {'AND circuit_id = ?' if circuit_id is not None else ''}
+                ORDER BY timestamp, id
+                LIMIT ?
+            """
+            position = (format_timestamp(start), 0)
+            circuit = (circuit_id,) if circuit_id is not None else ()
+            
+            # Each page is its own short read, so the live writer can checkpoint the WAL between pages
+            while True:
+                cursor = conn.execute(query, position + (format_timestamp(end), last[0]) + circuit + (self.page_size,))
+                fetched = 0
+                while True:
+                    rows = cursor.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+                    fetched += len(rows)
+                    position = (rows[-1][1], rows[-1][0])
+                    yield [row[1:] for row in rows]
+                if fetched < self.page_size:
+                    break
+        finally:
+            conn.close()
+    
+    def _iter_archive_chunks(self, archive, start, end, circuit_id):
+        """Archived days as reading tuples, interleaving circuits back into time order"""
+        low, high = np.datetime64(start, 'ms'), np.datetime64(end, 'ms')
+        for day in archive.days_between(start, end):
+            data = archive.read_day(day, circuit_id)
+            order = np.argsort(data['timestamp'], kind='stable')
+            order = order[(data['timestamp'][order] >= low) & (data['timestamp'][order] < high)]
+            for first in range(0, len(order), self.chunk_size):
+                index = order[first:first + self.chunk_size]
+                columns = [format_timestamps(data['timestamp'][index]).tolist(), data['circuit_id'][index].tolist()]
+                columns += [display_values(data[name][index]).tolist() for name in ARCHIVE_COLUMNS]
+                yield list(zip(*columns))
+    
+    def iter_fault_chunks(self, start, end, circuit_id=None):
+        """Yield lists of fault tuples, oldest first"""
+        conn = self.database.connect_reader()
+        conn.row_factory = None
+        try:
+            cursor = conn.execute(f"""
+                SELECT {', '.join(FAULT_COLUMNS)}
+                FROM faults
+                WHERE timestamp >= ? AND timestamp < ?
+                {'AND circuit_id = ?' if circuit_id is not None else ''}
+                ORDER BY timestamp
+            """, (format_timestamp(start), format_timestamp(end)) + ((circuit_id,) if circuit_id is not None else ()))
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+    
+    def export(self, output, output_format='csv', days=7, end=None, circuit_id=None):
+        """Export the last N days; returns the paths written"""
+        if output_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format '{output_format}'")
+        
+        end = end or datetime.now()
+        start = end - timedelta(days=days)
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        self.rows_exported = 0
+        
+        readings = self._counted(self.iter_reading_chunks(start, end, circuit_id))
+        faults = self._counted(self.iter_fault_chunks(start, end, circuit_id))
+        
+        if output_format == 'csv':
+            paths = self._write_csv(output, readings, faults)
+        elif output_format == 'json':
+            paths = self._write_json(output, readings, faults)
+        else:
+            paths = self._write_excel(output, readings, faults)
+        
+        logger.info(f"Exported {self.rows_exported} rows ({start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}) "
+                    f"to {', '.join(str(path) for path in paths)}")
+        return paths
+    
+    def _counted(self, chunks):
+        """Pass chunks through, tracking progress"""
+        for rows in chunks:
+            before = self.rows_exported
+            self.rows_exported += len(rows)
+            if self.rows_exported // 1000000 > before // 1000000:
+                logger.info(f"Export progress: {self.rows_exported} rows")
+            yield rows
+    
+    def _write_csv(self, output, readings, faults):
+        """Readings to the output file and faults to a _faults sibling"""
+        suffixes = ''.join(output.suffixes)
+        faults_path = output.with_name(output.name[:len(output.name) - len(suffixes)] + '_faults' + suffixes)
+        
+        for path, columns, chunks in ((output, READING_COLUMNS, readings), (faults_path, FAULT_COLUMNS, faults)):
+            with _open_text(path) as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                for rows in chunks:
+                    writer.writerows(rows)
+        return [output, faults_path]
+    
+    def _write_json(self, output, readings, faults):
+        """One object with readings and faults arrays, written row by row"""
+        with _open_text(output) as f:
+            f.write('{')
+            for index, (name, columns, chunks) in enumerate((('readings', READING_COLUMNS, readings),
+                                                             ('faults', FAULT_COLUMNS, faults))):
+                f.write(f'{"," if index else ""}\n"{name}": [')
+                separator = '\n'
+                for rows in chunks:
+                    f.write(separator)
+                    f.write(',\n'.join(json.dumps(dict(zip(columns, row))) for row in rows))
+                    separator = ',\n'
+                f.write('\n]')
+            f.write('\n}\n')
+        return [output]
+    
+    def _write_excel(self, output, readings, faults):
+        """Write-only workbook, starting a new sheet whenever one fills up"""
+        if not HAS_OPENPYXL:
+            raise RuntimeError("Excel export requires openpyxl (pip install openpyxl)")
+        
+        workbook = Workbook(write_only=True)
+        for name, columns, chunks in (('readings', READING_COLUMNS, readings), ('faults', FAULT_COLUMNS, faults)):
+            sheet, sheet_rows, sheets = None, EXCEL_MAX_ROWS, 0
+            for rows in chunks:
+                for row in rows:
+                    if sheet_rows >= EXCEL_MAX_ROWS:
+                        sheets += 1
+                        sheet = workbook.create_sheet(name if sheets == 1 else f"{name}_{sheets}")
+                        sheet.append(columns)
+                        sheet_rows = 0
+                    sheet.append(row)
+                    sheet_rows += 1
+            if sheet is None:
+                workbook.create_sheet(name).append(columns)
+        
+        workbook.save(output)
+        return [output]
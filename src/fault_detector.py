@@ -5,48 +5,268 @@
 
 import logging
 from datetime import datetime
+import numpy as np
+
+from src.analyzer import STATUS_NAMES
+from src.anomaly import ANOMALY_STATUS, BASELINE_METRICS, BaselineModel
 
 logger = logging.getLogger(__name__)
 
+# Onset and clear conditions per fault type. A fault starts when the analysis status
+# enters the onset set and only clears once it is back in the clear set, so the band
+# between the warning and critical thresholds acts as hysteresis.
+FAULT_CONDITIONS = {
+    'overload': {
+        'status_key': 'current_status',
+        'value_key': 'current',
+        'onset': {'critical'},
+        'clear': {'normal'},
+        'description': "Current {value:.2f}A exceeds safe limit",
+        'defaults': {'duration': 5, 'clear_duration': 5}
+    },
+    'voltage_fault': {
+        'status_key': 'voltage_status',
+        'value_key': 'voltage',
+        'onset': {'critical_low', 'critical_high'},
+        'clear': {'normal'},
+        'description': "Voltage {value:.1f}V out of safe range",
+        'defaults': {'duration': 1, 'clear_duration': 5}
+    }
+}
+
+# Deviations from each circuit's own statistical baseline (see src/anomaly.py). They run
+# through the same episode state machine, with 'elevated' as the hysteresis band.
+ANOMALY_CONDITIONS = {
+    'current_spike': {
+        'onset': {'anomalous'},
+        'clear': {'normal'},
+        'severity': 'warning',
+        'description': "Current spike to {value:.2f}A above circuit baseline",
+        'defaults': {'duration': 0, 'clear_duration': 5}
+    },
+    'load_step': {
+        'onset': {'anomalous'},
+        'clear': {'normal'},
+        'severity': 'warning',
+        'description': "Load stepped to {value:.0f}W away from circuit baseline",
+        'defaults': {'duration': 2, 'clear_duration': 10}
+    },
+    'voltage_sag': {
+        'onset': {'anomalous'},
+        'clear': {'normal'},
+        'severity': 'warning',
+        'peak': 'min',
+        'description': "Voltage sag to {value:.1f}V below circuit baseline",
+        'defaults': {'duration': 0, 'clear_duration': 2}
+    },
+    'voltage_swell': {
+        'onset': {'anomalous'},
+        'clear': {'normal'},
+        'severity': 'warning',
+        'description': "Voltage swell to {value:.1f}V above circuit baseline",
+        'defaults': {'duration': 0, 'clear_duration': 2}
+    },
+    'drift': {
+        'onset': {'anomalous'},
+        'clear': {'normal'},
+        'severity': 'warning',
+        'description': "Current trend drifted to {value:.2f}A away from its long-term average",
+        'defaults': {'duration': 1800, 'clear_duration': 1800}
+    }
+}
+
 
 class FaultDetector:
     """Detects electrical faults"""
     
-    def __init__(self, config):
+    def __init__(self, config, database=None):
         self.config = config
-        self.fault_history = []
+        self.database = database
+        
+        # Statistical baselines are optional; fixed thresholds always run
+        self.baselines = None
+        self.conditions = dict(FAULT_CONDITIONS)
+        if config.get('baseline', {}).get('enabled', True):
+            self.baselines = BaselineModel(config.get('baseline', {}), config)
+            self.conditions.update(ANOMALY_CONDITIONS)
+        
+        # Per-(circuit, fault type) episode state
+        self.episodes = {}
+        self.timing = {}
+        for fault_type, condition in self.conditions.items():
+            fault_config = config.get(fault_type, {})
+            self.timing[fault_type] = (
+                fault_config.get('duration', condition['defaults']['duration']),
+                fault_config.get('clear_duration', condition['defaults']['clear_duration'])
+            )
+        
+        # Onset statuses as the codes found in TickFrame status arrays and anomaly codes
+        self.onset_codes = {
+            fault_type: np.array([self._status_names(condition).index(status) for status in condition['onset']])
+            for fault_type, condition in self.conditions.items()
+        }
+        
+        if database is not None and self.baselines is not None:
+            self.baselines.restore(database.load_baselines())
+    
+    @staticmethod
+    def _status_names(condition):
+        return STATUS_NAMES[condition['status_key']] if 'status_key' in condition else ANOMALY_STATUS
     
-    def check_faults(self, readings, analysis):
-        """Check for faults in readings"""
+    def check_faults(self, readings, analysis, now=None):
+        """Check for faults in readings, returning onset and resolved events"""
         faults = []
         
         if not self.config.get('enabled', True):
             return faults
         
-        for circuit_id, data in readings.items():
+        now = now or datetime.now()
+        anomalies = {}
+        if self.baselines is not None:
+            values = {name: np.array([data[name] for data in readings.values()], dtype=float)
+                      for name in BASELINE_METRICS}
+            anomalies = self.baselines.update(list(readings), values, now)
+        
+        for i, (circuit_id, data) in enumerate(readings.items()):
             circuit_analysis = analysis.get(circuit_id, {})
             
-            # Check overload
-            if circuit_analysis.get('current_status') == 'critical':
-                faults.append({
-                    'circuit_id': circuit_id,
-                    'type': 'overload',
-                    'severity': 'critical',
-                    'description': f"Current {data['current']:.2f}A exceeds safe limit",
-                    'timestamp': datetime.now(),
-                    'value': data['current']
-                })
-            
-            # Check voltage faults
-            voltage_status = circuit_analysis.get('voltage_status')
-            if voltage_status in ['critical_low', 'critical_high']:
-                faults.append({
-                    'circuit_id': circuit_id,
-                    'type': 'voltage_fault',
-                    'severity': 'critical',
-                    'description': f"Voltage {data['voltage']:.1f}V out of safe range",
-                    'timestamp': datetime.now(),
-                    'value': data['voltage']
-                })
+            for fault_type, condition in self.conditions.items():
+                if not self.config.get(fault_type, {}).get('enabled', True):
+                    continue
+                
+                if fault_type in anomalies:
+                    codes, values = anomalies[fault_type]
+                    status, value = ANOMALY_STATUS[codes[i]], float(values[i])
+                else:
+                    status = circuit_analysis.get(condition['status_key'])
+                    value = data[condition['value_key']]
+                event = self._step(circuit_id, fault_type, condition, status, value, now)
+                if event:
+                    faults.append(event)
         
         return faults
+    
+    def check_frame(self, frame, now=None):
+        """Check a TickFrame for faults; only circuits in an onset state or an open episode are stepped"""
+        if not self.config.get('enabled', True):
+            return []
+        
+        now = now or frame.tick_time or datetime.now()
+        anomalies = {}
+        if self.baselines is not None:
+            anomalies = self.baselines.update(frame.circuit_list, frame.values, now)
+        events = []
+        
+        for order, (fault_type, condition) in enumerate(self.conditions.items()):
+            if not self.config.get(fault_type, {}).get('enabled', True):
+                continue
+            
+            if fault_type in anomalies:
+                codes, values = anomalies[fault_type]
+            else:
+                codes = frame.status[condition['status_key']]
+                values = frame.values[condition['value_key']]
+            names = self._status_names(condition)
+            
+            candidates = set(np.flatnonzero(np.isin(codes, self.onset_codes[fault_type])).tolist())
+            candidates.update(frame.index[circuit_id] for circuit_id, episode_type in self.episodes
+                              if episode_type == fault_type and circuit_id in frame.index)
+            
+            for i in candidates:
+                event = self._step(frame.circuit_list[i], fault_type, condition, names[codes[i]], float(values[i]), now)
+                if event:
+                    events.append((i, order, event))
+        
+        # Same order as check_faults: by circuit, then fault type
+        events.sort(key=lambda item: item[:2])
+        return [event for _, _, event in events]
+    
+    def checkpoint(self):
+        """Save the anomaly baselines so a restart resumes without re-learning them"""
+        if self.database is not None and self.baselines is not None:
+            self.database.save_baselines(self.baselines.rows())
+    
+    def _step(self, circuit_id, fault_type, condition, status, value, now):
+        """Advance one episode state machine; returns an event or None"""
+        key = (circuit_id, fault_type)
+        episode = self.episodes.get(key)
+        onset_duration, clear_duration = self.timing[fault_type]
+        
+        if episode is None:
+            if status in condition['onset']:
+                self.episodes[key] = {
+                    'state': 'pending',
+                    'since': now,
+                    'status': status,
+                    'peak': value,
+                    'clear_since': None,
+                    'fault': None
+                }
+                episode = self.episodes[key]
+            else:
+                return None
+        
+        # Track the most extreme value of the episode
+        if episode['status'] == 'critical_low' or condition.get('peak') == 'min':
+            episode['peak'] = min(episode['peak'], value)
+        else:
+            episode['peak'] = max(episode['peak'], value)
+        
+        if episode['state'] == 'pending':
+            if status not in condition['onset']:
+                # Condition did not persist long enough to count
+                del self.episodes[key]
+                return None
+            if (now - episode['since']).total_seconds() < onset_duration:
+                return None
+            
+            episode['state'] = 'active'
+            episode['fault'] = self._onset_event(circuit_id, fault_type, condition, episode, value)
+            return episode['fault']
+        
+        # Active: clear only after the status has stayed in the clear set
+        if status in condition['clear']:
+            if episode['clear_since'] is None:
+                episode['clear_since'] = now
+            if (now - episode['clear_since']).total_seconds() >= clear_duration:
+                del self.episodes[key]
+                return self._resolved_event(circuit_id, fault_type, episode, now)
+        else:
+            episode['clear_since'] = None
+        
+        return None
+    
+    def _onset_event(self, circuit_id, fault_type, condition, episode, value):
+        """Build the event for a newly confirmed fault"""
+        return {
+            'event': 'onset',
+            'circuit_id': circuit_id,
+            'type': fault_type,
+            'severity': condition.get('severity', 'critical'),
+            'description': condition['description'].format(value=value),
+            'timestamp': episode['since'],
+            'value': value
+        }
+    
+    def _resolved_event(self, circuit_id, fault_type, episode, now):
+        """Build the event for a fault that has cleared"""
+        fault = episode['fault']
+        duration = (now - episode['since']).total_seconds()
+        
+        return {
+            'event': 'resolved',
+            'circuit_id': circuit_id,
+            'type': fault_type,
+            'severity': fault['severity'],
+            'description': f"{fault['description']} - cleared after {duration:.0f}s",
+            'timestamp': fault['timestamp'],
+            'resolved_at': now,
+            'duration': duration,
+            'peak_value': episode['peak'],
+            'fault_id': fault.get('id'),
+            'onset': fault
+        }
+    
+    def active_faults(self):
+        """Get the onset events of all faults currently active"""
+        return [e['fault'] for e in self.episodes.values() if e['state'] == 'active']
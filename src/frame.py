@@ -0,0 +1,106 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Struct-of-arrays tick frames shared by every pipeline stage"""
+
+import logging
+import math
+import numpy as np
+
+from src.analyzer import STATUS_NAMES
+
+logger = logging.getLogger(__name__)
+
+READING_FIELDS = ('voltage', 'current', 'power', 'apparent_power', 'reactive_power',
+                  'power_factor', 'displacement_power_factor', 'frequency')
+# Fields that are NaN when undefined (power factor of an idle circuit); views report them as None
+OPTIONAL_FIELDS = ('power_factor', 'displacement_power_factor')
+STATUS_FIELDS = tuple(STATUS_NAMES)
+
+
+class TickFrame:
+    """One tick's readings and analysis as preallocated per-metric arrays indexed by circuit"""
+    
+    __slots__ = ('circuit_ids', 'circuit_list', 'index', 'values', 'status', 'load_percentage',
+                 'voltage_thd', 'current_thd', 'voltage', 'current', 'raw_voltage', 'sample_rate', 'frequency',
+                 'has_waveforms', 'sequence', 'tick_time', 'started', 'refs')
+    
+    def __init__(self, circuit_ids, samples=0):
+        circuits = len(circuit_ids)
+        self.circuit_ids = np.asarray(circuit_ids)
+        self.circuit_list = [int(circuit_id) for circuit_id in circuit_ids]
+        self.index = {circuit_id: i for i, circuit_id in enumerate(self.circuit_list)}
+        
+        self.values = {name: np.zeros(circuits) for name in READING_FIELDS}
+        self.status = {name: np.zeros(circuits, dtype=np.int8) for name in STATUS_FIELDS}
+        self.load_percentage = np.zeros(circuits)
+        self.voltage_thd = np.full(circuits, np.nan)
+        self.current_thd = np.full(circuits, np.nan)
+        
+        # Synchronized waveform window (circuits x samples) when acquired in burst mode
+        self.voltage = np.zeros((circuits, samples))
+        self.current = np.zeros((circuits, samples))
+        # The voltage burst as sampled, before alignment to the current bursts (for voltage THD)
+        self.raw_voltage = np.zeros(samples)
+        self.sample_rate = 0.0
+        self.frequency = 0.0
+        self.has_waveforms = False
+        
+        self.sequence = -1
+        self.tick_time = None
+        self.started = 0.0
+        self.refs = 0
+    
+    def set_values(self, **arrays):
+        """Copy per-circuit arrays (or scalars) into the frame's reading columns"""
+        for name, values in arrays.items():
+            np.copyto(self.values[name], values)
+    
+    def set_waveforms(self, voltage, current, sample_rate, frequency, raw_voltage):
+        """Copy a waveform window in, reallocating only if its shape changed"""
+        if self.voltage.shape != voltage.shape:
+            self.voltage = np.empty_like(voltage)
+            self.current = np.empty_like(current)
+        if self.raw_voltage.shape != raw_voltage.shape:
+            self.raw_voltage = np.empty_like(raw_voltage)
+        np.copyto(self.voltage, voltage)
+        np.copyto(self.current, current)
+        np.copyto(self.raw_voltage, raw_voltage)
+        self.sample_rate = sample_rate
+        self.frequency = frequency
+        self.has_waveforms = True
+    
+    def waveforms(self):
+        """Waveform dict for the analyzer (views into the frame), or None"""
+        if not self.has_waveforms:
+            return None
+        return {'voltage': self.voltage, 'current': self.current, 'raw_voltage': self.raw_voltage,
+                'sample_rate': self.sample_rate, 'frequency': self.frequency}
+    
+    def readings_view(self):
+        """Per-circuit readings dict for the JSON API"""
+        columns = [[None if math.isnan(value) else value for value in self.values[name].tolist()]
+                   if name in OPTIONAL_FIELDS else self.values[name].tolist() for name in READING_FIELDS]
+        return {circuit_id: dict(zip(READING_FIELDS, row)) for circuit_id, row in zip(self.circuit_list, zip(*columns))}
+    
+    def analysis_view(self):
+        """Per-circuit analysis dict for the JSON API (same shape as PowerAnalyzer.status_view)"""
+        names = {name: [STATUS_NAMES[name][code] for code in self.status[name].tolist()] for name in STATUS_FIELDS}
+        load = self.load_percentage.tolist()
+        voltage_thd, current_thd = ([None if math.isnan(value) else value for value in values.tolist()]
+                                    for values in (self.voltage_thd, self.current_thd))
+        
+        analysis = {}
+        for i, circuit_id in enumerate(self.circuit_list):
+            analysis[circuit_id] = {
+                'voltage_status': names['voltage_status'][i],
+                'current_status': names['current_status'][i],
+                'power_factor_status': names['power_factor_status'][i],
+                'frequency_status': names['frequency_status'][i],
+                'load_percentage': load[i],
+                'voltage_thd': voltage_thd[i],
+                'current_thd': current_thd[i],
+                'voltage_thd_status': names['voltage_thd_status'][i],
+                'current_thd_status': names['current_thd_status'][i]
+            }
+        return analysis
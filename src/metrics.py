@@ -0,0 +1,146 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Low-overhead runtime metrics with Prometheus text exposition"""
+
+import logging
+import time
+from bisect import bisect_left
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans sub-millisecond stages up to multi-second stalls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(labels):
+    """Render a label dict as {k="v",...}"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def _format_value(value):
+    """Render a sample value the way Prometheus expects"""
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count (updated from a single thread)"""
+    
+    def __init__(self):
+        self.value = 0
+    
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """Fixed-bucket histogram: one bisect and two additions per observation"""
+    
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+    
+    def cumulative(self):
+        """(upper bound, cumulative count) pairs including +Inf"""
+        total = 0
+        pairs = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            pairs.append((bound, total))
+        return pairs
+
+
+class StageTimer:
+    """Times consecutive stages of a tick with one clock read per stage boundary"""
+    
+    def __init__(self, histograms):
+        self.histograms = histograms
+        self.started = 0.0
+        self.last = 0.0
+    
+    def start(self):
+        self.started = self.last = time.perf_counter()
+    
+    def lap(self, stage):
+        """Close the current stage and start the next"""
+        now = time.perf_counter()
+        self.histograms[stage].observe(now - self.last)
+        self.last = now
+    
+    def elapsed(self):
+        """Seconds since start()"""
+        return time.perf_counter() - self.started
+
+
+class MetricsRegistry:
+    """Named metric families rendered as Prometheus text"""
+    
+    def __init__(self, prefix='gridguard'):
+        self.prefix = prefix
+        self._families = {}  # name -> (type, help, {label tuple: metric} or callback)
+    
+    def _family(self, name, kind, help_text):
+        name = f"{self.prefix}_{name}"
+        if name not in self._families:
+            self._families[name] = (kind, help_text, {})
+        return self._families[name][2]
+    
+    def counter(self, name, help_text, **labels):
+        """Get or create a counter"""
+        series = self._family(name, 'counter', help_text)
+        key = tuple(labels.items())
+        if key not in series:
+            series[key] = Counter()
+        return series[key]
+    
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, **labels):
+        """Get or create a histogram"""
+        series = self._family(name, 'histogram', help_text)
+        key = tuple(labels.items())
+        if key not in series:
+            series[key] = Histogram(buckets)
+        return series[key]
+    
+    def gauge(self, name, help_text, callback, kind='gauge'):
+        """Register a value read at scrape time; callback returns a number or {label dict items: value}"""
+        self._families[f"{self.prefix}_{name}"] = (kind, help_text, callback)
+    
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        for name, (kind, help_text, series) in self._families.items():
+            if callable(series):
+                try:
+                    value = series()
+                except Exception as e:
+                    logger.debug(f"Metric {name} unavailable: {e}")
+                    continue
+                if value is None:
+                    continue
+                series = value if isinstance(value, dict) else {(): value}
+            
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in series.items():
+                labels = dict(key)
+                if isinstance(metric, Histogram):
+                    for bound, count in metric.cumulative():
+                        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(bound)})} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(metric.sum)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {metric.count}")
+                else:
+                    value = metric.value if isinstance(metric, Counter) else metric
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        
+        return "\n".join(lines) + "\n"
@@ -4,11 +4,68 @@
 """Power monitoring module"""
 
 import logging
-import math
+import numpy as np
+
+from src.sensors import true_rms
+from src.frame import TickFrame
 
 logger = logging.getLogger(__name__)
 
 
+def align_periodic(source_times, source_samples, target_times, frequency):
+    """Resample a periodic waveform onto another time base using its mains phase"""
+    source_phase = np.mod(source_times * frequency, 1.0)
+    target_phase = np.mod(np.asarray(target_times) * frequency, 1.0)
+    aligned = np.interp(target_phase.ravel(), source_phase, source_samples, period=1.0)
+    return aligned.reshape(target_phase.shape)
+
+
+def estimate_frequency(timestamps, samples, nominal_frequency):
+    """Estimate mains frequency from interpolated rising zero crossings"""
+    samples = samples - np.mean(samples)
+    rising = np.flatnonzero((samples[:-1] < 0) & (samples[1:] >= 0))
+    if len(rising) < 2:
+        return None
+    
+    # Linear interpolation of the crossing instant between the bracketing samples
+    s0 = samples[rising]
+    s1 = samples[rising + 1]
+    t0 = timestamps[rising]
+    crossings = t0 + (timestamps[rising + 1] - t0) * (-s0 / (s1 - s0))
+    
+    # Reject noise-induced crossings closer than half a nominal period
+    keep = np.concatenate(([True], np.diff(crossings) > 0.5 / nominal_frequency))
+    crossings = crossings[keep]
+    if len(crossings) < 2:
+        return None
+    
+    return (len(crossings) - 1) / (crossings[-1] - crossings[0])
+
+
+def compute_power(voltage, current, timestamps, frequency, min_current=0.0):
+    """Compute power metrics for a (circuits x samples) pair of V/I matrices"""
+    # Real power is the mean of instantaneous v*i over the window; its sign is the direction of flow
+    # (negative for exported power or a reversed CT), while power factor is reported as a magnitude
+    real_power = np.mean(voltage * current, axis=1)
+    current_rms = true_rms(current)
+    apparent_power = true_rms(voltage) * current_rms
+    
+    # Below min_current the ratio is noise, so idle circuits get NaN rather than a "critical" 0
+    loaded = (current_rms >= min_current) & (apparent_power > 0)
+    power_factor = np.divide(np.abs(real_power), apparent_power, out=np.full_like(real_power, np.nan), where=loaded)
+    power_factor = np.minimum(power_factor, 1.0)
+    
+    # Displacement angle between the fundamental V and I phasors (single-bin DFT)
+    basis = np.exp(-2j * np.pi * frequency * timestamps)
+    phase = np.angle(np.sum(voltage * basis, axis=1)) - np.angle(np.sum(current * basis, axis=1))
+    displacement_pf = np.where(loaded, np.abs(np.cos(phase)), np.nan)
+    
+    # Reactive power sign follows the fundamental angle (positive = inductive)
+    reactive_power = np.sign(np.sin(phase)) * np.sqrt(np.maximum(apparent_power ** 2 - real_power ** 2, 0))
+    
+    return real_power, apparent_power, reactive_power, power_factor, displacement_pf
+
+
 class PowerMonitor:
     """Real-time power monitoring"""
     
@@ -16,36 +73,98 @@ class PowerMonitor:
         self.sensors = sensors
         self.config = config
         self.nominal_voltage = config['electrical']['nominal_voltage']
+        self.nominal_frequency = config['electrical'].get('nominal_frequency', 60.0)
+        self.assumed_power_factor = config['electrical'].get('assumed_power_factor', 0.95)
+        self.pf_min_current = config['electrical'].get('pf_min_current', 0.1)
+        self.circuit_ids = [i + 1 for i in range(len(config['sensors']['current']))]
+        
+        # Zero crossings are only meaningful when the waveform is adequately sampled
+        self.frequency = self.nominal_frequency
+        self.track_frequency = sensors.sampling_rate >= 4 * self.nominal_frequency
+        if not self.track_frequency:
+            logger.warning("Sampling rate too low for frequency tracking - reporting nominal frequency")
+        
+        # Latest synchronized waveform window (circuits x samples)
+        self.last_voltage = None
+        self.last_current = None
+        self.last_timestamps = None
+        self.last_raw_voltage = None
+        self._frame = None
+    
+    def acquire_waveforms(self):
+        """Capture synchronized (circuits x samples) voltage and current matrices"""
+        # One acquisition across every ADC and bus
+        bursts = self.sensors.acquire()
+        v_times, raw = bursts[self.sensors.voltage_key]
+        volts = self.sensors.scale_voltage(raw)
+        self._update_frequency(v_times, volts)
+        
+        currents = [(c, bursts[self.sensors.channel_key(c)]) for c in self.config['sensors']['current']]
+        timestamps = np.vstack([t for _, (t, _) in currents])
+        current = np.vstack([self.sensors.scale_current(c, raw) for c, (_, raw) in currents])
+        
+        # Channels are multiplexed, so project the voltage burst onto each current burst's time base
+        voltage = align_periodic(v_times, volts, timestamps, self.frequency)
+        
+        self.last_voltage = voltage
+        self.last_current = current
+        self.last_timestamps = timestamps
+        self.last_raw_voltage = volts
+        return float(true_rms(volts)), voltage, current, timestamps
+    
+    def get_waveforms(self):
+        """Get the latest synchronized waveform window for analysis (None outside burst mode)"""
+        if self.last_current is None or self.sensors.acquisition_mode != 'burst':
+            return None
+        
+        return {
+            'voltage': self.last_voltage,
+            'current': self.last_current,
+            'raw_voltage': self.last_raw_voltage,
+            'sample_rate': self.sensors.sampling_rate,
+            'frequency': self.frequency
+        }
+    
+    def _update_frequency(self, timestamps, volts):
+        """Update the frequency estimate from the latest voltage burst"""
+        if not self.track_frequency:
+            return
+        
+        estimate = estimate_frequency(timestamps, volts, self.nominal_frequency)
+        
+        # Hold the last good estimate through implausible or missing results
+        if estimate is not None and abs(estimate - self.nominal_frequency) < 0.1 * self.nominal_frequency:
+            self.frequency = float(estimate)
+    
+    def read_frame(self, frame):
+        """Read all configured circuits into a TickFrame's arrays"""
+        if self.sensors.acquisition_mode == 'burst':
+            voltage_rms, voltage, current, timestamps = self.acquire_waveforms()
+            current_rms = true_rms(current)
+            real_power, apparent_power, reactive_power, power_factor, displacement_pf = compute_power(
+                voltage, current, timestamps, self.frequency, self.pf_min_current)
+            frame.set_waveforms(voltage, current, self.sensors.sampling_rate, self.frequency, self.last_raw_voltage)
+        else:
+            # Single instantaneous samples carry no phase information
+            voltage_rms = self.sensors.read_voltage()
+            current_rms = np.array([self.sensors.read_current(c) for c in self.config['sensors']['current']])
+            apparent_power = voltage_rms * current_rms
+            real_power = apparent_power * self.assumed_power_factor
+            reactive_power = apparent_power * np.sin(np.arccos(self.assumed_power_factor))
+            power_factor = np.where(current_rms >= self.pf_min_current, self.assumed_power_factor, np.nan)
+            displacement_pf = power_factor
+            frame.has_waveforms = False
+        
+        frame.set_values(voltage=voltage_rms, current=current_rms, power=real_power, apparent_power=apparent_power,
+                         reactive_power=reactive_power, power_factor=power_factor,
+                         displacement_power_factor=displacement_pf, frequency=self.frequency)
+        return frame
     
     def read_all_circuits(self):
-        """Read all configured circuits"""
-        readings = {}
-        
-        # Read voltage (common for all circuits)
-        voltage = self.sensors.read_voltage()
-        
-        # Read each current sensor
-        for i, current_config in enumerate(self.config['sensors']['current']):
-            circuit_id = i + 1
-            current = self.sensors.read_current(current_config)
-            
-            # Calculate power metrics
-            apparent_power = voltage * current
-            power_factor = 0.95  # Assumed (would need phase measurement for actual)
-            real_power = apparent_power * power_factor
-            reactive_power = apparent_power * math.sin(math.acos(power_factor))
-            
-            readings[circuit_id] = {
-                'voltage': voltage,
-                'current': current,
-                'power': real_power,
-                'apparent_power': apparent_power,
-                'reactive_power': reactive_power,
-                'power_factor': power_factor,
-                'frequency': 60.0  # Assumed
-            }
-        
-        return readings
+        """Read all configured circuits as a per-circuit dict"""
+        if self._frame is None:
+            self._frame = TickFrame(self.circuit_ids)
+        return self.read_frame(self._frame).readings_view()
     
     def read_circuit(self, circuit_id):
         """Read specific circuit"""
@@ -0,0 +1,144 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Pipelined tick processing: frame ring and bounded worker stages"""
+
+import logging
+import queue
+import threading
+import time
+
+from src.frame import TickFrame
+
+logger = logging.getLogger(__name__)
+
+
+class FrameRing:
+    """Single-producer ring of preallocated TickFrames, reference-counted by the stages using them"""
+    
+    def __init__(self, capacity, circuit_ids, samples):
+        self.capacity = capacity
+        self.slots = [TickFrame(circuit_ids, samples) for _ in range(capacity)]
+        self.write_sequence = 0
+        self.read_sequence = 0
+        self.frames_dropped = 0
+        self.closed = False
+        self._condition = threading.Condition()
+    
+    @property
+    def depth(self):
+        return self.write_sequence - self.read_sequence
+    
+    def _writable(self, slot):
+        return self.write_sequence - self.read_sequence < self.capacity and slot.refs == 0
+    
+    def claim(self, block=False):
+        """The next slot to fill; None if it is still in use downstream (the tick is dropped) or the ring closed"""
+        with self._condition:
+            slot = self.slots[self.write_sequence % self.capacity]
+            while not self._writable(slot):
+                if not block or self.closed:
+                    self.frames_dropped += 1
+                    if self.frames_dropped % 100 == 1:
+                        logger.warning(f"Frame ring full - {self.frames_dropped} frames dropped so far")
+                    return None
+                self._condition.wait()
+            return None if self.closed else slot
+    
+    def commit(self, tick_time, started):
+        """Publish the claimed slot; only the producer touches it between claim and commit"""
+        with self._condition:
+            slot = self.slots[self.write_sequence % self.capacity]
+            slot.sequence = self.write_sequence
+            slot.tick_time = tick_time
+            slot.started = started
+            slot.refs = 1
+            self.write_sequence += 1
+            self._condition.notify_all()
+        return slot
+    
+    def next_frame(self):
+        """Block for the oldest unconsumed frame, which arrives holding one reference; None once closed and drained"""
+        with self._condition:
+            while self.read_sequence == self.write_sequence:
+                if self.closed:
+                    return None
+                self._condition.wait()
+            frame = self.slots[self.read_sequence % self.capacity]
+            self.read_sequence += 1
+            return frame
+    
+    def retain(self, frame):
+        """Take another reference before handing the frame to a later stage"""
+        with self._condition:
+            frame.refs += 1
+    
+    def release(self, frame):
+        """Drop a reference; the slot returns to the producer when none are left"""
+        with self._condition:
+            frame.refs -= 1
+            if frame.refs == 0:
+                self._condition.notify_all()
+    
+    def close(self):
+        """Stop accepting frames; the consumer drains what is left"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+
+class Stage:
+    """Worker thread draining a bounded handoff queue"""
+    
+    _STOP = object()
+    
+    def __init__(self, name, handler, histogram=None, queue_size=16, lossless=False):
+        self.name = name
+        self.handler = handler
+        self.histogram = histogram
+        self.lossless = lossless
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.dropped = 0
+        self.failures = 0
+        self.thread = threading.Thread(target=self._run, name=f"stage-{name}", daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def offer(self, item):
+        """Hand an item to the stage; drops it if the stage is a full queue behind"""
+        if self.lossless:
+            self.queue.put(item)
+            return True
+        
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 100 == 1:
+                logger.warning(f"Stage '{self.name}' falling behind - {self.dropped} items dropped so far")
+            return False
+    
+    def stop(self):
+        """Process everything already queued, then stop"""
+        if self.thread.is_alive():
+            self.queue.put(self._STOP)
+            self.thread.join()
+    
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is self._STOP:
+                break
+            
+            start = time.perf_counter()
+            try:
+                self.handler(item)
+            except Exception as e:
+                self.failures += 1
+                logger.error(f"Stage '{self.name}' failed: {e}")
+            if self.histogram is not None:
+                self.histogram.observe(time.perf_counter() - start)
+            self.processed += 1
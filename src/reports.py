@@ -0,0 +1,174 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Usage statistics and reports built from the rollup and energy tables"""
+
+import json
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+
+class ReportGenerator:
+    """Summarizes a range of whole days without touching raw readings"""
+    
+    def __init__(self, database, config):
+        self.database = database
+        self.cost_per_kwh = config.get('energy', {}).get('cost_per_kwh', 0.12)
+        self.currency = config.get('energy', {}).get('currency', 'USD')
+        self.names = {i + 1: sensor.get('name', f"Circuit {i + 1}")
+                      for i, sensor in enumerate(config.get('sensors', {}).get('current', []))}
+    
+    def build(self, days=7, end=None):
+        """Per-circuit energy, cost, demand, voltage range and faults for the last N local days"""
+        last_day = end or datetime.now().date()
+        first_day = last_day - timedelta(days=days - 1)
+        start = first_day.isoformat()
+        stop = (last_day + timedelta(days=1)).isoformat()
+        
+        circuits = {}
+        
+        def circuit(circuit_id):
+            if circuit_id not in circuits:
+                circuits[circuit_id] = {
+                    'circuit_id': circuit_id,
+                    'name': self.names.get(circuit_id, f"Circuit {circuit_id}"),
+                    'energy_kwh': 0.0,
+                    'cost': 0.0,
+                    'peak_kwh': 0.0,
+                    'peak_power_w': None,
+                    'peak_hourly_demand_w': None,
+                    'voltage_min': None,
+                    'voltage_max': None,
+                    'samples': 0,
+                    'faults': {}
+                }
+            return circuits[circuit_id]
+        
+        conn = self.database.connect_reader()
+        try:
+            # Daily rollups give the electrical extremes; tariff-aware energy comes from energy_daily
+            # when the tracker recorded that day, otherwise from the rollup at the flat rate
+            daily = conn.execute("""
+                SELECT r.circuit_id, r.samples, r.energy_wh, r.power_max, r.voltage_min, r.voltage_max,
+                       e.energy_kwh, e.cost, e.peak_kwh
+                FROM readings_1d r
+                LEFT JOIN energy_daily e ON e.circuit_id = r.circuit_id AND e.day = substr(r.bucket, 1, 10)
+                WHERE r.bucket >= ? AND r.bucket < ?
+            """, (start, stop))
+            for row in daily:
+                entry = circuit(row['circuit_id'])
+                entry['samples'] += row['samples']
+                if row['energy_kwh'] is not None:
+                    entry['energy_kwh'] += row['energy_kwh']
+                    entry['cost'] += row['cost']
+                    entry['peak_kwh'] += row['peak_kwh'] or 0.0
+                else:
+                    kwh = row['energy_wh'] / 1000
+                    entry['energy_kwh'] += kwh
+                    entry['cost'] += kwh * self.cost_per_kwh
+                entry['peak_power_w'] = _max(entry['peak_power_w'], row['power_max'])
+                entry['voltage_min'] = _min(entry['voltage_min'], row['voltage_min'])
+                entry['voltage_max'] = _max(entry['voltage_max'], row['voltage_max'])
+            
+            hourly = conn.execute("""
+                SELECT circuit_id, MAX(power_sum / samples) AS demand
+                FROM readings_1h
+                WHERE bucket >= ? AND bucket < ?
+                GROUP BY circuit_id
+            """, (start, stop))
+            for row in hourly:
+                circuit(row['circuit_id'])['peak_hourly_demand_w'] = row['demand']
+            
+            faults = conn.execute("""
+                SELECT circuit_id, fault_type, COUNT(*) AS count
+                FROM faults
+                WHERE timestamp >= ? AND timestamp < ?
+                GROUP BY circuit_id, fault_type
+            """, (start, stop))
+            faults_by_type = {}
+            for row in faults:
+                circuit(row['circuit_id'])['faults'][row['fault_type']] = row['count']
+                faults_by_type[row['fault_type']] = faults_by_type.get(row['fault_type'], 0) + row['count']
+        finally:
+            conn.close()
+        
+        rows = [circuits[circuit_id] for circuit_id in sorted(circuits)]
+        return {
+            'generated': datetime.now().isoformat(timespec='seconds'),
+            'period': {'start': first_day.isoformat(), 'end': last_day.isoformat(), 'days': days},
+            'currency': self.currency,
+            'totals': {
+                'energy_kwh': sum(row['energy_kwh'] for row in rows),
+                'cost': sum(row['cost'] for row in rows),
+                'peak_kwh': sum(row['peak_kwh'] for row in rows),
+                'faults': sum(faults_by_type.values())
+            },
+            'faults_by_type': faults_by_type,
+            'circuits': rows
+        }
+
+
+def _min(current, value):
+    return value if current is None or (value is not None and value < current) else current
+
+
+def _max(current, value):
+    return value if current is None or (value is not None and value > current) else current
+
+
+def _fmt(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def format_stats(report):
+    """Short text summary of a report"""
+    period, totals = report['period'], report['totals']
+    lines = [
+        f"=== GridGuard-Pi5 Statistics ({period['start']} to {period['end']}) ===",
+        f"Energy: {totals['energy_kwh']:.2f} kWh ({totals['peak_kwh']:.2f} kWh peak hours)",
+        f"Cost:   {totals['cost']:.2f} {report['currency']}",
+        f"Faults: {totals['faults']}",
+        ""
+    ]
+    for row in report['circuits']:
+        lines.append(f"  {row['name']:<20} {row['energy_kwh']:10.2f} kWh  {row['cost']:9.2f} {report['currency']}  "
+                     f"{sum(row['faults'].values()):4d} faults")
+    return "\n".join(lines)
+
+
+def format_report(report):
+    """Full text report with per-circuit demand, voltage range and fault breakdown"""
+    period, totals = report['period'], report['totals']
+    lines = [
+        f"=== GridGuard-Pi5 Report: {period['days']} days ({period['start']} to {period['end']}) ===",
+        f"Generated {report['generated']}",
+        "",
+        f"{'Circuit':<20} {'kWh':>10} {'Cost':>9} {'Peak W':>9} {'Peak 1h W':>10} {'V min':>7} {'V max':>7} {'Faults':>7}"
+    ]
+    for row in report['circuits']:
+        lines.append(f"{row['name']:<20} {row['energy_kwh']:10.2f} {row['cost']:9.2f} "
+                     f"{_fmt(row['peak_power_w'], '9.0f')} {_fmt(row['peak_hourly_demand_w'], '10.0f')} "
+                     f"{_fmt(row['voltage_min'], '7.1f')} {_fmt(row['voltage_max'], '7.1f')} "
+                     f"{sum(row['faults'].values()):7d}")
+    lines += [
+        f"{'Total':<20} {totals['energy_kwh']:10.2f} {totals['cost']:9.2f}",
+        "",
+        f"Cost in {report['currency']}; {totals['peak_kwh']:.2f} kWh consumed in peak hours",
+        "",
+        "Faults by type:"
+    ]
+    if report['faults_by_type']:
+        for fault_type, count in sorted(report['faults_by_type'].items(), key=lambda item: -item[1]):
+            lines.append(f"  {fault_type:<24} {count:6d}")
+    else:
+        lines.append("  none")
+    return "\n".join(lines)
+
+
+def render(report, output_format='text', summary=False):
+    """Render a report as JSON or text"""
+    if output_format == 'json':
+        return json.dumps(report, indent=2, default=str)
+    return format_stats(report) if summary else format_report(report)
@@ -0,0 +1,105 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Drift-free tick scheduling on the monotonic clock"""
+
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+OVERRUN_POLICIES = ('skip', 'catch_up')
+
+
+class PeriodicJob:
+    """A callback run on its own cadence between ticks"""
+    
+    def __init__(self, name, interval, callback, next_due):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.next_due = next_due
+        self.runs = 0
+        self.failures = 0
+
+
+class TickScheduler:
+    """Paces ticks against absolute deadlines so timing jitter never accumulates"""
+    
+    def __init__(self, interval, overrun_policy='skip', max_catch_up=5, clock=time.monotonic, sleep=time.sleep):
+        if interval <= 0:
+            raise ValueError(f"Tick interval must be positive, got {interval}")
+        if overrun_policy not in OVERRUN_POLICIES:
+            raise ValueError(f"Unknown overrun policy '{overrun_policy}'")
+        
+        self.interval = interval
+        self.overrun_policy = overrun_policy
+        self.max_catch_up = max_catch_up
+        self.clock = clock
+        self.sleep = sleep
+        self.jobs = []
+        
+        self.origin = None
+        self.tick_index = 0
+        self.ticks_skipped = 0
+        self.late_ticks = 0
+    
+    def add_job(self, name, interval, callback):
+        """Run callback every interval seconds, first one interval from now"""
+        job = PeriodicJob(name, interval, callback, self.clock() + interval)
+        self.jobs.append(job)
+        return job
+    
+    def start(self):
+        """Anchor tick deadlines to the current instant"""
+        self.origin = self.clock()
+        self.tick_index = 0
+    
+    def deadline(self, index):
+        """Monotonic deadline of tick number index"""
+        return self.origin + index * self.interval
+    
+    def wait(self):
+        """Sleep until the next tick is due; returns the number of tick slots skipped"""
+        if self.origin is None:
+            self.start()
+        
+        skipped = 0
+        deadline = self.deadline(self.tick_index)
+        now = self.clock()
+        
+        if now < deadline:
+            self.sleep(deadline - now)
+        else:
+            # Whole slots already missed behind this one
+            behind = int((now - deadline) // self.interval)
+            if behind:
+                self.late_ticks += 1
+                if self.overrun_policy == 'skip':
+                    skipped = behind
+                else:
+                    # Run missed ticks back to back, but never more than max_catch_up of them
+                    skipped = max(0, behind - self.max_catch_up)
+                self.tick_index += skipped
+                self.ticks_skipped += skipped
+        
+        self.tick_index += 1
+        return skipped
+    
+    def run_due_jobs(self):
+        """Run every periodic job whose time has come"""
+        now = self.clock()
+        for job in self.jobs:
+            if now < job.next_due:
+                continue
+            
+            try:
+                job.callback()
+                job.runs += 1
+            except Exception as e:
+                job.failures += 1
+                logger.error(f"Periodic job '{job.name}' failed: {e}")
+            
+            # Jobs never catch up: schedule the next future multiple of the interval
+            missed = int((now - job.next_due) // job.interval)
+            job.next_due += (missed + 1) * job.interval
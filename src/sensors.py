@@ -5,55 +5,315 @@
 
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import zip_longest
 import numpy as np
 
+from src.backends import (HAS_ADC, BACKENDS, HardwareBus, SyntheticBus, AcquisitionRecorder,
+                          ReplaySource)
+
 logger = logging.getLogger(__name__)
 
-try:
-    import board
-    import busio
-    import adafruit_ads1x15.ads1115 as ADS
-    from adafruit_ads1x15.analog_in import AnalogIn
-    HAS_ADC = True
-except ImportError:
-    HAS_ADC = False
-    logger.warning("ADS1115 library not available - using simulation mode")
+
+def true_rms(samples):
+    """Compute true RMS along the last axis of a sample array"""
+    samples = np.asarray(samples, dtype=np.float64)
+    return np.sqrt(np.mean(np.square(samples), axis=-1))
+
+
+class WaveformBuffer:
+    """Preallocated ring buffer of raw ADC samples for one channel"""
+    
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.samples = np.zeros(capacity)
+        self.timestamps = np.zeros(capacity)
+        self.position = 0
+        self.count = 0
+        self.samples_per_second = 0.0
+    
+    def append(self, timestamp, value):
+        """Append a single sample"""
+        self.timestamps[self.position] = timestamp
+        self.samples[self.position] = value
+        self.position = (self.position + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+    
+    def extend(self, timestamps, values):
+        """Append a block of samples"""
+        n = len(values)
+        if n >= self.capacity:
+            self.timestamps[:] = timestamps[-self.capacity:]
+            self.samples[:] = values[-self.capacity:]
+            self.position = 0
+            self.count = self.capacity
+            return
+        
+        index = (self.position + np.arange(n)) % self.capacity
+        self.timestamps[index] = timestamps
+        self.samples[index] = values
+        self.position = (self.position + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+    
+    def latest(self, n):
+        """Return the most recent n samples as (timestamps, samples), oldest first"""
+        n = min(n, self.count)
+        index = (self.position - n + np.arange(n)) % self.capacity
+        return self.timestamps[index], self.samples[index]
+    
+    def update_rate(self, n):
+        """Record the achieved sample rate over the last n samples"""
+        timestamps, _ = self.latest(n)
+        if len(timestamps) > 1 and timestamps[-1] > timestamps[0]:
+            self.samples_per_second = float((len(timestamps) - 1) / (timestamps[-1] - timestamps[0]))
 
 
 class SensorManager:
     """Manages all sensors"""
     
-    def __init__(self, sensor_config, adc_config):
+    def __init__(self, sensor_config, adc_config, system_config=None):
         self.sensor_config = sensor_config
         self.adc_config = adc_config
-        self.simulation_mode = not HAS_ADC
+        self.simulation_mode = True
+        
+        # Burst acquisition settings
+        system_config = system_config or {}
+        self.acquisition_mode = system_config.get('acquisition', 'burst')
+        self.sampling_rate = system_config.get('sampling_rate', 860)
+        self.burst_cycles = system_config.get('burst_cycles', 4)
+        self.line_frequency = sensor_config['voltage'].get('frequency', 60)
+        self.burst_samples = max(2, int(round(self.sampling_rate * self.burst_cycles / self.line_frequency)))
+        
+        if self.sampling_rate < 2 * self.line_frequency and self.acquisition_mode == 'burst':
+            logger.warning(f"Sampling rate {self.sampling_rate} Hz is below Nyquist for "
+                           f"{self.line_frequency} Hz mains - RMS will be statistical only")
+        if self.sampling_rate < 4 * self.line_frequency and self.acquisition_mode == 'burst':
+            logger.warning(f"Sampling rate {self.sampling_rate} Hz disables frequency tracking and THD - "
+                           f"set system.sampling_rate to 860 (the ADS1115 maximum)")
         
-        if not self.simulation_mode:
+        # ADCs, optionally spread over several I2C buses
+        self.devices = adc_config.get('devices') or [
+            {'name': 'adc0', 'bus': 1, 'address': adc_config.get('i2c_address', 0x48)}
+        ]
+        self.device_bus = {d['name']: d.get('bus', 1) for d in self.devices}
+        self.default_device = self.devices[0]['name']
+        
+        self.channel_configs = {self.channel_key(c): c for c in sensor_config['current']}
+        self.voltage_key = self.channel_key(sensor_config['voltage'])
+        self.channel_configs[self.voltage_key] = sensor_config['voltage']
+        for device, _ in self.channel_configs:
+            if device not in self.device_bus:
+                raise ValueError(f"Sensor references unknown ADC device '{device}'")
+        
+        # Acquisition backend: hardware, synthetic or replay of a recording
+        self.backend = adc_config.get('backend', 'auto')
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown sensor backend '{self.backend}'")
+        self.rng = np.random.default_rng(adc_config.get('seed'))
+        self.buses = {}
+        self.replay = None
+        self.acquired_at = None
+        
+        if self.backend == 'replay':
+            self._init_replay()
+        elif self.backend != 'synthetic':
             self._init_adc()
+        if self.simulation_mode and self.replay is None:
+            self._init_simulation()
+        
+        capacity = self.burst_samples * system_config.get('buffer_bursts', 2)
+        self.buffers = {key: WaveformBuffer(capacity) for key in self.channel_configs}
+        self.bus_latency = {}
+        
+        self.recorder = None
+        if adc_config.get('record'):
+            self.recorder = AcquisitionRecorder(adc_config['record'], self.channel_configs, self.burst_samples,
+                                                self.sampling_rate, adc_config.get('record_max_frames', 3600))
+        
+        # One persistent worker per bus so buses are read concurrently
+        self.executors = {bus: ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"i2c-{bus}")
+                          for bus in self.buses}
         
-        logger.info(f"SensorManager initialized ({'simulation' if self.simulation_mode else 'hardware'})")
+        source = 'replay' if self.replay else 'simulation' if self.simulation_mode else 'hardware'
+        logger.info(f"SensorManager initialized ({source}, {self.acquisition_mode} acquisition, "
+                    f"{len(self.devices)} ADCs on {len(set(self.device_bus.values()))} buses)")
+    
+    def channel_key(self, channel_config):
+        """(device, channel) key identifying one ADC input"""
+        return (channel_config.get('device', self.default_device), channel_config['channel'])
+    
+    def _devices_by_bus(self):
+        """Group device configs by bus number"""
+        buses = {}
+        for device in self.devices:
+            buses.setdefault(device.get('bus', 1), []).append(device)
+        return buses
     
     def _init_adc(self):
         """Initialize ADC"""
+        if not HAS_ADC:
+            if self.backend == 'hardware':
+                raise RuntimeError("Hardware backend requested but the ADS1115 library is not installed")
+            return
+        
         try:
-            i2c = busio.I2C(board.SCL, board.SDA)
-            self.ads = ADS.ADS1115(i2c, address=self.adc_config['i2c_address'])
-            logger.info(f"ADS1115 initialized at 0x{self.adc_config['i2c_address']:02x}")
+            continuous = self.acquisition_mode == 'burst'
+            self.buses = {bus: HardwareBus(bus, devices, self.adc_config, continuous)
+                          for bus, devices in self._devices_by_bus().items()}
+            self.simulation_mode = False
         except Exception as e:
             logger.error(f"Failed to initialize ADC: {e}")
-            self.simulation_mode = True
+            if self.backend == 'hardware':
+                raise
+    
+    def _init_simulation(self):
+        """Create synthetic buses mirroring the configured ADC topology"""
+        v_config = self.sensor_config['voltage']
+        models = {}
+        for key, config in self.channel_configs.items():
+            if key == self.voltage_key:
+                models[key] = {'rms_range': (118, 122), 'phase': 0.0,
+                               'gain': 1 / v_config.get('divider_ratio', 1), 'offset': v_config.get('offset', 0)}
+            else:
+                models[key] = {'rms_range': (5, 15), 'phase': self.rng.uniform(0.1, 0.6),
+                               'gain': config['sensitivity'], 'offset': config['offset']}
+        
+        latency = self.adc_config.get('simulated_read_latency_ms', 0) / 1000
+        self.buses = {bus: SyntheticBus(bus, models, self.line_frequency, self.rng, latency)
+                      for bus in self._devices_by_bus()}
+    
+    def _init_replay(self):
+        """Open a recording and adopt its burst geometry"""
+        if self.acquisition_mode != 'burst':
+            raise ValueError("Replay requires burst acquisition")
+        
+        self.replay = ReplaySource(self.adc_config['replay'], self.adc_config.get('replay_speed', 1.0),
+                                   self.adc_config.get('replay_loop', False))
+        missing = set(self.channel_configs) - set(self.replay.keys)
+        if missing:
+            raise ValueError(f"Recording has no data for channels {sorted(missing)}")
+        self.sampling_rate = self.replay.sampling_rate
+        self.burst_samples = self.replay.samples
+    
+    def acquire(self, keys=None):
+        """Burst-read channels, all buses concurrently; returns {key: (timestamps, raw volts)}"""
+        full_frame = keys is None
+        keys = list(keys or self.channel_configs)
+        
+        if self.replay is not None:
+            self.acquired_at, bursts = self.replay.next_frame(keys)
+            for key, (timestamps, raw) in bursts.items():
+                self.buffers[key].extend(timestamps, raw)
+                self.buffers[key].update_rate(len(raw))
+        else:
+            self.acquired_at = time.time()
+            by_bus = {}
+            for key in keys:
+                by_bus.setdefault(self.device_bus[key[0]], []).append(key)
+            
+            futures = [self.executors[bus].submit(self._acquire_bus, bus, bus_keys)
+                       for bus, bus_keys in by_bus.items()]
+            for future in futures:
+                future.result()
+        
+        n = self.burst_samples
+        bursts = {key: self.buffers[key].latest(n) for key in keys}
+        if self.recorder is not None and full_frame:
+            self.recorder.write(self.acquired_at, bursts)
+        return bursts
+    
+    def acquisition_time(self):
+        """Wall-clock time of the latest burst acquisition (the recorded time when replaying)"""
+        if self.acquired_at is not None:
+            return datetime.fromtimestamp(self.acquired_at)
+        return datetime.now()
+    
+    def _acquire_bus(self, bus_number, keys):
+        """Read every requested channel on one bus, overlapping conversions across its devices"""
+        start = time.perf_counter()
+        bus = self.buses[bus_number]
+        
+        # Each ADS1115 converts one input at a time, so a round takes one channel per device
+        by_device = {}
+        for key in keys:
+            by_device.setdefault(key[0], []).append(key)
+        for round_keys in zip_longest(*by_device.values()):
+            self._burst(bus, [key for key in round_keys if key is not None])
+        
+        self.bus_latency[bus_number] = time.perf_counter() - start
+    
+    def _burst(self, bus, keys):
+        """Interleaved burst of one channel per device at the configured sampling rate"""
+        n = self.burst_samples
+        for key in keys:
+            bus.start_burst(key)
+        
+        if isinstance(bus, SyntheticBus) and not bus.read_latency:
+            # Zero-latency simulation: synthesize whole bursts at once
+            timestamps = bus.burst_timestamps(n, self.sampling_rate)
+            for key in keys:
+                self.buffers[key].extend(timestamps, bus.synthesize(key, timestamps))
+                self.buffers[key].update_rate(n)
+            return
+        
+        # First read switches the multiplexer and restarts continuous conversion
+        for key in keys:
+            bus.read(key)
+        
+        # While one device is being read the others keep converting
+        period = 1.0 / self.sampling_rate
+        deadline = time.perf_counter()
+        for _ in range(n):
+            remaining = deadline - time.perf_counter()
+            if remaining > 0:
+                time.sleep(remaining)
+            for key in keys:
+                self.buffers[key].append(time.perf_counter(), bus.read(key))
+            deadline += period
+        
+        for key in keys:
+            self.buffers[key].update_rate(n)
+    
+    def scale_current(self, channel_config, raw):
+        """Convert raw ADC volts to amps"""
+        return (raw - channel_config['offset']) / channel_config['sensitivity']
+    
+    def scale_voltage(self, raw):
+        """Convert raw ADC volts to mains volts"""
+        v_config = self.sensor_config['voltage']
+        return (raw - v_config.get('offset', 0)) * v_config.get('divider_ratio', 1)
+    
+    def read_current_waveform(self, channel_config):
+        """Burst-read a current channel and return (timestamps, amps)"""
+        key = self.channel_key(channel_config)
+        timestamps, raw = self.acquire([key])[key]
+        return timestamps, self.scale_current(channel_config, raw)
+    
+    def read_voltage_waveform(self):
+        """Burst-read the voltage channel and return (timestamps, volts)"""
+        timestamps, raw = self.acquire([self.voltage_key])[self.voltage_key]
+        return timestamps, self.scale_voltage(raw)
     
     def read_current(self, channel_config):
         """Read current from sensor"""
+        if self.acquisition_mode == 'burst':
+            try:
+                _, amps = self.read_current_waveform(channel_config)
+                return float(true_rms(amps))
+            except Exception as e:
+                logger.error(f"Error reading current: {e}")
+                return 0.0
+        
         if self.simulation_mode:
-            return np.random.uniform(5, 15)  # Simulated current
+            return self.rng.uniform(5, 15)  # Simulated current
         
         try:
-            chan = AnalogIn(self.ads, channel_config['channel'])
-            voltage = chan.voltage
+            key = self.channel_key(channel_config)
+            voltage = self.buses[self.device_bus[key[0]]].read(key)
             
             # Convert voltage to current
-            current = (voltage - channel_config['offset']) / channel_config['sensitivity']
+            current = self.scale_current(channel_config, voltage)
             return abs(current)
         except Exception as e:
             logger.error(f"Error reading current: {e}")
@@ -61,21 +321,49 @@ class SensorManager:
     
     def read_voltage(self):
         """Read voltage"""
+        if self.acquisition_mode == 'burst':
+            try:
+                _, volts = self.read_voltage_waveform()
+                return float(true_rms(volts))
+            except Exception as e:
+                logger.error(f"Error reading voltage: {e}")
+                return 0.0
+        
         if self.simulation_mode:
-            return np.random.uniform(118, 122)  # Simulated voltage
+            return self.rng.uniform(118, 122)  # Simulated voltage
         
         try:
-            v_config = self.sensor_config['voltage']
-            chan = AnalogIn(self.ads, v_config['channel'])
-            measured_voltage = chan.voltage
+            key = self.voltage_key
+            measured_voltage = self.buses[self.device_bus[key[0]]].read(key)
             
             # Scale to actual voltage
-            actual_voltage = (measured_voltage - v_config.get('offset', 0)) * v_config.get('divider_ratio', 1)
+            actual_voltage = self.scale_voltage(measured_voltage)
             return actual_voltage
         except Exception as e:
             logger.error(f"Error reading voltage: {e}")
             return 0.0
     
+    def read_all_rms(self):
+        """Burst-read every channel and return (voltage_rms, current_rms array)"""
+        bursts = self.acquire()
+        volts = self.scale_voltage(bursts[self.voltage_key][1])
+        currents = np.vstack([self.scale_current(c, bursts[self.channel_key(c)][1])
+                              for c in self.sensor_config['current']])
+        return float(true_rms(volts)), true_rms(currents)
+    
+    def get_sample_rates(self):
+        """Achieved samples/sec per ADC input from the last burst"""
+        return {f"{device}:{channel}": buffer.samples_per_second
+                for (device, channel), buffer in self.buffers.items()}
+    
+    def get_bus_latency(self):
+        """Seconds each I2C bus spent on its share of the last acquisition"""
+        return dict(self.bus_latency)
+    
     def cleanup(self):
         """Cleanup resources"""
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+        if self.recorder is not None:
+            self.recorder.close()
         logger.info("Sensor cleanup complete")
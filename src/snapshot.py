@@ -0,0 +1,42 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Published status snapshots"""
+
+import json
+import logging
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+
+class StatusSnapshot:
+    """Immutable view of one monitoring tick, serialized once for every reader"""
+    
+    __slots__ = ('_sequence', '_data', '_body', '_etag')
+    
+    def __init__(self, sequence, data):
+        body = json.dumps(data, default=str).encode('utf-8')
+        object.__setattr__(self, '_sequence', sequence)
+        object.__setattr__(self, '_data', MappingProxyType(data))
+        object.__setattr__(self, '_body', body)
+        object.__setattr__(self, '_etag', f"tick-{sequence}")
+    
+    def __setattr__(self, name, value):
+        raise AttributeError("StatusSnapshot is immutable")
+    
+    @property
+    def sequence(self):
+        return self._sequence
+    
+    @property
+    def data(self):
+        return self._data
+    
+    @property
+    def body(self):
+        return self._body
+    
+    @property
+    def etag(self):
+        return self._etag
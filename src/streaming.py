@@ -0,0 +1,102 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Server-Sent Events fan-out for live dashboard updates"""
+
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+def format_event(event, data, event_id=None):
+    """Encode one SSE message; data must be a single-line JSON payload"""
+    header = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{header}event: {event}\ndata: ".encode('utf-8') + data + b"\n\n"
+
+
+class ClientStream:
+    """Bounded outgoing message buffer for one connected client"""
+    
+    def __init__(self, buffer_size):
+        self.buffer_size = buffer_size
+        self.closed = False
+        self._buffer = deque()
+        self._condition = threading.Condition()
+    
+    def offer(self, message):
+        """Queue a message; returns False if the client has fallen behind"""
+        with self._condition:
+            if self.closed or len(self._buffer) >= self.buffer_size:
+                return False
+            self._buffer.append(message)
+            self._condition.notify()
+            return True
+    
+    def close(self):
+        """Stop the stream and discard anything still buffered"""
+        with self._condition:
+            self.closed = True
+            self._buffer.clear()
+            self._condition.notify()
+    
+    def messages(self, keepalive=15):
+        """Yield queued messages, with comment keepalives while idle"""
+        while True:
+            with self._condition:
+                if not self._buffer and not self.closed:
+                    self._condition.wait(keepalive)
+                if self.closed:
+                    return
+                message = self._buffer.popleft() if self._buffer else None
+            
+            yield message if message is not None else b": keepalive\n\n"
+
+
+class EventBroadcaster:
+    """Fans out each published event to every connected client"""
+    
+    def __init__(self, config):
+        self.buffer_size = config.get('stream_buffer', 16)
+        self.max_clients = config.get('max_stream_clients', 32)
+        self.keepalive = config.get('stream_keepalive', 15)
+        self.clients_evicted = 0
+        self._clients = set()
+        self._lock = threading.Lock()
+    
+    @property
+    def client_count(self):
+        return len(self._clients)
+    
+    def subscribe(self):
+        """Register a new client stream, or None if at capacity"""
+        with self._lock:
+            if len(self._clients) >= self.max_clients:
+                return None
+            client = ClientStream(self.buffer_size)
+            self._clients.add(client)
+            return client
+    
+    def unsubscribe(self, client):
+        """Remove a client stream"""
+        client.close()
+        with self._lock:
+            self._clients.discard(client)
+    
+    def publish(self, event, data, event_id=None):
+        """Serialize an event once and hand it to every client"""
+        if not self._clients:
+            return
+        
+        message = format_event(event, data, event_id)
+        with self._lock:
+            clients = list(self._clients)
+        
+        for client in clients:
+            if not client.offer(message):
+                if not client.closed:
+                    # A full buffer means the client is not keeping up: drop it
+                    self.clients_evicted += 1
+                    logger.warning("Evicted slow stream client")
+                self.unsubscribe(client)
@@ -3,9 +3,13 @@
 
 """Web dashboard and API"""
 
-from flask import Flask, render_template_string, jsonify
+from flask import Flask, Response, render_template_string, jsonify, request, stream_with_context
+from datetime import datetime, timedelta
+import json
 import logging
 
+from src.streaming import format_event
+
 logger = logging.getLogger(__name__)
 
 HTML_TEMPLATE = """
@@ -90,52 +94,102 @@ HTML_TEMPLATE = """
     </div>
     
     <script>
+        let faults = [];
+        
+        function renderFaults() {
+            const faultsHtml = faults.map(fault => `
+                <div class="fault-item">
+                    <strong>${fault.fault_type}</strong> - Circuit ${fault.circuit_id}${fault.resolved ? ' (resolved)' : ''}<br>
+                    ${fault.description}
+                </div>
+            `).join('');
+            document.getElementById('faults').innerHTML = faultsHtml || '<p>No faults detected</p>';
+        }
+        
+        function render(data) {
+            document.getElementById('status').textContent = data.status;
+            document.getElementById('last-update').textContent = new Date(data.timestamp).toLocaleTimeString();
+            
+            // Update circuits
+            const circuitsHtml = Object.entries(data.readings || {}).map(([id, reading]) => `
+                <div class="reading-item">
+                    <div class="reading-label">Circuit ${id}</div>
+                    <div class="reading-value">${reading.voltage.toFixed(1)} <span class="unit">V</span></div>
+                    <div>${reading.current.toFixed(2)} A | ${reading.power.toFixed(0)} W</div>
+                </div>
+            `).join('');
+            document.getElementById('circuits').innerHTML = circuitsHtml || '<p>No data</p>';
+            
+            // Update energy
+            if (data.energy_today) {
+                document.getElementById('energy-kwh').innerHTML = `${data.energy_today.energy_kwh.toFixed(2)} <span class="unit">kWh</span>`;
+                document.getElementById('energy-cost').textContent = `Cost: $${data.energy_today.cost.toFixed(2)}`;
+            }
+        }
+        
         async function updateDashboard() {
             try {
                 const response = await fetch('/api/status');
+                if (!response.ok) return;
                 const data = await response.json();
-                
-                document.getElementById('status').textContent = data.status;
-                document.getElementById('last-update').textContent = new Date(data.timestamp).toLocaleTimeString();
-                
-                // Update circuits
-                const circuitsHtml = Object.entries(data.readings || {}).map(([id, reading]) => `
-                    <div class="reading-item">
-                        <div class="reading-label">Circuit ${id}</div>
-                        <div class="reading-value">${reading.voltage.toFixed(1)} <span class="unit">V</span></div>
-                        <div>${reading.current.toFixed(2)} A | ${reading.power.toFixed(0)} W</div>
-                    </div>
-                `).join('');
-                document.getElementById('circuits').innerHTML = circuitsHtml || '<p>No data</p>';
-                
-                // Update energy
-                if (data.energy_today) {
-                    document.getElementById('energy-kwh').innerHTML = `${data.energy_today.energy_kwh.toFixed(2)} <span class="unit">kWh</span>`;
-                    document.getElementById('energy-cost').textContent = `Cost: $${data.energy_today.cost.toFixed(2)}`;
-                }
-                
-                // Update faults
-                const faultsHtml = (data.recent_faults || []).map(fault => `
-                    <div class="fault-item">
-                        <strong>${fault.fault_type}</strong> - Circuit ${fault.circuit_id}<br>
-                        ${fault.description}
-                    </div>
-                `).join('');
-                document.getElementById('faults').innerHTML = faultsHtml || '<p>No faults detected</p>';
-                
+                render(data);
+                faults = data.recent_faults || [];
+                renderFaults();
             } catch (error) {
                 console.error('Error:', error);
             }
         }
         
-        updateDashboard();
-        setInterval(updateDashboard, 2000);
+        if (window.EventSource) {
+            // Live push: one status event per tick, plus every fault as it is detected
+            let seeded = false;
+            const source = new EventSource('/api/stream');
+            // Faults raised while disconnected were never pushed: re-seed the list after every
+            // (re)connect, from /api/status now and from the next status event
+            source.onopen = () => {
+                seeded = false;
+                updateDashboard();
+            };
+            source.onerror = () => {
+                seeded = false;
+            };
+            source.addEventListener('status', event => {
+                const data = JSON.parse(event.data);
+                render(data);
+                if (!seeded) {
+                    faults = data.recent_faults || [];
+                    renderFaults();
+                    seeded = true;
+                }
+            });
+            source.addEventListener('fault', event => {
+                faults = [JSON.parse(event.data), ...faults].slice(0, 10);
+                renderFaults();
+            });
+            source.addEventListener('fault_resolved', event => {
+                const update = JSON.parse(event.data);
+                faults = faults.map(fault => fault.id === update.id ? {...fault, ...update} : fault);
+                renderFaults();
+            });
+        } else {
+            updateDashboard();
+            setInterval(updateDashboard, 2000);
+        }
     </script>
 </body>
 </html>
 """
 
 
+def _parse_time(value):
+    """Parse an ISO timestamp as naive local time, the form readings are stored in"""
+    parsed = datetime.fromisoformat(value)
+    # Clients such as Date.toISOString() send UTC with an offset; naive values are already local
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
 def create_app(gridguard):
     """Create Flask application"""
     app = Flask(__name__)
@@ -147,12 +201,86 @@ def create_app(gridguard):
     
     @app.route('/api/status')
     def get_status():
+        snapshot = gridguard.get_snapshot()
+        if snapshot is None:
+            return jsonify({'status': 'starting', 'timestamp': datetime.now().isoformat()}), 503
+        
+        # Serve the body serialized once by the monitor loop
+        if snapshot.etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(snapshot.body, mimetype='application/json')
+        response.set_etag(snapshot.etag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+    
+    @app.route('/api/stream')
+    def stream():
+        client = gridguard.events.subscribe()
+        if client is None:
+            return jsonify({'error': 'Too many stream clients'}), 503
+        
+        # Start every client from the latest snapshot
+        snapshot = gridguard.get_snapshot()
+        if snapshot is not None:
+            client.offer(format_event('status', snapshot.body, snapshot.sequence))
+        
+        def generate():
+            try:
+                yield from client.messages(gridguard.events.keepalive)
+            finally:
+                gridguard.events.unsubscribe(client)
+        
+        return Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    
+    @app.route('/api/history')
+    def get_history():
         try:
-            status = gridguard.get_status()
-            return jsonify(status)
-        except Exception as e:
-            logger.error(f"Error getting status: {e}")
-            return jsonify({'error': str(e)}), 500
+            circuit_id = int(request.args['circuit'])
+            end = _parse_time(request.args['to']) if 'to' in request.args else datetime.now()
+            start = _parse_time(request.args['from']) if 'from' in request.args else end - timedelta(days=1)
+        except (KeyError, ValueError) as e:
+            return jsonify({'error': f"Invalid history query: {e}"}), 400
+        
+        resolution = request.args.get('resolution') or gridguard.database.choose_resolution(start, end)
+        if resolution not in ('raw', '1m', '1h', '1d'):
+            return jsonify({'error': f"Unknown resolution: {resolution}"}), 400
+        
+        def generate():
+            # Stream row by row so long ranges never build one large list
+            yield json.dumps({'circuit': circuit_id, 'resolution': resolution,
+                              'from': start.isoformat(), 'to': end.isoformat()})[:-1]
+            yield ', "readings": ['
+            separator = ''
+            for row in gridguard.database.iter_readings(circuit_id, start, end, resolution):
+                yield separator + json.dumps(row)
+                separator = ', '
+            yield ']}'
+        
+        return Response(stream_with_context(generate()), mimetype='application/json')
+    
+    @app.route('/api/faults/<int:fault_id>/waveform')
+    def get_fault_waveform(fault_id):
+        fault = gridguard.database.get_fault(fault_id)
+        if fault is None:
+            return jsonify({'error': f"Unknown fault {fault_id}"}), 404
+        if not fault.get('waveform') or gridguard.waveform_store is None:
+            return jsonify({'error': f"No waveform was captured for fault {fault_id}"}), 404
+        
+        try:
+            points = min(max(int(request.args.get('points', 1000)), 16), 20000)
+        except ValueError as e:
+            return jsonify({'error': f"Invalid points: {e}"}), 400
+        
+        view = gridguard.waveform_store.view(fault['waveform'], points)
+        if view is None:
+            return jsonify({'error': f"Waveform for fault {fault_id} is still being recorded or has expired"}), 404
+        return jsonify({'fault_id': fault_id, **view})
+    
+    @app.route('/api/metrics')
+    def metrics():
+        return Response(gridguard.metrics.render(), mimetype='text/plain; version=0.0.4')
     
     @app.route('/api/health')
     def health():
@@ -18,7 +18,7 @@ def main():
         config = yaml.safe_load(f)
     
     # Initialize sensors
-    sensors = SensorManager(config['sensors'], config['adc'])
+    sensors = SensorManager(config['sensors'], config['adc'], config.get('system'))
     
     print("Testing sensors...")
     print("")
@@ -32,6 +32,13 @@ def main():
         current = sensors.read_current(current_config)
         print(f"Current (Channel {current_config['channel']}): {current:.3f} A")
     
+    # Report achieved burst sample rates
+    print("")
+    for channel, rate in sensors.get_sample_rates().items():
+        print(f"Channel {channel}: {rate:.1f} samples/sec")
+    for bus, latency in sorted(sensors.get_bus_latency().items()):
+        print(f"I2C bus {bus}: {latency * 1000:.1f} ms")
+    
     print("")
     print("Test complete!")
     
@@ -0,0 +1,201 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Alert delivery against a local SMTP stub"""
+
+import socketserver
+import threading
+from email import message_from_bytes
+from email.mime.text import MIMEText
+
+import pytest
+
+from src.alerts import AlertManager, SMTPSender
+
+
+class SMTPStubHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib: greeting, EHLO, envelope, DATA and QUIT"""
+    
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+    
+    def handle(self):
+        self.server.connections += 1
+        received = 0
+        self.reply('220 localhost ESMTP stub')
+        for line in iter(self.rfile.readline, b''):
+            command = line.decode().strip().upper()
+            if command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for data_line in iter(self.rfile.readline, b''):
+                    if data_line == b'.\r\n':
+                        break
+                    data.append(data_line)
+                self.server.held.set()
+                self.server.gate.wait()
+                self.server.messages.append(message_from_bytes(b''.join(data)))
+                self.reply('250 OK')
+                received += 1
+                # Simulate the server dropping an idle session without saying goodbye
+                if self.server.drop_after and received >= self.server.drop_after:
+                    return
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('250 OK')
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    """SMTP server on an ephemeral localhost port recording the messages it accepts"""
+    
+    daemon_threads = True
+    
+    def __init__(self, drop_after=None):
+        super().__init__(('127.0.0.1', 0), SMTPStubHandler)
+        self.port = self.server_address[1]
+        self.drop_after = drop_after
+        self.connections = 0
+        self.messages = []
+        # Cleared by a test to hold DATA replies, i.e. to keep the sender busy
+        self.gate = threading.Event()
+        self.gate.set()
+        # Set once a message has reached the gate
+        self.held = threading.Event()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        self.gate.set()
+        self.shutdown()
+        self.server_close()
+
+
+@pytest.fixture
+def smtp_stub():
+    servers = []
+    
+    def start(**kwargs):
+        server = SMTPStub(**kwargs)
+        servers.append(server)
+        return server
+    
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def email_config(server):
+    return {'enabled': True, 'smtp_server': '127.0.0.1', 'smtp_port': server.port, 'use_tls': False,
+            'from': 'gridguard@localhost', 'recipients': ['ops@example.com'], 'timeout': 5}
+
+
+def alert_config(server, **overrides):
+    config = {'enabled': True, 'workers': 1, 'rate_limit_s': 300, 'digest_window_s': 0.5,
+              'digest_threshold': 100, 'local': {'buzzer': False}, 'email': email_config(server)}
+    config.update(overrides)
+    return config
+
+
+def fault(circuit_id, fault_type='overload'):
+    return {'circuit_id': circuit_id, 'type': fault_type, 'severity': 'critical',
+            'description': f"{fault_type} on circuit {circuit_id}", 'timestamp': '2024-01-01T00:00:00'}
+
+
+def message(number):
+    msg = MIMEText(f"message {number}")
+    msg['From'] = 'gridguard@localhost'
+    msg['To'] = 'ops@example.com'
+    msg['Subject'] = f"test {number}"
+    return msg
+
+
+def test_sender_reuses_one_connection(smtp_stub):
+    server = smtp_stub()
+    sender = SMTPSender(email_config(server))
+    for number in range(3):
+        sender.send(message(number))
+    sender.close()
+    
+    assert [msg['Subject'] for msg in server.messages] == ['test 0', 'test 1', 'test 2']
+    assert server.connections == 1
+
+
+def test_sender_reconnects_after_drop(smtp_stub):
+    server = smtp_stub(drop_after=1)
+    sender = SMTPSender(email_config(server))
+    for number in range(3):
+        sender.send(message(number))
+    sender.close()
+    
+    assert [msg['Subject'] for msg in server.messages] == ['test 0', 'test 1', 'test 2']
+    assert server.connections == 3
+
+
+def test_sender_raises_when_server_is_gone(smtp_stub):
+    server = smtp_stub()
+    config = email_config(server)
+    server.stop()
+    
+    with pytest.raises(OSError):
+        SMTPSender(config).send(message(0))
+
+
+def test_repeated_fault_is_rate_limited(smtp_stub):
+    server = smtp_stub()
+    alerts = AlertManager(alert_config(server))
+    alerts.send_alert(fault(1))
+    alerts.send_alert(fault(1))
+    alerts.send_alert(fault(2))
+    alerts.close()
+    
+    assert alerts.alerts_queued == 2
+    assert alerts.alerts_suppressed == 1
+    assert alerts.emails_sent == 2
+    assert sorted(msg['Subject'] for msg in server.messages) == ['GridGuard Alert: overload'] * 2
+
+
+def test_fault_storm_is_sent_as_digest(smtp_stub):
+    server = smtp_stub()
+    alerts = AlertManager(alert_config(server, digest_threshold=3))
+    
+    # Hold the first delivery so the rest of the storm queues up behind it
+    server.gate.clear()
+    alerts.send_alert(fault(1))
+    assert server.held.wait(5)
+    for circuit_id in range(2, 11):
+        alerts.send_alert(fault(circuit_id))
+    server.gate.set()
+    alerts.close()
+    
+    digests = [msg for msg in server.messages if msg['Subject'].startswith('GridGuard Alert Digest')]
+    assert [msg['Subject'] for msg in digests] == ['GridGuard Alert Digest: 9 alerts']
+    assert (alerts.emails_sent, alerts.digests_sent) == (1, 1)
+    assert server.connections == 1
+
+
+def test_backlog_drained_at_once_counts_each_alert_toward_a_storm():
+    alerts = AlertManager({'enabled': True, 'workers': 0, 'digest_window_s': 0.3, 'digest_threshold': 3})
+    for circuit_id in range(1, 5):
+        alerts.queue.put(fault(circuit_id))
+    late = threading.Timer(0.05, alerts.queue.put, (fault(5),))
+    late.start()
+    
+    # Four alerts inside the window exceed the threshold, so the window is held open for more
+    batch = [alerts.queue.get()]
+    assert alerts._collect_storm(batch) is False
+    late.join()
+    assert [fault['circuit_id'] for fault in batch] == [1, 2, 3, 4, 5]
+
+
+def test_undeliverable_alert_is_counted_as_failed(smtp_stub):
+    server = smtp_stub()
+    config = alert_config(server)
+    server.stop()
+    
+    alerts = AlertManager(config)
+    alerts.send_alert(fault(1))
+    alerts.close()
+    
+    assert (alerts.emails_sent, alerts.alerts_failed) == (0, 1)
@@ -0,0 +1,124 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Per-circuit baselines: warmup, outlier clipping, drift and checkpoint restore"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from src.anomaly import ANOMALY_STATUS, BaselineModel
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+ANOMALOUS = ANOMALY_STATUS.index('anomalous')
+ELEVATED = ANOMALY_STATUS.index('elevated')
+
+
+def model(detection=None, **config):
+    return BaselineModel({'warmup_samples': 10, 'time_constant_s': 60, **config}, detection or {})
+
+
+def tick(baselines, index, currents, circuits=(1,)):
+    """One 10 s tick; returns {anomaly type: codes per circuit}"""
+    current = np.array(currents, dtype=float)
+    values = {'voltage': np.full(len(current), 120.0), 'current': current, 'power': 120.0 * current}
+    anomalies = baselines.update(list(circuits), values, START + timedelta(seconds=10 * index))
+    return {name: codes.tolist() for name, (codes, _) in anomalies.items()}
+
+
+def noisy(index, level=10.0):
+    return level + (0.1 if index % 2 else -0.1)
+
+
+def warm(baselines, ticks=20, circuits=(1,)):
+    for index in range(ticks):
+        tick(baselines, index, [noisy(index)] * len(circuits), circuits)
+    return ticks
+
+
+def test_nothing_is_flagged_during_warmup():
+    baselines = model()
+    for index in range(9):
+        codes = tick(baselines, index, [noisy(index)])
+    assert codes['current_spike'] == [0]
+    
+    # The tenth sample is still classified against a baseline of nine
+    assert tick(baselines, 9, [40.0]) == {name: [0] for name in codes}
+
+
+def test_spike_after_warmup_is_anomalous_and_moderate_deviation_elevated():
+    baselines = model()
+    index = warm(baselines)
+    mean, std = baselines.mean[1, 0], np.sqrt(baselines.var[1, 0])
+    
+    # Between clear_ratio * spike_z and spike_z deviations is the hysteresis band
+    assert tick(baselines, index, [mean + 4.5 * std])['current_spike'] == [ELEVATED]
+    assert tick(baselines, index + 1, [40.0])['current_spike'] == [ANOMALOUS]
+
+
+def test_outlier_moves_a_warm_baseline_by_at_most_spike_z_deviations():
+    baselines = model()
+    index = warm(baselines)
+    mean, std = baselines.mean[1, 0], np.sqrt(baselines.var[1, 0])
+    
+    tick(baselines, index, [1000.0])
+    assert baselines.mean[1, 0] <= mean + baselines.spike_z * std
+    assert baselines.mean[1, 0] == pytest.approx(mean, abs=1.0)
+    # The baseline still recognises ordinary readings straight after
+    assert tick(baselines, index + 1, [noisy(index + 1)])['current_spike'] == [0]
+
+
+def test_gradual_drift_is_flagged_without_spikes():
+    baselines = model({'drift': {'percent': 10}}, trend_time_constant_s=600)
+    index = warm(baselines, ticks=100, circuits=(1, 2))
+    
+    drift, spikes = [], []
+    for step in range(300):
+        codes = tick(baselines, index + step, [noisy(step, 10.0 + 0.01 * step), noisy(step)], circuits=(1, 2))
+        drift.append(codes['drift'])
+        spikes.append(codes['current_spike'])
+    
+    ramping = [codes[0] for codes in drift]
+    assert ELEVATED in ramping
+    assert ramping.index(ELEVATED) < ramping.index(ANOMALOUS)
+    assert ramping[-1] == ANOMALOUS
+    assert all(codes[1] == 0 for codes in drift)
+    assert all(codes == [0, 0] for codes in spikes)
+
+
+def test_checkpoint_rows_restore_only_fresh_baselines():
+    baselines = model(stale_after_s=86400)
+    index = warm(baselines, circuits=(1, 2))
+    rows = baselines.rows()
+    assert len(rows) == 2 * 3
+    assert {row[2] for row in rows} == {index}
+    
+    now = datetime.now()
+    stored = [dict(zip(('circuit_id', 'metric', 'samples', 'mean', 'variance', 'trend', 'reference'), row),
+                   updated_at=(now if row[0] == 1 else now - timedelta(days=2)).isoformat(sep=' '))
+              for row in rows]
+    restarted = model(stale_after_s=86400)
+    restarted.restore(stored)
+    
+    # Restored state waits for its circuit to appear, and is still checkpointed meanwhile
+    assert restarted.circuits == []
+    assert {row[0] for row in restarted.rows()} == {1}
+    
+    codes = tick(restarted, index, [40.0, 40.0], circuits=(1, 2))
+    assert restarted.count.tolist() == [index + 1, 1]
+    assert restarted.mean[1, 0] == pytest.approx(baselines.mean[1, 0], abs=1.0)
+    # The warm circuit flags the spike at once; the stale one starts over and is still warming up
+    assert codes['current_spike'] == [ANOMALOUS, 0]
+
+
+def test_restore_accepts_rows_without_updated_at_and_keeps_unbound_circuits():
+    baselines = model()
+    warm(baselines, circuits=(1,))
+    restarted = model()
+    restarted.restore([dict(zip(('circuit_id', 'metric', 'samples', 'mean', 'variance', 'trend', 'reference'), row),
+                            updated_at=None) for row in baselines.rows()])
+    
+    tick(restarted, 0, [10.0], circuits=(2,))
+    assert {row[0] for row in restarted.rows()} == {1, 2}
@@ -0,0 +1,121 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Archiving closed days of readings and reading them back"""
+
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from src.archive import ArchivePolicy, ReadingArchive
+from src.database import Database
+
+DAY = datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database({'path': str(tmp_path / 'gridguard.db'), 'batch_writes': False})
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def archive(tmp_path):
+    return ReadingArchive(tmp_path / 'archive')
+
+
+def save(database, circuit_id, seconds, current):
+    database.save_reading(circuit_id, {'voltage': 120.0, 'current': current, 'power': 120.0 * current,
+                                       'power_factor': 0.5, 'frequency': 60.0}, {},
+                          DAY + timedelta(seconds=seconds))
+
+
+def archive_pass(policy, conn):
+    """Run steps until the policy has archived and deleted everything it planned"""
+    policy.next_run = 0
+    steps = 1
+    policy.step(conn)
+    while policy.building is not None or policy.pending is not None:
+        policy.step(conn)
+        steps += 1
+    return steps
+
+
+def read_back(archive, circuit_id):
+    chunks = list(archive.read_range(circuit_id, DAY, DAY + timedelta(days=1)))
+    if not chunks:
+        return [], []
+    timestamps = np.concatenate([chunk['timestamp'] for chunk in chunks])
+    seconds = ((timestamps - np.datetime64(DAY, 'ms')) / np.timedelta64(1, 's')).tolist()
+    return seconds, np.concatenate([chunk['current'] for chunk in chunks]).tolist()
+
+
+def live_rows(database):
+    return database.conn.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+
+def test_closed_day_round_trips_through_the_archive(database, archive):
+    for seconds in (30, 10, 20):
+        save(database, 1, seconds, seconds / 10)
+    for seconds in (15, 5):
+        save(database, 2, seconds, 7.5)
+    policy = ArchivePolicy(archive, {'batch_size': 2})
+    
+    # Planning, one step per circuit, then batched deletes
+    assert archive_pass(policy, database.conn) == 1 + 2 + 3
+    assert archive.days() == [DAY.date()]
+    assert read_back(archive, 1) == ([10.0, 20.0, 30.0], [1.0, 2.0, 3.0])
+    assert read_back(archive, 2) == ([5.0, 15.0], [7.5, 7.5])
+    assert policy.rows_archived == 5
+    assert live_rows(database) == 0
+
+
+def test_late_rows_are_merged_into_an_archived_day(database, archive):
+    for seconds in (10, 30):
+        save(database, 1, seconds, seconds / 10)
+    policy = ArchivePolicy(archive, {})
+    archive_pass(policy, database.conn)
+    first_max_id = archive.manifest(DAY.date())['max_id']
+    
+    # A replay lands rows for the archived day after it was archived, interleaved in time
+    save(database, 1, 20, 2.0)
+    save(database, 1, 0, 0.5)
+    save(database, 3, 40, 4.0)
+    archive_pass(policy, database.conn)
+    
+    manifest = archive.manifest(DAY.date())
+    assert manifest['rows'] == 5
+    assert manifest['max_id'] > first_max_id
+    assert read_back(archive, 1) == ([0.0, 10.0, 20.0, 30.0], [0.5, 1.0, 2.0, 3.0])
+    assert read_back(archive, 3) == ([40.0], [4.0])
+    assert live_rows(database) == 0
+
+
+def test_today_is_never_archived(database, archive):
+    database.save_reading(1, {'voltage': 120.0, 'current': 1.0, 'power': 120.0, 'power_factor': 0.5,
+                              'frequency': 60.0}, {}, datetime.now())
+    archive_pass(ArchivePolicy(archive, {'after_days': 1}), database.conn)
+    
+    assert archive.days() == []
+    assert live_rows(database) == 1
+
+
+def test_after_days_below_one_is_rejected(archive):
+    with pytest.raises(ValueError):
+        ArchivePolicy(archive, {'after_days': 0})
+
+
+def test_step_is_skipped_while_another_process_holds_the_lock(database, archive):
+    save(database, 1, 10, 1.0)
+    policy = ArchivePolicy(archive, {})
+    lock = archive.try_lock()
+    try:
+        assert policy.step(database.conn) == 0
+        assert policy.building is None
+    finally:
+        lock.close()
+    
+    archive_pass(policy, database.conn)
+    assert read_back(archive, 1) == ([10.0], [1.0])
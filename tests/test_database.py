@@ -0,0 +1,124 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Rollup upserts, bucket boundaries and retention pruning"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database import Database, RetentionPolicy, format_timestamp
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database({'path': str(tmp_path / 'gridguard.db'), 'batch_writes': False})
+    yield database
+    database.close()
+
+
+def save(database, timestamp, power=100.0, power_factor=0.9, circuit_id=1):
+    database.save_reading(circuit_id, {'voltage': 120.0, 'current': power / 120.0, 'power': power,
+                                       'power_factor': power_factor, 'frequency': 60.0}, {}, timestamp)
+
+
+def rollup(database, resolution, circuit_id=1):
+    cursor = database.conn.execute(f"SELECT * FROM readings_{resolution} WHERE circuit_id = ? ORDER BY bucket",
+                                   (circuit_id,))
+    return [dict(row) for row in cursor]
+
+
+def test_power_factor_rollup_skips_missing_values_across_upserts(database):
+    # Each save is its own upsert; idle readings carry no power factor, first and last included
+    for seconds, power_factor in ((0, None), (10, 0.8), (20, 0.6), (30, None)):
+        save(database, START + timedelta(seconds=seconds), power_factor=power_factor)
+    
+    [row] = rollup(database, '1m')
+    assert row['samples'] == 4
+    assert row['power_factor_samples'] == 2
+    assert (row['power_factor_min'], row['power_factor_max']) == (0.6, 0.8)
+    assert row['power_factor_sum'] == pytest.approx(1.4)
+    assert row['power_factor_last'] == 0.6
+    assert (row['power_min'], row['power_max'], row['power_last']) == (100.0, 100.0, 100.0)
+
+
+def test_nan_power_factor_in_one_batch_is_treated_as_missing(database):
+    rows = [(format_timestamp(START + timedelta(seconds=seconds)), 1, 120.0, 1.0, 120.0, power_factor, 60.0)
+            for seconds, power_factor in ((0, float('nan')), (1, 0.5), (2, float('nan')))]
+    database.rollups.apply(database.conn, rows)
+    
+    [row] = rollup(database, '1h')
+    assert (row['samples'], row['power_factor_samples']) == (3, 1)
+    assert (row['power_factor_min'], row['power_factor_max'], row['power_factor_last']) == (0.5, 0.5, 0.5)
+    assert row['power_factor_sum'] == 0.5
+
+
+def test_late_reading_does_not_replace_the_last_value(database):
+    save(database, START + timedelta(seconds=30), power=200.0)
+    save(database, START + timedelta(seconds=10), power=50.0)
+    
+    [row] = rollup(database, '1m')
+    assert row['power_last'] == 200.0
+    assert row['power_min'] == 50.0
+    assert row['last_timestamp'] == format_timestamp(START + timedelta(seconds=30))
+
+
+def test_readings_fall_into_the_bucket_that_starts_at_or_before_them(database):
+    for timestamp in (datetime(2024, 1, 1, 11, 59, 59, 999000), datetime(2024, 1, 1, 12, 0),
+                      datetime(2024, 1, 1, 12, 0, 59, 999000), datetime(2024, 1, 1, 12, 1),
+                      datetime(2024, 1, 1, 23, 59, 59, 999000), datetime(2024, 1, 2, 0, 0)):
+        save(database, timestamp)
+    
+    assert [(row['bucket'], row['samples']) for row in rollup(database, '1m')] == [
+        ('2024-01-01 11:59:00', 1), ('2024-01-01 12:00:00', 2), ('2024-01-01 12:01:00', 1),
+        ('2024-01-01 23:59:00', 1), ('2024-01-02 00:00:00', 1)
+    ]
+    assert [(row['bucket'], row['samples']) for row in rollup(database, '1h')] == [
+        ('2024-01-01 11:00:00', 1), ('2024-01-01 12:00:00', 3), ('2024-01-01 23:00:00', 1),
+        ('2024-01-02 00:00:00', 1)
+    ]
+    assert [(row['bucket'], row['samples']) for row in rollup(database, '1d')] == [
+        ('2024-01-01 00:00:00', 5), ('2024-01-02 00:00:00', 1)
+    ]
+
+
+def test_energy_is_integrated_across_bucket_boundaries(database):
+    save(database, datetime(2024, 1, 1, 12, 0, 50), power=360.0)
+    save(database, datetime(2024, 1, 1, 12, 1, 10), power=360.0)
+    
+    # The 20 s trapezoid is credited to the bucket of the later reading
+    assert [row['energy_wh'] for row in rollup(database, '1m')] == [0.0, pytest.approx(2.0)]
+    assert rollup(database, '1d')[0]['energy_wh'] == pytest.approx(2.0)
+
+
+def test_retention_prunes_expired_rows_in_batches(database):
+    # Mid-minute, so rows a few seconds apart share a minute bucket
+    now = datetime.now().replace(second=30, microsecond=0)
+    for days, count in ((40, 1), (10, 3), (1, 1)):
+        for n in range(count):
+            save(database, now - timedelta(days=days, seconds=n))
+    policy = RetentionPolicy({'raw_days': 7, 'minute_days': 30, 'batch_size': 2})
+    
+    # Four raw rows and one minute bucket have expired; a full batch keeps the backlog going
+    assert policy.prune_step(database.conn) == 3
+    assert policy.prune_step(database.conn) == 2
+    assert policy.prune_step(database.conn) == 0
+    assert policy.next_run > 0
+    
+    # Once caught up it waits for the interval
+    save(database, now - timedelta(days=20))
+    assert policy.prune_step(database.conn) == 0
+    
+    raw = [row[0] for row in database.conn.execute("SELECT timestamp FROM readings ORDER BY timestamp")]
+    assert raw == [format_timestamp(now - timedelta(days=20)), format_timestamp(now - timedelta(days=1))]
+    assert len(rollup(database, '1m')) == 3
+    # Hourly and daily rollups are kept
+    assert len(rollup(database, '1h')) == 4
+
+
+def test_raw_retention_is_left_to_the_archive():
+    policy = RetentionPolicy({'raw_days': 7}, archived=True)
+    assert policy.raw_days is None
+    assert not policy.enabled
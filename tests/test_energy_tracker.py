@@ -0,0 +1,108 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Energy integration, time-of-use cost, midnight rollover and checkpoints"""
+
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+import pytest
+
+from src.database import Database
+from src.energy_tracker import EnergyTracker, TariffSchedule
+
+DAY = date(2024, 1, 1)
+
+PEAK_HOURS = [{'start': '17:00', 'end': '21:00', 'cost_multiplier': 2.0},
+              {'start': '20:00', 'end': '01:00', 'cost_multiplier': 1.5}]
+
+
+def tracker(day=DAY, **config):
+    energy = EnergyTracker({'cost_per_kwh': 0.10, 'max_gap_s': 3600, **config})
+    energy.day = day
+    return energy
+
+
+def at(hour, minute=0, second=0, day=DAY):
+    return datetime.combine(day, time(hour, minute, second))
+
+
+def feed(energy, *samples):
+    for when, power in samples:
+        energy.update({1: {'power': power}}, when)
+
+
+def test_power_is_integrated_as_trapezoids():
+    energy = tracker()
+    feed(energy, (at(10), 1000.0), (at(10, 30), 2000.0), (at(11), 2000.0))
+    
+    assert energy.get_today_total()['energy_kwh'] == pytest.approx(0.75 + 1.0)
+    assert energy.get_today_total()['cost'] == pytest.approx(0.175)
+    assert energy.get_today_total()['peak_kwh'] == 0.0
+
+
+def test_gaps_and_repeated_timestamps_are_not_integrated():
+    energy = tracker(max_gap_s=60)
+    feed(energy, (at(10), 1000.0), (at(10, 2), 1000.0), (at(10, 2), 5000.0), (at(10, 2, 30), 5000.0))
+    
+    # Only the last 30 s interval counts: 120 s is a gap and a zero-length interval adds nothing
+    assert energy.get_today_total()['energy_kwh'] == pytest.approx(5000.0 * 30 / 3600 / 1000)
+
+
+def test_interval_spanning_midnight_is_split_between_days():
+    energy = tracker()
+    feed(energy, (at(23, 30), 1000.0), (at(0, 30, day=DAY + timedelta(days=1)), 3000.0))
+    
+    # Power is interpolated to 2000 W at midnight
+    assert energy.day == DAY + timedelta(days=1)
+    assert energy.closed_days[DAY][1][0] == pytest.approx(0.75)
+    assert energy.closed_days[DAY][1][1] == pytest.approx(0.075)
+    assert energy.get_today_total()['energy_kwh'] == pytest.approx(1.25)
+
+
+def test_vectorized_rates_match_rate_for_every_minute():
+    tariff = TariffSchedule({'cost_per_kwh': 0.10, 'peak_hours': PEAK_HOURS})
+    minutes = np.arange(24 * 60)
+    expected = [tariff.rate(at(minute // 60, minute % 60)) for minute in minutes]
+    
+    assert tariff.rates(minutes).tolist() == pytest.approx(expected)
+    # The first matching window wins where windows overlap, and a window may wrap past midnight
+    assert tariff.rate(at(20, 30)) == pytest.approx(0.20)
+    assert tariff.rate(at(0, 59)) == pytest.approx(0.15)
+    assert tariff.rate(at(1, 0)) == pytest.approx(0.10)
+
+
+def test_peak_hours_are_costed_and_counted_as_peak():
+    energy = tracker(peak_hours=PEAK_HOURS)
+    feed(energy, (at(16, 30), 1000.0), (at(17), 1000.0), (at(17, 30), 1000.0))
+    
+    totals = energy.get_today_total()
+    assert totals['energy_kwh'] == pytest.approx(1.0)
+    assert totals['peak_kwh'] == pytest.approx(0.5)
+    assert totals['cost'] == pytest.approx(0.5 * 0.10 + 0.5 * 0.20)
+
+
+def test_checkpoint_writes_closed_days_and_restore_resumes_today(tmp_path):
+    database = Database({'path': str(tmp_path / 'gridguard.db'), 'batch_writes': False})
+    today = date.today()
+    yesterday = today - timedelta(days=1)
+    energy = EnergyTracker({'cost_per_kwh': 0.10}, database)
+    feed(energy, (at(23, 59, 30, day=yesterday), 1200.0), (at(0, 0, 30, day=today), 1200.0))
+    energy.checkpoint()
+    
+    half_minute = 1200.0 * 30 / 3600 / 1000
+    [closed] = database.load_energy_day(yesterday)
+    assert closed['energy_kwh'] == pytest.approx(half_minute)
+    assert energy.closed_days == {}
+    
+    # A restart picks up today's running total and keeps adding to it
+    restarted = EnergyTracker({'cost_per_kwh': 0.10}, database)
+    assert restarted.get_today_total()['energy_kwh'] == pytest.approx(half_minute)
+    feed(restarted, (at(0, 1, day=today), 1200.0), (at(0, 1, 30, day=today), 1200.0))
+    restarted.checkpoint()
+    
+    [running] = database.load_energy_day(today)
+    assert running['circuit_id'] == 1
+    assert running['energy_kwh'] == pytest.approx(2 * half_minute)
+    assert running['cost'] == pytest.approx(2 * half_minute * 0.10)
+    database.close()
@@ -0,0 +1,73 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Streaming export paging over readings inserted out of time order"""
+
+import csv
+from datetime import datetime, timedelta
+
+import pytest
+
+from src.database import Database
+from src.export import DataExporter
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database({'path': str(tmp_path / 'gridguard.db'), 'batch_writes': False})
+    yield database
+    database.close()
+
+
+def save(database, circuit_id, seconds, current):
+    database.save_reading(circuit_id, {'voltage': 120.0, 'current': current, 'power': 120.0 * current,
+                                       'power_factor': 1.0, 'frequency': 60.0}, {},
+                          START + timedelta(seconds=seconds))
+
+
+def exported(exporter, start, end, circuit_id=None):
+    return [(row[0], row[1], row[3]) for rows in exporter.iter_reading_chunks(start, end, circuit_id) for row in rows]
+
+
+def test_late_rows_with_older_timestamps_are_exported_in_time_order(database):
+    # In-order rows, then a replay that lands older readings (and one equal timestamp) afterwards
+    for seconds in (10, 20, 30, 40):
+        save(database, 1, seconds, float(seconds))
+    for seconds in (5, 15, 20, 35):
+        save(database, 2, seconds, float(seconds) + 0.5)
+    save(database, 1, -10, 99.0)
+    save(database, 1, 60, 99.0)
+    
+    exporter = DataExporter(database, chunk_size=1, page_size=2)
+    rows = exported(exporter, START, START + timedelta(seconds=60))
+    
+    assert [(row[1], row[2]) for row in rows] == [
+        (2, 5.5), (1, 10.0), (2, 15.5), (1, 20.0), (2, 20.5), (1, 30.0), (2, 35.5), (1, 40.0)
+    ]
+    assert [row[0] for row in rows] == sorted(row[0] for row in rows)
+
+
+def test_circuit_export_pages_over_its_own_rows(database):
+    for seconds in (30, 10, 20, 0):
+        save(database, 1, seconds, float(seconds))
+        save(database, 2, seconds, 50.0)
+    
+    exporter = DataExporter(database, chunk_size=1, page_size=1)
+    rows = exported(exporter, START, START + timedelta(seconds=30), circuit_id=1)
+    
+    assert [row[2] for row in rows] == [0.0, 10.0, 20.0]
+    assert {row[1] for row in rows} == {1}
+
+
+def test_csv_export_writes_every_reading_once(database, tmp_path):
+    for seconds in (20, 0, 10):
+        save(database, 1, seconds, float(seconds))
+    
+    exporter = DataExporter(database, chunk_size=1, page_size=1)
+    readings_path, _ = exporter.export(tmp_path / 'export.csv', 'csv', days=1, end=START + timedelta(hours=1))
+    
+    with open(readings_path, newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [float(row['current']) for row in rows] == [0.0, 10.0, 20.0]
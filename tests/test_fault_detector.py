@@ -0,0 +1,92 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Fault episode state machine: pending, active and resolved with hysteresis"""
+
+from datetime import datetime, timedelta
+
+from src.database import Database
+from src.fault_detector import FaultDetector
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+def detector():
+    return FaultDetector({'baseline': {'enabled': False}, 'overload': {'duration': 5, 'clear_duration': 5}})
+
+
+def step(detector, seconds, status, current=30.0):
+    """One tick of circuit 1 with the given current status"""
+    readings = {1: {'voltage': 120.0, 'current': current}}
+    analysis = {1: {'current_status': status, 'voltage_status': 'normal'}}
+    return detector.check_faults(readings, analysis, START + timedelta(seconds=seconds))
+
+
+def test_fault_opens_only_after_onset_duration():
+    faults = detector()
+    assert step(faults, 0, 'critical') == []
+    assert step(faults, 4, 'critical') == []
+    assert faults.episodes[(1, 'overload')]['state'] == 'pending'
+    
+    [event] = step(faults, 5, 'critical')
+    assert event['event'] == 'onset'
+    assert event['type'] == 'overload'
+    assert event['timestamp'] == START
+    assert faults.active_faults() == [event]
+
+
+def test_pending_episode_is_dropped_when_condition_lapses():
+    faults = detector()
+    step(faults, 0, 'critical')
+    step(faults, 3, 'warning')
+    assert faults.episodes == {}
+    
+    # The onset clock restarts with the next critical reading
+    assert step(faults, 6, 'critical') == []
+    assert step(faults, 10, 'critical') == []
+    assert step(faults, 11, 'critical')[0]['timestamp'] == START + timedelta(seconds=6)
+
+
+def test_warning_band_holds_an_active_fault_open():
+    faults = detector()
+    step(faults, 0, 'critical', current=29.0)
+    step(faults, 5, 'critical', current=31.5)
+    for seconds in range(6, 30):
+        assert step(faults, seconds, 'warning', current=25.0) == []
+    assert faults.episodes[(1, 'overload')]['state'] == 'active'
+
+
+def test_fault_resolves_after_clear_duration_with_peak_and_duration():
+    faults = detector()
+    step(faults, 0, 'critical', current=29.0)
+    step(faults, 5, 'critical', current=31.5)
+    step(faults, 10, 'normal', current=5.0)
+    
+    # Back in the warning band before clear_duration elapsed restarts the clear timer
+    step(faults, 12, 'warning', current=25.0)
+    assert step(faults, 16, 'normal', current=5.0) == []
+    assert step(faults, 20, 'normal', current=5.0) == []
+    
+    [event] = step(faults, 21, 'normal', current=5.0)
+    assert event['event'] == 'resolved'
+    assert event['duration'] == 21
+    assert event['peak_value'] == 31.5
+    assert event['resolved_at'] == START + timedelta(seconds=21)
+    assert faults.episodes == {}
+
+
+def test_faults_left_open_are_closed_at_last_reading(tmp_path):
+    database = Database({'path': str(tmp_path / 'gridguard.db'), 'batch_writes': False})
+    fault_id = database.save_fault({'timestamp': START, 'circuit_id': 1, 'type': 'overload', 'severity': 'critical',
+                                    'description': 'Current 31.50A exceeds safe limit', 'value': 31.5})
+    database.save_reading(1, {'voltage': 120.0, 'current': 31.0, 'power': 3720.0, 'power_factor': 1.0,
+                              'frequency': 60.0}, {}, START + timedelta(seconds=90))
+    
+    assert database.resolve_open_faults("closed at restart") == 1
+    row = database.get_fault(fault_id)
+    assert row['resolved'] == 1
+    assert row['duration'] == 90
+    assert row['peak_value'] == 31.5
+    assert row['description'].endswith(" - closed at restart")
+    assert database.resolve_open_faults("closed at restart") == 0
+    database.close()
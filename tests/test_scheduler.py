@@ -0,0 +1,128 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""Tick pacing, overrun policies and periodic jobs against a fake monotonic clock"""
+
+import pytest
+
+from src.scheduler import TickScheduler
+
+
+class FakeClock:
+    """Monotonic clock that only moves when the scheduler sleeps or a test does work"""
+    
+    def __init__(self, now=100.0):
+        self.now = now
+        self.sleeps = []
+    
+    def __call__(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 6))
+        self.now += seconds
+    
+    def work(self, seconds):
+        self.now += seconds
+
+
+def scheduler(clock, **kwargs):
+    return TickScheduler(1.0, clock=clock, sleep=clock.sleep, **kwargs)
+
+
+def test_ticks_sleep_to_absolute_deadlines_without_drift():
+    clock = FakeClock()
+    ticks = scheduler(clock)
+    for work in (0.3, 0.5, 0.1, 0.9):
+        assert ticks.wait() == 0
+        clock.work(work)
+    assert ticks.wait() == 0
+    
+    # The first tick runs at once; each later sleep absorbs exactly the previous tick's work
+    assert clock.sleeps == [0.7, 0.5, 0.9, 0.1]
+    assert clock.now == pytest.approx(104.0)
+    assert ticks.late_ticks == 0
+
+
+def test_skip_policy_drops_missed_slots_and_stays_on_the_grid():
+    clock = FakeClock()
+    ticks = scheduler(clock, overrun_policy='skip')
+    ticks.wait()
+    clock.work(3.5)
+    
+    # Deadline 101 was missed by 2.5 s: slots 101 and 102 are skipped and 103's tick runs now
+    assert ticks.wait() == 2
+    assert clock.sleeps == []
+    clock.work(0.1)
+    assert ticks.wait() == 0
+    assert clock.sleeps == [0.4]
+    assert clock.now == pytest.approx(104.0)
+    assert (ticks.ticks_skipped, ticks.late_ticks) == (2, 1)
+
+
+def test_catch_up_policy_runs_missed_ticks_back_to_back():
+    clock = FakeClock()
+    ticks = scheduler(clock, overrun_policy='catch_up')
+    ticks.wait()
+    clock.work(3.5)
+    
+    # Ticks for 101, 102 and 103 run at once, then pacing resumes at 104
+    assert [ticks.wait() for _ in range(3)] == [0, 0, 0]
+    assert clock.sleeps == []
+    assert ticks.wait() == 0
+    assert clock.sleeps == [0.5]
+    assert ticks.ticks_skipped == 0
+
+
+def test_catch_up_is_capped_at_max_catch_up():
+    clock = FakeClock()
+    ticks = scheduler(clock, overrun_policy='catch_up', max_catch_up=2)
+    ticks.wait()
+    clock.work(10.5)
+    
+    # Deadline 101 is nine slots behind: seven are skipped and the last two run back to back
+    assert ticks.wait() == 7
+    assert [ticks.wait() for _ in range(2)] == [0, 0]
+    assert clock.sleeps == []
+    ticks.wait()
+    assert clock.sleeps == [0.5]
+    assert ticks.ticks_skipped == 7
+
+
+def test_invalid_configuration_is_rejected():
+    with pytest.raises(ValueError):
+        TickScheduler(0)
+    with pytest.raises(ValueError):
+        TickScheduler(1.0, overrun_policy='burst')
+
+
+def test_jobs_run_on_their_own_cadence_without_catching_up():
+    clock = FakeClock(now=0.0)
+    ticks = scheduler(clock)
+    runs = []
+    job = ticks.add_job('checkpoint', 10, lambda: runs.append(clock.now))
+    
+    for now in (5, 10, 15, 45, 49, 50):
+        clock.now = now
+        ticks.run_due_jobs()
+    
+    # 20, 30 and 40 were all missed by the time of the 45 s tick: one run, next due at 50
+    assert runs == [10, 45, 50]
+    assert job.runs == 3
+    assert job.next_due == 60
+
+
+def test_failing_job_is_counted_and_rescheduled():
+    clock = FakeClock(now=0.0)
+    ticks = scheduler(clock)
+    
+    def fail():
+        raise RuntimeError("disk full")
+    
+    job = ticks.add_job('broken', 5, fail)
+    other = ticks.add_job('healthy', 5, lambda: None)
+    clock.now = 5
+    ticks.run_due_jobs()
+    
+    assert (job.runs, job.failures, job.next_due) == (0, 1, 10)
+    assert (other.runs, other.failures) == (1, 0)
@@ -0,0 +1,54 @@
+# Copyright 2024 GridGuard-Pi5 Contributors
+# Licensed under the Apache License, Version 2.0
+
+"""History API time-range parsing"""
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from src.database import Database
+from src.web_app import create_app
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database({'path': str(tmp_path / 'gridguard.db'), 'batch_writes': False})
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def client(database):
+    return create_app(SimpleNamespace(database=database)).test_client()
+
+
+def utc(local):
+    """A naive local time as a UTC string the way Date.toISOString() writes it"""
+    return local.astimezone(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def test_history_accepts_utc_offsets(database, client):
+    reading = datetime.now().replace(microsecond=0) - timedelta(minutes=30)
+    database.save_reading(1, {'voltage': 120.0, 'current': 2.0, 'power': 240.0, 'power_factor': 1.0,
+                              'frequency': 60.0}, {}, reading)
+    
+    response = client.get('/api/history', query_string={
+        'circuit': 1, 'from': utc(reading - timedelta(minutes=1)), 'to': utc(reading + timedelta(minutes=1))})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['from'] == (reading - timedelta(minutes=1)).isoformat()
+    assert [row['power'] for row in body['readings']] == [240.0]
+
+
+def test_history_mixes_an_offset_start_with_the_default_end(client):
+    response = client.get('/api/history', query_string={
+        'circuit': 1, 'from': utc(datetime.now() - timedelta(hours=1))})
+    assert response.status_code == 200
+    assert response.get_json()['resolution'] == 'raw'
+
+
+def test_history_rejects_unparseable_times(client):
+    response = client.get('/api/history', query_string={'circuit': 1, 'from': 'yesterday'})
+    assert response.status_code == 400